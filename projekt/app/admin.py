@@ -0,0 +1,175 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .metrics import ClientMetrics, format_stats
+
+END_SENT = "sent"
+END_NO_SESSION = "no-session"
+END_UNKNOWN = "unknown"
+
+# `kick idle` without an argument kicks clients silent for this many seconds.
+DEFAULT_IDLE_KICK = 60.0
+
+HELP_TEXT = (
+    "Commands:\n"
+    "  list                 - show connected clients\n"
+    "  end <id>              - send encrypted EndSession to client\n"
+    "  end all               - send EndSession to every client with a session\n"
+    "  kick <id>             - close TCP connection\n"
+    "  kick idle [seconds]   - close clients silent that long (default 60)\n"
+    "  broadcast <text>      - send encrypted DATA to every client with a session\n"
+    "  cache                 - show session cache, DH group, admission and idle reaping stats\n"
+    "  stats [id]            - traffic counters and latencies (global or per client)\n"
+    "  quit                  - stop server\n"
+)
+
+
+@dataclass
+class ClientInfo:
+    client_id: int
+    addr: Tuple[str, int]
+    session: bool
+
+
+class AdminTarget(ABC):
+    """Operations behind the server console.
+
+    Implemented by both server engines and by the multi-process supervisor;
+    every method must be safe to call from the console thread. Abstract, so
+    an engine missing one fails when it is constructed, not mid-command.
+    """
+
+    @abstractmethod
+    def list_clients(self) -> List[ClientInfo]:
+        ...
+
+    @abstractmethod
+    def end_client_session(self, client_id: int) -> str:
+        ...
+
+    @abstractmethod
+    def kick_client(self, client_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def end_all_sessions(self) -> int:
+        """Send END_SESSION to every client with a session; returns how many were sent."""
+
+    @abstractmethod
+    def kick_idle(self, idle_for: float) -> int:
+        """Drop clients with no frame for `idle_for` seconds; returns how many."""
+
+    @abstractmethod
+    def broadcast(self, text: str) -> int:
+        """Queue an encrypted DATA message to every client with a session; returns how many."""
+
+    @abstractmethod
+    def stats_totals(self) -> ClientMetrics:
+        ...
+
+    @abstractmethod
+    def client_stats(self, client_id: int) -> Optional[ClientMetrics]:
+        ...
+
+    @abstractmethod
+    def cache_report(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def stop(self) -> None:
+        ...
+
+
+def _parse_id(parts: List[str]) -> Optional[int]:
+    try:
+        return int(parts[1])
+    except ValueError:
+        print("[server] invalid id")
+        return None
+
+
+def run_admin_loop(target: AdminTarget) -> None:
+    print(HELP_TEXT)
+
+    while True:
+        try:
+            line = input("server> ").strip()
+        except EOFError:
+            line = "quit"
+
+        if not line:
+            continue
+
+        parts = line.split()
+        cmd = parts[0].lower()
+
+        if cmd == "broadcast" and len(parts) >= 2:
+            sent = target.broadcast(line.split(maxsplit=1)[1])
+            print(f"[server] DATA queued for {sent} client(s)")
+
+        elif cmd == "end" and parts[1:] == ["all"]:
+            print(f"[server] END_SESSION sent to {target.end_all_sessions()} client(s)")
+
+        elif cmd == "kick" and len(parts) in (2, 3) and parts[1] == "idle":
+            try:
+                idle_for = float(parts[2]) if len(parts) == 3 else DEFAULT_IDLE_KICK
+            except ValueError:
+                print("[server] invalid number of seconds")
+                continue
+            print(f"[server] kicked {target.kick_idle(idle_for)} idle client(s)")
+
+        elif cmd == "list":
+            clients = target.list_clients()
+            if not clients:
+                print("[server] no clients")
+                continue
+            for c in clients:
+                session = "ON" if c.session else "OFF"
+                print(f"  client#{c.client_id} {c.addr[0]}:{c.addr[1]} session={session}")
+
+        elif cmd == "end" and len(parts) == 2:
+            cid = _parse_id(parts)
+            if cid is None:
+                continue
+            try:
+                status = target.end_client_session(cid)
+            except Exception as e:
+                print(f"[server] failed to send EndSession: {e}")
+                continue
+            if status == END_UNKNOWN:
+                print("[server] no such client")
+            elif status == END_NO_SESSION:
+                print(f"[server] client#{cid} has no active session")
+            else:
+                print(f"[server] END_SESSION sent to client#{cid} - session reset")
+
+        elif cmd == "kick" and len(parts) == 2:
+            cid = _parse_id(parts)
+            if cid is not None:
+                target.kick_client(cid)
+
+        elif cmd == "cache":
+            for report_line in target.cache_report():
+                print(report_line)
+
+        elif cmd == "stats" and len(parts) <= 2:
+            if len(parts) == 1:
+                print("[server] totals: " + format_stats(target.stats_totals()))
+                continue
+            cid = _parse_id(parts)
+            if cid is None:
+                continue
+            cm = target.client_stats(cid)
+            if cm is None:
+                print("[server] no such client")
+            else:
+                print(f"[server] client#{cid}: " + format_stats(cm))
+
+        elif cmd == "quit":
+            print("[server] stopping...")
+            target.stop()
+            break
+
+        else:
+            print(HELP_TEXT)
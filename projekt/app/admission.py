@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+# How often a queued connection re-checks for a free slot. Slots freed in the
+# same process are usually picked up on the next check; with SharedAdmission
+# they may be freed by another worker, which cannot wake us directly.
+POLL_INTERVAL = 0.02
+
+
+class Admission:
+    """Counts occupied client slots and hands out client ids.
+
+    When all `limit` slots are taken, up to `queue_size` connections may wait
+    in FIFO order (see `acquire`) instead of being refused outright.
+    """
+
+    def __init__(self, limit: int, queue_size: int = 0):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._count = 0
+        self._next_id = 1
+        self._init_queue(queue_size)
+
+    def _init_queue(self, queue_size: int) -> None:
+        self.queue_size = queue_size
+        self.admitted_after_wait = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: Deque[object] = deque()
+        self._wait_lock = threading.Lock()
+
+    def try_acquire(self) -> Optional[int]:
+        """Take a slot; returns the new client id, or None when full."""
+        with self._lock:
+            if self._count >= self.limit:
+                return None
+            self._count += 1
+            cid = self._next_id
+            self._next_id += 1
+            return cid
+
+    def release(self) -> None:
+        with self._lock:
+            self._count -= 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, timeout: float) -> Optional[int]:
+        """Take a slot, waiting in line up to `timeout` seconds when full.
+
+        Returns None at once when the wait queue is full, or after the timeout.
+        """
+        cid, token = self._enter()
+        if token is None:
+            return cid
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                cid = self._try_head(token)
+                if cid is not None or time.monotonic() >= deadline:
+                    break
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self._leave(token, cid)
+        return cid
+
+    async def acquire_async(self, timeout: float) -> Optional[int]:
+        """Event-loop variant of `acquire`; shares the same FIFO."""
+        cid, token = self._enter()
+        if token is None:
+            return cid
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                cid = self._try_head(token)
+                if cid is not None or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            self._leave(token, cid)
+        return cid
+
+    def _enter(self):
+        # Returns (cid, None) when decided right away, else (None, queue token).
+        with self._wait_lock:
+            if not self._waiters:
+                cid = self.try_acquire()
+                if cid is not None:
+                    return cid, None
+            if len(self._waiters) >= self.queue_size:
+                self.rejected += 1
+                return None, None
+            token = object()
+            self._waiters.append(token)
+            return None, token
+
+    def _try_head(self, token: object) -> Optional[int]:
+        with self._wait_lock:
+            if self._waiters[0] is not token:
+                return None
+            return self.try_acquire()
+
+    def _leave(self, token: object, cid: Optional[int]) -> None:
+        with self._wait_lock:
+            self._waiters.remove(token)
+            if cid is None:
+                self.timed_out += 1
+            else:
+                self.admitted_after_wait += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": self.count,
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "admitted_after_wait": self.admitted_after_wait,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+        }
+
+    def report(self) -> List[str]:
+        return ["[server] admission: " + " ".join(f"{k}={v}" for k, v in self.stats().items())]
+
+
+class SharedAdmission(Admission):
+    """Admission shared by worker processes, so max_clients and ids stay global.
+
+    Slots and ids live in shared memory; the wait queue and its counters are
+    per process, so each worker queues up to `queue_size` connections.
+    """
+
+    def __init__(self, limit: int, ctx, queue_size: int = 0):
+        self.limit = limit
+        self._lock = ctx.Lock()
+        self._count_value = ctx.RawValue("i", 0)
+        self._next_id_value = ctx.RawValue("q", 1)
+        self._init_queue(queue_size)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_waiters"], state["_wait_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_queue(self.queue_size)
+
+    def try_acquire(self) -> Optional[int]:
+        with self._lock:
+            if self._count_value.value >= self.limit:
+                return None
+            self._count_value.value += 1
+            cid = self._next_id_value.value
+            self._next_id_value.value += 1
+            return cid
+
+    def release(self) -> None:
+        with self._lock:
+            self._count_value.value -= 1
+
+    @property
+    def count(self) -> int:
+        return self._count_value.value
@@ -0,0 +1,524 @@
+import asyncio
+import os
+import resource
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .admin import END_NO_SESSION, END_SENT, END_UNKNOWN, AdminTarget, ClientInfo, run_admin_loop
+from .admission import Admission
+from .dh_params import group_cache_info
+from .handshake import HandshakeResult, server_handshake
+from .handshake_pool import HandshakePool
+from .metrics import ClientMetrics, ServerMetrics, serve_metrics
+from .outbox import DEFAULT_OUTBOX_BYTES
+from .protocol import encode_frame, make_secure, recv_frame_async
+from .secure_channel import MacError, SecureChannel
+from .session_cache import SessionCache
+from .streams import DEFAULT_STREAM, StreamMux, make_close_stream, stream_id
+from .workers import serve_control
+
+
+@dataclass
+class AsyncClientState:
+    client_id: int
+    addr: Tuple[str, int]
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    channel: Optional[SecureChannel] = None
+    dh_p: Optional[int] = None
+    task: Optional["asyncio.Task[None]"] = None
+    metrics: ClientMetrics = field(default_factory=ClientMetrics)
+    last_active: float = field(default_factory=time.monotonic)
+    streams: StreamMux = field(default_factory=StreamMux)
+    # Serves the mux one round at a time while the reader keeps reading (_dispatch_loop).
+    dispatcher: Optional["asyncio.Task[None]"] = None
+    dropped: bool = False
+
+
+def _raise_nofile_limit() -> None:
+    # Every idle session holds one descriptor; the default soft limit
+    # (often 1024) is far below what a single event loop can serve.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+class AsyncMiniTLSServer(AdminTarget):
+    """Single event-loop variant of MiniTLSServer: one coroutine per client.
+
+    Console operations arrive from another thread and are marshalled onto the
+    loop with run_coroutine_threadsafe.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_clients: int,
+        use_mac: bool = True,
+        binary_records: bool = True,
+        session_cache_size: int = 10_000,
+        session_ttl: float = 3600.0,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+        metrics_per_client: bool = False,
+        backlog: int = 4096,
+        admission: Optional[Admission] = None,
+        reuse_port: bool = False,
+        stream_dir: Optional[str] = None,
+        handshake_workers: int = 0,
+        handshake_queue: int = 64,
+        handshake_retry_after: float = 0.5,
+        admission_queue: int = 0,
+        admission_timeout: float = 5.0,
+        idle_timeout: float = 0.0,
+        idle_end_session: bool = False,
+        outbox_bytes: int = DEFAULT_OUTBOX_BYTES,
+    ):
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.use_mac = use_mac
+        self.binary_records = binary_records
+        self.session_cache: Optional[SessionCache] = (
+            SessionCache(session_cache_size, session_ttl) if session_cache_size > 0 else None
+        )
+        self.handshake_pool: Optional[HandshakePool] = (
+            HandshakePool(handshake_workers, handshake_queue, handshake_retry_after) if handshake_workers > 0 else None
+        )
+        self.metrics = ServerMetrics(per_client_export=metrics_per_client, handshake_pool=self.handshake_pool)
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.backlog = backlog
+        self.admission = admission if admission is not None else Admission(max_clients, admission_queue)
+        self.admission_timeout = admission_timeout
+        self.idle_timeout = idle_timeout
+        self.idle_end_session = idle_end_session
+        self.reaped = 0
+        self.outbox_bytes = outbox_bytes
+        self.reuse_port = reuse_port
+        self.stream_dir = stream_dir
+        if stream_dir is not None:
+            os.makedirs(stream_dir, exist_ok=True)
+
+        self._clients: Dict[int, AsyncClientState] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready = threading.Event()
+
+    def start(self) -> None:
+        asyncio.run(self._main(console=True))
+
+    def run_worker(self, conn) -> None:
+        """Serve as one worker of a ShardedServer, taking console commands from `conn`."""
+        threading.Thread(target=self._serve_control_when_ready, args=(conn,), daemon=True).start()
+        asyncio.run(self._main(console=False))
+
+    def _serve_control_when_ready(self, conn) -> None:
+        self._ready.wait()
+        serve_control(self, conn)
+
+    async def _main(self, console: bool) -> None:
+        _raise_nofile_limit()
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._server = await asyncio.start_server(
+            self._handle_client,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_address=True,
+            reuse_port=self.reuse_port or None,
+        )
+        print(f"[server] listening on {self.host}:{self.port} (max_clients={self.max_clients}, engine=asyncio)")
+        if self.metrics_port is not None:
+            serve_metrics(self.metrics, self.metrics_host, self.metrics_port)
+            print(f"[server] metrics on http://{self.metrics_host}:{self.metrics_port}/metrics")
+        reaper = asyncio.ensure_future(self._reap_loop()) if self.idle_timeout > 0 else None
+
+        self._ready.set()
+        if console:
+            # The console blocks on input(); keep it off the loop.
+            admin = asyncio.ensure_future(asyncio.to_thread(run_admin_loop, self))
+            await self._stopped.wait()
+            admin.cancel()
+        else:
+            await self._stopped.wait()
+        if reaper is not None:
+            reaper.cancel()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        cid = await self.admission.acquire_async(self.admission_timeout)
+        if cid is None:
+            # no slot (queue full or wait timed out): refuse
+            writer.close()
+            return
+
+        addr = writer.get_extra_info("peername")
+        state = AsyncClientState(
+            client_id=cid,
+            addr=addr,
+            reader=reader,
+            writer=writer,
+            task=asyncio.current_task(),
+            metrics=self.metrics.register(cid),
+        )
+        self._clients[cid] = state
+        print(f"[server] client#{cid} connected from {addr[0]}:{addr[1]}")
+
+        try:
+            await self._client_loop(state)
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            # _drop_client (kick, reaping, slow consumer, stop) already cleaned
+            # up and cancelled us on purpose: end normally. Any other
+            # cancellation - an outer wait_for, loop teardown - propagates.
+            if not state.dropped:
+                raise
+            asyncio.current_task().uncancel()
+        except ValueError as e:
+            print(f"[server] client#{cid} protocol error: {e}")
+        finally:
+            self._drop_client(cid)
+
+    async def _client_loop(self, state: AsyncClientState) -> None:
+        m = state.metrics
+        while True:
+            msg, size = await recv_frame_async(state.reader)
+            m.frames_in += 1
+            m.bytes_in += size
+            state.last_active = time.monotonic()
+            started = time.perf_counter()
+            mtype = msg.get("type")
+
+            if mtype == "HEARTBEAT":
+                # Keep-alive only: refreshes last_active, no reply.
+                m.heartbeats += 1
+                continue
+
+            if state.channel is None:
+                # Expect ClientHello plaintext
+                if mtype != "CLIENT_HELLO":
+                    print(f"[server] client#{state.client_id} unexpected plaintext type={mtype}; closing")
+                    return
+
+                options = dict(
+                    client_id=state.client_id,
+                    use_mac=self.use_mac,
+                    allow_binary=self.binary_records,
+                    session_cache=self.session_cache,
+                )
+                # Either way the modexp (and group validation) runs off the loop,
+                # which keeps serving other clients meanwhile.
+                if self.handshake_pool is not None:
+                    hs = await self.handshake_pool.handshake_async(msg, **options)
+                else:
+                    hs = await asyncio.to_thread(server_handshake, msg, **options)
+                state.channel = hs.channel
+                state.dh_p = hs.p if hs.channel is not None else None
+                state.streams.reset()
+                self._send(state, hs.reply)
+                m.handshakes_busy += hs.busy
+                if hs.channel is not None:
+                    m.handshakes += 1
+                    m.resumed += hs.resumed
+                    m.handshake_latency.observe(time.perf_counter() - started)
+                self._log_handshake(state, hs)
+                continue
+
+            # After handshake: everything must be SECURE
+            if mtype != "SECURE":
+                print(f"[server] client#{state.client_id} non-secure message after handshake; ignoring")
+                continue
+
+            ciphertext = msg.get("ciphertext")
+            mac = msg.get("mac")
+            if not isinstance(ciphertext, (str, bytes)):
+                print(f"[server] client#{state.client_id} malformed secure message")
+                continue
+
+            try:
+                inner = state.channel.open(ciphertext, mac if isinstance(mac, (str, bytes)) else None)
+            except Exception as e:
+                if isinstance(e, MacError):
+                    m.mac_failures += 1
+                else:
+                    m.open_failures += 1
+                print(f"[server] client#{state.client_id} secure open failed: {e}")
+                continue
+
+            inner_type = inner.get("type")
+            if inner_type in ("DATA", "CLOSE_STREAM"):
+                self._queue_stream(state, inner)
+                if state.streams.backlogged:
+                    self._dispatch_streams(state)
+                elif state.dispatcher is None and state.streams.queued:
+                    state.dispatcher = asyncio.ensure_future(self._dispatch_loop(state))
+                m.message_latency.observe(time.perf_counter() - started)
+                continue
+            # Anything else acts on the whole connection: let queued stream messages go first.
+            self._dispatch_streams(state)
+            if inner_type == "END_SESSION":
+                print(f"[server] client#{state.client_id} END_SESSION received -> session reset")
+                state.channel = None
+                state.dh_p = None
+                state.streams.reset()
+            elif inner_type == "STREAM_BEGIN":
+                await self._receive_stream(state)
+            else:
+                print(f"[server] client#{state.client_id} unknown inner type: {inner_type}")
+            m.message_latency.observe(time.perf_counter() - started)
+
+    def _queue_stream(self, state: AsyncClientState, inner: Dict[str, Any]) -> None:
+        sid = stream_id(inner)
+        if sid is None:
+            print(f"[server] client#{state.client_id} invalid stream id {inner.get('sid')!r}; ignoring")
+        elif not state.streams.push(sid, inner):
+            print(f"[server] client#{state.client_id} stream {sid} refused: {len(state.streams)} streams open")
+            self._send_inner(state, make_close_stream(sid, refused=True))
+
+    async def _dispatch_loop(self, state: AsyncClientState) -> None:
+        # Frames already buffered are read (and queued) before this task first
+        # runs; between rounds it yields, so frames arriving meanwhile join the rotation.
+        try:
+            while state.streams.queued and state.channel is not None and not state.dropped:
+                self._dispatch_streams(state, rounds=1)
+                await asyncio.sleep(0)
+        finally:
+            state.dispatcher = None
+
+    def _dispatch_streams(self, state: AsyncClientState, rounds: Optional[int] = None) -> None:
+        for stream, inner in state.streams.drain(rounds):
+            if inner.get("type") == "CLOSE_STREAM":
+                print(
+                    f"[server] client#{state.client_id} stream {stream.sid} closed "
+                    f"({stream.messages} messages, {stream.bytes} bytes)"
+                )
+                self._send_inner(state, make_close_stream(stream.sid))
+            elif stream.sid == DEFAULT_STREAM:
+                print(f"[server] client#{state.client_id} DATA: {inner.get('text')}")
+            else:
+                print(f"[server] client#{state.client_id} stream {stream.sid} DATA: {inner.get('text')}")
+
+    def _send_inner(self, state: AsyncClientState, inner: Dict[str, Any]) -> bool:
+        channel = state.channel
+        if channel is None:
+            # The console or idle reaping ended the session while this reply was queued.
+            return False
+        ciphertext, mac = channel.seal(inner)
+        return self._send(state, make_secure(ciphertext, mac))
+
+    async def _receive_stream(self, state: AsyncClientState) -> None:
+        # Same framing as SecureChannel.iter_stream, driven by awaited reads.
+        m = state.metrics
+        opener = state.channel.stream_opener()
+        path = None
+        sink = None
+        if self.stream_dir is not None:
+            # File I/O goes through worker threads so a slow disk cannot stall the loop.
+            path = os.path.join(self.stream_dir, f"client_{state.client_id}_{time.time_ns()}.bin")
+            sink = await asyncio.to_thread(open, path, "wb")
+        try:
+            while True:
+                msg, size = await recv_frame_async(state.reader)
+                m.frames_in += 1
+                m.bytes_in += size
+                state.last_active = time.monotonic()
+                mtype = msg.get("type")
+                if mtype == "HEARTBEAT":
+                    m.heartbeats += 1
+                    continue
+                ciphertext = msg.get("ciphertext")
+                if not isinstance(ciphertext, (str, bytes)):
+                    raise ValueError(f"unexpected {mtype} frame inside a stream")
+                if mtype == "STREAM_CHUNK":
+                    chunk = opener.open_chunk(ciphertext)
+                    if sink is not None:
+                        await asyncio.to_thread(sink.write, chunk)
+                elif mtype == "SECURE":
+                    mac = msg.get("mac")
+                    opener.finish(state.channel.open(ciphertext, mac if isinstance(mac, (str, bytes)) else None))
+                    break
+                else:
+                    raise ValueError(f"unexpected {mtype} frame inside a stream")
+        except MacError as e:
+            m.mac_failures += 1
+            print(f"[server] client#{state.client_id} stream rejected after {opener.length} bytes: {e}")
+            if path is not None:
+                await asyncio.to_thread(sink.close)
+                await asyncio.to_thread(os.remove, path)
+            return
+        finally:
+            if sink is not None:
+                # Also reached on cancellation, where awaiting is no longer safe.
+                sink.close()
+        saved = f" -> {path}" if path is not None else ""
+        print(f"[server] client#{state.client_id} STREAM received {opener.length} bytes{saved}")
+
+    def _log_handshake(self, state: AsyncClientState, hs: HandshakeResult) -> None:
+        if hs.busy:
+            print(f"[server] client#{state.client_id} handshake queue full -> asked to retry later")
+        elif hs.channel is None:
+            print(f"[server] client#{state.client_id} unknown session ticket -> full handshake required")
+        elif hs.resumed:
+            print(f"[server] client#{state.client_id} session resumed (p={hs.p}, format={hs.fmt})")
+        else:
+            print(f"[server] client#{state.client_id} handshake complete (p={hs.p}, format={hs.fmt})")
+
+    def _send(self, state: AsyncClientState, obj: Dict[str, Any]) -> bool:
+        """Hand a frame to the transport without waiting for it to drain.
+
+        The transport's write buffer is the client's outbound queue: a client
+        that lets it grow past `outbox_bytes` is dropped as a slow consumer.
+        Returns False when the frame was not queued.
+        """
+        if state.writer.is_closing():
+            return False
+        data = encode_frame(obj)
+        if state.writer.transport.get_write_buffer_size() + len(data) > self.outbox_bytes:
+            state.metrics.slow_consumer_drops += 1
+            print(f"[server] client#{state.client_id} outbound queue full -> slow consumer dropped")
+            self._drop_client(state.client_id)
+            return False
+        state.writer.write(data)
+        state.metrics.frames_out += 1
+        state.metrics.bytes_out += len(data)
+        return True
+
+    def _drop_client(self, client_id: int) -> bool:
+        state = self._clients.pop(client_id, None)
+        if state is None:
+            return False
+        state.dropped = True
+        self.admission.release()
+        self.metrics.retire(client_id)
+        state.writer.close()
+        if state.task is not None and state.task is not asyncio.current_task():
+            state.task.cancel()
+        print(f"[server] client#{client_id} disconnected")
+        return True
+
+    def _end_client_session(self, client_id: int) -> str:
+        state = self._clients.get(client_id)
+        if state is None:
+            return END_UNKNOWN
+        return self._end_session(state)
+
+    def _end_session(self, state: AsyncClientState) -> str:
+        if state.channel is None:
+            return END_NO_SESSION
+        ciphertext, mac = state.channel.seal({"type": "END_SESSION"})
+        if not self._send(state, make_secure(ciphertext, mac)):
+            return END_UNKNOWN
+        state.channel = None
+        state.dh_p = None
+        return END_SENT
+
+    # Bulk operations run as one pass on the loop; no write waits for a drain.
+
+    def _end_all_sessions(self) -> int:
+        return sum(self._end_session(state) == END_SENT for state in list(self._clients.values()))
+
+    def _kick_idle(self, idle_for: float) -> int:
+        deadline = time.monotonic() - idle_for
+        idle = [cid for cid, state in self._clients.items() if state.last_active < deadline]
+        return sum(self._drop_client(cid) for cid in idle)
+
+    def _broadcast(self, text: str) -> int:
+        sent = 0
+        for state in list(self._clients.values()):
+            if state.channel is None:
+                continue
+            ciphertext, mac = state.channel.seal({"type": "DATA", "text": text})
+            sent += self._send(state, make_secure(ciphertext, mac))
+        return sent
+
+    async def _reap_loop(self) -> None:
+        interval = min(1.0, self.idle_timeout / 4)
+        while True:
+            await asyncio.sleep(interval)
+            deadline = time.monotonic() - self.idle_timeout
+            for state in [st for st in self._clients.values() if st.last_active < deadline]:
+                if self.idle_end_session:
+                    # close() below still flushes what the transport buffered.
+                    self._end_session(state)
+                print(f"[server] client#{state.client_id} idle for {self.idle_timeout:g}s -> reaped")
+                if self._drop_client(state.client_id):
+                    self.reaped += 1
+
+    async def _stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for cid in list(self._clients.keys()):
+            self._drop_client(cid)
+        if self.handshake_pool is not None:
+            self.handshake_pool.shutdown()
+        self._stopped.set()
+
+    def _call(self, fn, *args):
+        """Run `fn(*args)` on the event loop from a console thread and wait for it."""
+
+        async def run():
+            result = fn(*args)
+            return await result if asyncio.iscoroutine(result) else result
+
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result()
+
+    # Console operations (see admin.AdminTarget).
+
+    def list_clients(self) -> List[ClientInfo]:
+        return self._call(
+            lambda: [ClientInfo(cid, st.addr, st.channel is not None) for cid, st in self._clients.items()]
+        )
+
+    def end_client_session(self, client_id: int) -> str:
+        return self._call(self._end_client_session, client_id)
+
+    def kick_client(self, client_id: int) -> bool:
+        return self._call(self._drop_client, client_id)
+
+    def end_all_sessions(self) -> int:
+        return self._call(self._end_all_sessions)
+
+    def kick_idle(self, idle_for: float) -> int:
+        return self._call(self._kick_idle, idle_for)
+
+    def broadcast(self, text: str) -> int:
+        return self._call(self._broadcast, text)
+
+    def stats_totals(self) -> ClientMetrics:
+        return self.metrics.totals()
+
+    def client_stats(self, client_id: int) -> Optional[ClientMetrics]:
+        return self.metrics.client(client_id)
+
+    def cache_report(self) -> List[str]:
+        # With a handshake pool the groups are validated (and cached) in its workers.
+        groups = self.handshake_pool.group_cache_info() if self.handshake_pool is not None else group_cache_info()
+        lines = [f"[server] validated DH groups: {groups}"]
+        if self.session_cache is None:
+            lines.append("[server] session resumption disabled")
+        else:
+            stats = self._call(self.session_cache.stats)
+            lines.append("[server] session cache: " + " ".join(f"{k}={v}" for k, v in stats.items()))
+        if self.handshake_pool is not None:
+            lines.extend(self.handshake_pool.report())
+        lines.extend(self.admission.report())
+        queued = self._call(
+            lambda: sum(st.writer.transport.get_write_buffer_size() for st in self._clients.values())
+        )
+        lines.append(f"[server] outbound queues: limit={self.outbox_bytes}B queued={queued}B")
+        if self.idle_timeout > 0:
+            lines.append(f"[server] idle reaping: timeout={self.idle_timeout:g}s reaped={self.reaped}")
+        return lines
+
+    def stop(self) -> None:
+        if self._loop is not None and not self._loop.is_closed():
+            self._call(self._stop)
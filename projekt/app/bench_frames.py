@@ -0,0 +1,69 @@
+import argparse
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+from .crypto import b64e
+from .protocol import FrameReader, encode_frame, make_secure, recv_json
+
+
+def _writer(sock: socket.socket, count: int, size: int, batch: int) -> None:
+    frame = encode_frame(make_secure(b64e(os.urandom(size)), b64e(os.urandom(32))))
+    sent = 0
+    while sent < count:
+        n = min(batch, count - sent)
+        sock.sendall(frame * n)
+        sent += n
+
+
+def _run(
+    count: int,
+    size: int,
+    batch: int,
+    read_all: Callable[[socket.socket, int], Dict[str, int]],
+) -> Tuple[float, Dict[str, int]]:
+    a, b = socket.socketpair()
+    t = threading.Thread(target=_writer, args=(a, count, size, batch), daemon=True)
+    start = time.perf_counter()
+    t.start()
+    stats = read_all(b, count)
+    elapsed = time.perf_counter() - start
+    t.join()
+    a.close()
+    b.close()
+    return elapsed, stats
+
+
+def _read_recv_json(sock: socket.socket, count: int) -> Dict[str, int]:
+    for _ in range(count):
+        recv_json(sock)
+    return {"recv_calls": 2 * count}
+
+
+def _read_frame_reader(sock: socket.socket, count: int) -> Dict[str, int]:
+    reader = FrameReader(sock)
+    got = 0
+    while got < count:
+        got += len(reader.recv_frames())
+    return {"recv_calls": reader.recv_calls}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Frame reader benchmark: many small messages over a socketpair")
+    parser.add_argument("--count", type=int, default=200_000, help="frames per run")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[16, 256, 4096], help="ciphertext sizes in bytes")
+    parser.add_argument("--batch", type=int, default=64, help="frames per writer sendall")
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'reader':>12} {'msgs/s':>12} {'recv calls':>12} {'frames/recv':>12}")
+    for size in args.sizes:
+        for name, fn in (("recv_json", _read_recv_json), ("FrameReader", _read_frame_reader)):
+            elapsed, stats = _run(args.count, size, args.batch, fn)
+            calls = stats["recv_calls"]
+            print(f"{size:>8} {name:>12} {args.count / elapsed:>12.0f} {calls:>12} {args.count / calls:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
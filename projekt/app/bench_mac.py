@@ -0,0 +1,55 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from .crypto import mac_tag
+from .secure_channel import SecureChannel
+
+
+DEFAULT_SIZES = [64, 1024, 16 * 1024, 256 * 1024]
+
+
+def _time(fn: Callable[[], object], budget: float) -> float:
+    fn()
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-message MAC and batched open micro-benchmark")
+    parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES, help="payload sizes in bytes")
+    parser.add_argument("--batch", type=int, default=64, help="frames per open_batch call")
+    parser.add_argument("--threads", type=int, default=4, help="open_batch worker threads")
+    parser.add_argument("--budget", type=float, default=0.3, help="seconds spent per measurement")
+    args = parser.parse_args()
+
+    channel = SecureChannel(os.urandom(32), os.urandom(32), binary=True)
+    pool = ThreadPoolExecutor(args.threads)
+
+    print(f"{'size':>8} {'new us':>9} {'copy us':>9} {'open us':>9} {'batch us':>9} {'pool us':>9}")
+    for size in args.sizes:
+        data = os.urandom(size)
+        frames = [channel.seal({"type": "DATA", "text": "x" * size}) for _ in range(args.batch)]
+        assert channel.open_batch(frames, pool) == channel.open_batch(frames)
+
+        new_t = _time(lambda: mac_tag(channel.mac_key, data), args.budget)
+        copy_t = _time(lambda: channel._tag(data), args.budget)
+        open_t = _time(lambda: [channel.open(c, m) for c, m in frames], args.budget) / args.batch
+        batch_t = _time(lambda: channel.open_batch(frames), args.budget) / args.batch
+        pool_t = _time(lambda: channel.open_batch(frames, pool, slices=args.threads), args.budget) / args.batch
+
+        cols = [t * 1e6 for t in (new_t, copy_t, open_t, batch_t, pool_t)]
+        print(f"{size:>8} " + " ".join(f"{c:>9.2f}" for c in cols))
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import time
+from typing import Callable
+
+from .crypto import KeyStream, xor_stream
+
+
+DEFAULT_SIZES = [64, 1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+
+def xor_stream_loop(data: bytes, key: bytes) -> bytes:
+    # Original per-byte implementation, kept as the benchmark baseline.
+    out = bytearray(len(data))
+    for i, b in enumerate(data):
+        out[i] = b ^ key[i % len(key)]
+    return bytes(out)
+
+
+def _time(fn: Callable[[], object], budget: float) -> float:
+    fn()
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / runs
+
+
+def _fmt_size(n: int) -> str:
+    for unit in ("B", "KiB"):
+        if n < 1024:
+            return f"{n}{unit}"
+        n //= 1024
+    return f"{n}MiB"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="XOR keystream micro-benchmark")
+    parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES, help="payload sizes in bytes")
+    parser.add_argument("--budget", type=float, default=0.3, help="seconds spent per measurement")
+    parser.add_argument("--loop-max", type=int, default=1024 * 1024, help="skip the per-byte loop above this size")
+    args = parser.parse_args()
+
+    key = os.urandom(32)
+    ks = KeyStream(key)
+
+    print(f"{'size':>10} {'loop MB/s':>12} {'bulk MB/s':>12} {'into MB/s':>12} {'speedup':>9}")
+    for size in args.sizes:
+        data = os.urandom(size)
+        out = bytearray(size)
+        if size <= args.loop_max:
+            assert xor_stream_loop(data, key) == xor_stream(data, key)
+            loop_t = _time(lambda: xor_stream_loop(data, key), args.budget)
+        else:
+            loop_t = float("nan")
+        bulk_t = _time(lambda: xor_stream(data, key), args.budget)
+        into_t = _time(lambda: ks.xor_into(out, data), args.budget)
+
+        results = [size / t / 1e6 for t in (loop_t, bulk_t, into_t)]
+        speedup = loop_t / into_t
+        print(f"{_fmt_size(size):>10} {results[0]:>12.1f} {results[1]:>12.1f} {results[2]:>12.1f} {speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
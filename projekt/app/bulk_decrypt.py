@@ -0,0 +1,381 @@
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from .capture import FrameSplitter, read_segments
+from .keylog import KeyRecord, read_keylog_dir
+from .keystore import KeyStore
+from .secure_channel import MacError, SecureChannel, StreamOpener, _raw
+
+# Work item shapes sent to the pool; meta is the part of the output line
+# already known in the main process (connection, direction, timestamp, index).
+#   (meta, "plain", frame or None)
+#   (meta, "secure", keys, ciphertext, mac)
+#   (meta, "stream", keys, summary) - streams are opened in the main process
+Keys = Optional[Tuple[bytes, bytes]]
+Item = Tuple[Any, ...]
+
+
+class KeyIndex:
+    """Key-log records indexed per session.
+
+    Full handshakes are found by their public values (p, g, A, B), which fix
+    the DH secret. Resumed sessions are logged with the ticket id; a ticket
+    can be resumed many times, so every record of a ticket is a candidate
+    and the right one is picked by checking the MAC of the session's first
+    protected frame.
+    """
+
+    def __init__(self, records: Iterable[KeyRecord]):
+        self.full: Dict[Tuple[int, int, int, int], Tuple[bytes, bytes]] = {}
+        self.resumed: Dict[str, List[Tuple[bytes, bytes]]] = {}
+        self.records = 0
+        for rec in records:
+            # Client and server log the same session; keep one copy.
+            keys = (rec.enc_key, rec.mac_key)
+            if rec.ticket is not None:
+                candidates = self.resumed.setdefault(rec.ticket, [])
+                if keys not in candidates:
+                    candidates.append(keys)
+            else:
+                self.full[(rec.p, rec.g, rec.A, rec.B)] = keys
+            self.records += 1
+
+    @classmethod
+    def from_dir(cls, keys_dir: str) -> "KeyIndex":
+        return cls(read_keylog_dir(keys_dir))
+
+    def sessions(self) -> int:
+        return len(self.full) + sum(len(c) for c in self.resumed.values())
+
+
+@dataclass
+class _Connection:
+    client: str
+    server: str
+    splitters: Dict[str, FrameSplitter] = field(default_factory=lambda: {"c2s": FrameSplitter(), "s2c": FrameSplitter()})
+    hello: Optional[Dict[str, Any]] = None
+    # Confirmed session keys, or resumption candidates still to be told apart.
+    keys: Keys = None
+    candidates: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    ticket: Optional[str] = None
+    frames: int = 0
+    broken: bool = False
+    # Whether the last SECURE frame carried a MAC (sessions without one stream without one too).
+    macs: bool = True
+    # Per direction: a stream still waiting for STREAM_END.
+    streams: Dict[str, "_Stream"] = field(default_factory=dict)
+
+
+@dataclass
+class _Stream:
+    """A stream opened chunk by chunk as it arrives.
+
+    The opener carries the keystream offset and the running MAC, so only one
+    chunk is held at a time whatever the size of the stream.
+    """
+
+    meta: Dict[str, Any]
+    opener: Optional[StreamOpener]
+    digest: Any = field(default_factory=hashlib.sha256)
+    chunks: int = 0
+    error: Optional[str] = None
+
+    def add(self, ciphertext) -> None:
+        self.chunks += 1
+        if self.opener is None or self.error is not None:
+            return
+        try:
+            self.digest.update(self.opener.open_chunk(ciphertext))
+        except ValueError as e:
+            self.error = f"decrypt failed: {e}"
+
+    def finish(self, keys: Tuple[bytes, bytes], end_ct, end_mac) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"chunks": self.chunks}
+        if self.opener is None:
+            return out
+        out["length"], out["sha256"] = self.opener.length, self.digest.hexdigest()
+        if self.error is not None:
+            out["error"] = self.error
+            return out
+        try:
+            status, end = _open_secure(keys, end_ct, end_mac)
+            self.opener.finish(end)
+            out["mac"] = status if "mac" in end else "none"
+        except MacError as e:
+            out["mac"] = "bad"
+            out["error"] = str(e)
+        except (ValueError, UnicodeDecodeError) as e:
+            out["error"] = f"decrypt failed: {e}"
+        return out
+
+
+# --- worker side -----------------------------------------------------------
+
+_channels: Dict[Tuple[bytes, bytes], Tuple[SecureChannel, SecureChannel]] = {}
+
+
+def _channels_for(keys: Tuple[bytes, bytes]) -> Tuple[SecureChannel, SecureChannel]:
+    # (verifying channel, MAC-less channel) per session, reused across batches.
+    pair = _channels.get(keys)
+    if pair is None:
+        if len(_channels) >= 4096:
+            _channels.clear()
+        enc_key, mac_key = keys
+        pair = _channels[keys] = (SecureChannel(enc_key, mac_key), SecureChannel(enc_key, None, use_mac=False))
+    return pair
+
+
+def _open_secure(keys: Tuple[bytes, bytes], ciphertext, mac) -> Tuple[str, Dict[str, Any]]:
+    verifying, plain = _channels_for(keys)
+    if mac is None:
+        return "none", plain.open(ciphertext, None)
+    return "ok", verifying.open(ciphertext, mac)
+
+
+def _process_item(item: Item) -> Dict[str, Any]:
+    meta, kind = item[0], item[1]
+    out = dict(meta)
+    if kind == "plain":
+        if item[2] is not None:
+            out["frame"] = item[2]
+        return out
+    keys = item[2]
+    if keys is None:
+        out["error"] = "no key for session"
+        return out
+    try:
+        if kind == "secure":
+            out["mac"], out["inner"] = _open_secure(keys, item[3], item[4])
+        else:
+            out.update(item[3])
+    except MacError as e:
+        out["mac"] = "bad"
+        out["error"] = str(e)
+    except (ValueError, UnicodeDecodeError) as e:
+        out["error"] = f"decrypt failed: {e}"
+    return out
+
+
+def process_batch(items: List[Item]) -> Tuple[str, Dict[str, int]]:
+    """Decrypt and MAC-check a batch; returns the JSON lines and outcome counts."""
+    counts = {"ok": 0, "bad": 0, "none": 0, "no_key": 0, "errors": 0}
+    lines = []
+    for item in items:
+        out = _process_item(item)
+        if item[1] != "plain":
+            if "mac" in out:
+                counts[out["mac"]] += 1
+            elif out.get("error") == "no key for session":
+                counts["no_key"] += 1
+            else:
+                counts["errors"] += 1
+        lines.append(json.dumps(out, separators=(",", ":")))
+    return "".join(line + "\n" for line in lines), counts
+
+
+# --- main process ----------------------------------------------------------
+
+
+class BulkDecryptor:
+    """Tracks sessions in a capture and feeds decryption batches to a process pool.
+
+    Only the plaintext handshake frames are interpreted here (to know which
+    keys a connection uses); all decryption and MAC checking happens in
+    `process_batch`, in worker processes when `workers` > 0. Output lines
+    keep capture order. Streams are the exception: their chunks are opened
+    here as they arrive (the keystream offset and the MAC run across the
+    whole stream), and only the summary line goes through a batch.
+    """
+
+    def __init__(self, index: KeyIndex, out, workers: int = 0, batch_size: int = 2048, server_port: Optional[int] = None):
+        self.index = index
+        self.out = out
+        self.batch_size = batch_size
+        self.server_port = server_port
+        self.counts = {"frames": 0, "ok": 0, "bad": 0, "none": 0, "no_key": 0, "errors": 0}
+        self._conns: Dict[frozenset, _Connection] = {}
+        self._batch: List[Item] = []
+        self._pool = ProcessPoolExecutor(workers) if workers > 0 else None
+        self._max_inflight = max(2, workers * 4)
+        self._inflight: Deque[Union[Future, Tuple[str, Dict[str, int]]]] = deque()
+
+    def run(self, segments: Iterable[Tuple[float, str, str, bytes]]) -> Dict[str, int]:
+        try:
+            for ts, src, dst, data in segments:
+                self._feed(ts, src, dst, data)
+            for conn in self._conns.values():
+                for stream in conn.streams.values():
+                    self._emit((dict(stream.meta, error=f"capture ended inside a stream ({stream.chunks} chunks)"), "plain", None))
+            self._flush()
+            while self._inflight:
+                self._write(self._inflight.popleft())
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+        return self.counts
+
+    def _connection(self, src: str, dst: str) -> _Connection:
+        key = frozenset((src, dst))
+        conn = self._conns.get(key)
+        if conn is None:
+            client, server = src, dst
+            if self.server_port is not None and src.endswith(f":{self.server_port}"):
+                client, server = dst, src
+            conn = self._conns[key] = _Connection(client=client, server=server)
+        return conn
+
+    def _feed(self, ts: float, src: str, dst: str, data: bytes) -> None:
+        conn = self._connection(src, dst)
+        if conn.broken:
+            return
+        direction = "c2s" if src == conn.client else "s2c"
+        try:
+            frames = list(conn.splitters[direction].feed(data))
+        except ValueError as e:
+            # Not this protocol (or we joined mid-frame): ignore the connection from here on.
+            conn.broken = True
+            self._emit((dict(self._meta(conn, direction, ts), error=f"unparseable stream: {e}"), "plain", None))
+            return
+        for frame in frames:
+            self._frame(conn, direction, ts, frame)
+
+    def _meta(self, conn: _Connection, direction: str, ts: float) -> Dict[str, Any]:
+        conn.frames += 1
+        return {"conn": f"{conn.client}->{conn.server}", "dir": direction, "ts": round(ts, 6), "n": conn.frames}
+
+    def _frame(self, conn: _Connection, direction: str, ts: float, frame: Dict[str, Any]) -> None:
+        self.counts["frames"] += 1
+        ftype = frame.get("type")
+        meta = self._meta(conn, direction, ts)
+        meta["type"] = ftype
+        if ftype == "STREAM_CHUNK":
+            stream = conn.streams.get(direction)
+            if stream is None:
+                opener = None
+                if conn.keys is not None:
+                    verifying, plain = _channels_for(conn.keys)
+                    opener = (verifying if conn.macs else plain).stream_opener()
+                stream = conn.streams[direction] = _Stream(dict(meta, type="STREAM"), opener)
+            stream.add(frame.get("ciphertext"))
+            return
+        if ftype != "SECURE":
+            self._handshake_frame(conn, direction, frame)
+            self._emit((meta, "plain", frame))
+            return
+        ciphertext, mac = frame.get("ciphertext"), frame.get("mac")
+        keys = self._session_keys(conn, ciphertext, mac)
+        conn.macs = mac is not None
+        stream = conn.streams.pop(direction, None)
+        if stream is not None:
+            self._emit((stream.meta, "stream", keys, stream.finish(keys, ciphertext, mac) if keys is not None else None))
+        else:
+            self._emit((meta, "secure", keys, ciphertext, mac))
+
+    def _handshake_frame(self, conn: _Connection, direction: str, frame: Dict[str, Any]) -> None:
+        ftype = frame.get("type")
+        if ftype == "CLIENT_HELLO":
+            if direction == "s2c":
+                # Oriented the wrong way round (capture began with a server frame).
+                conn.client, conn.server = conn.server, conn.client
+            conn.hello = frame
+        elif ftype == "SERVER_HELLO" and conn.hello is not None:
+            conn.keys, conn.candidates, conn.ticket = None, [], None
+            hello = conn.hello
+            if "ticket" in hello:
+                if frame.get("resumed") is True:
+                    conn.ticket = hello["ticket"]
+                    conn.candidates = list(self.index.resumed.get(conn.ticket, []))
+                    if len(conn.candidates) == 1:
+                        conn.keys = conn.candidates[0]
+            elif all(isinstance(hello.get(k), int) for k in ("p", "g", "A")) and isinstance(frame.get("B"), int):
+                conn.keys = self.index.full.get((hello["p"], hello["g"], hello["A"], frame["B"]))
+            conn.hello = None
+
+    def _session_keys(self, conn: _Connection, ciphertext, mac) -> Keys:
+        if conn.keys is not None or not conn.candidates:
+            return conn.keys
+        # Several sessions resumed from one ticket: the MAC tells which one this is.
+        if isinstance(mac, (str, bytes)):
+            raw_ct, raw_mac = _raw(ciphertext), _raw(mac)
+            for keys in conn.candidates:
+                if hmac.compare_digest(hmac.new(keys[1], raw_ct, hashlib.sha256).digest(), raw_mac):
+                    conn.keys = keys
+                    break
+        else:
+            conn.keys = conn.candidates[0]
+        if conn.keys is not None:
+            candidates = self.index.resumed[conn.ticket]
+            if len(candidates) > 1 and conn.keys in candidates:
+                candidates.remove(conn.keys)
+        return conn.keys
+
+    def _emit(self, item: Item) -> None:
+        self._batch.append(item)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        if self._pool is None:
+            self._write(process_batch(batch))
+            return
+        self._inflight.append(self._pool.submit(process_batch, batch))
+        # Keep memory bounded: wait for the oldest batch once enough are queued.
+        while len(self._inflight) >= self._max_inflight or (self._inflight and self._inflight[0].done()):
+            self._write(self._inflight.popleft())
+
+    def _write(self, result: Union[Future, Tuple[str, Dict[str, int]]]) -> None:
+        text, counts = result.result() if isinstance(result, Future) else result
+        self.out.write(text)
+        for name, n in counts.items():
+            self.counts[name] += n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Decrypt a captured Mini-TLS session log in bulk using keys/*.log")
+    parser.add_argument("capture", help="pcap, pcapng or JSON-lines capture (one TCP payload per line)")
+    keys = parser.add_mutually_exclusive_group()
+    keys.add_argument("--keys-dir", default="keys", help="directory with key logs written by the client/server")
+    keys.add_argument("--keys-db", default=None, help="indexed key store (see app.keystore) instead of --keys-dir")
+    parser.add_argument("--out", default="-", help="output JSON-lines file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=0, help="decryption processes (0 = decrypt in this process)")
+    parser.add_argument("--batch", type=int, default=2048, help="frames per work unit")
+    parser.add_argument("--server-port", type=int, default=None, help="server port, to orient connections that begin mid-capture")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.keys_db is not None:
+        store = KeyStore(args.keys_db)
+        index = KeyIndex(store)
+        store.close()
+    else:
+        index = KeyIndex.from_dir(args.keys_dir)
+    print(f"[decrypt] {index.records} key records -> {index.sessions()} sessions", file=sys.stderr)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        decryptor = BulkDecryptor(index, out, workers=args.workers, batch_size=args.batch, server_port=args.server_port)
+        counts = decryptor.run(read_segments(args.capture))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    rate = counts["frames"] / elapsed if elapsed > 0 else 0.0
+    print(
+        "[decrypt] " + " ".join(f"{k}={v}" for k, v in counts.items()) + f" in {elapsed:.2f}s ({rate:,.0f} frames/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import base64
+import json
+import socket
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from .protocol import decode_frame, parse_frame_header
+
+# (timestamp, "src_ip:port", "dst_ip:port", TCP payload bytes)
+Segment = Tuple[float, str, str, bytes]
+
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+TCP_SYN = 0x02
+TCP_RST = 0x04
+
+
+def _ip_payload(linktype: int, data: bytes) -> Optional[bytes]:
+    """Strip the link-layer header; None for anything that is not IPv4/IPv6."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        offset, ethertype = 14, struct.unpack_from("!H", data, 12)[0]
+        while ethertype in ETHERTYPE_VLAN and len(data) >= offset + 4:
+            ethertype = struct.unpack_from("!H", data, offset + 2)[0]
+            offset += 4
+        return data[offset:] if ethertype in (ETHERTYPE_IPV4, ETHERTYPE_IPV6) else None
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # Address family in host order for NULL, network order for LOOP; both
+        # are followed directly by the IP header, whose version we trust instead.
+        return data[4:]
+    if linktype == LINKTYPE_LINUX_SLL:
+        return data[16:] if len(data) >= 16 else None
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return data[20:] if len(data) >= 20 else None
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return data
+    return None
+
+
+def _tcp_segment(packet: bytes) -> Optional[Tuple[str, str, int, int, bytes]]:
+    """Parse IP + TCP; returns (src, dst, seq, flags, payload) or None."""
+    if not packet:
+        return None
+    version = packet[0] >> 4
+    if version == 4:
+        if len(packet) < 20:
+            return None
+        ihl = (packet[0] & 0x0F) * 4
+        total_len, frag, proto = struct.unpack_from("!H2xHxB", packet, 2)
+        if proto != socket.IPPROTO_TCP or frag & 0x1FFF:
+            return None
+        src_ip = socket.inet_ntop(socket.AF_INET, packet[12:16])
+        dst_ip = socket.inet_ntop(socket.AF_INET, packet[16:20])
+        tcp = packet[ihl:total_len] if total_len else packet[ihl:]
+        fmt = "{}:{}"
+    elif version == 6:
+        if len(packet) < 40:
+            return None
+        payload_len, next_header = struct.unpack_from("!HB", packet, 4)
+        if next_header != socket.IPPROTO_TCP:
+            # Extension headers are not followed; the protocol never needs them.
+            return None
+        src_ip = socket.inet_ntop(socket.AF_INET6, packet[8:24])
+        dst_ip = socket.inet_ntop(socket.AF_INET6, packet[24:40])
+        tcp = packet[40:40 + payload_len]
+        fmt = "[{}]:{}"
+    else:
+        return None
+    if len(tcp) < 20:
+        return None
+    sport, dport, seq, offset_flags = struct.unpack_from("!HHI4xH", tcp)
+    data_offset = (offset_flags >> 12) * 4
+    return fmt.format(src_ip, sport), fmt.format(dst_ip, dport), seq, offset_flags & 0x3F, tcp[data_offset:]
+
+
+def _read_pcap(f: BinaryIO, magic: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    endian, ts_unit = PCAP_MAGICS[magic]
+    header = f.read(20)
+    if len(header) < 20:
+        return
+    linktype = struct.unpack(endian + "16xI", header)[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        head = f.read(16)
+        if len(head) < 16:
+            return
+        ts_sec, ts_frac, incl_len, _ = record.unpack(head)
+        data = f.read(incl_len)
+        if len(data) < incl_len:
+            return
+        yield ts_sec + ts_frac * ts_unit, linktype, data
+
+
+def _tsresol(options: bytes, endian: str) -> float:
+    # if_tsresol (option 9): 10^-v, or 2^-v when the top bit is set.
+    pos = 0
+    while pos + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            v = options[pos + 4]
+            return 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+        pos += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def _read_pcapng(f: BinaryIO) -> Iterator[Tuple[float, int, bytes]]:
+    endian = "<"
+    interfaces: List[Tuple[int, float]] = []
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        if head[:4] == PCAPNG_SHB:
+            # The byte-order magic of each section decides how the rest is read.
+            bom = f.read(4)
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            total = struct.unpack(endian + "I", head[4:])[0]
+            f.read(total - 12)
+            interfaces = []
+            continue
+        btype, total = struct.unpack(endian + "II", head)
+        body = f.read(total - 8)
+        if len(body) < total - 8 or total < 12:
+            return
+        body = body[:-4]
+        if btype == 1:
+            linktype = struct.unpack_from(endian + "H", body)[0]
+            interfaces.append((linktype, _tsresol(body[8:], endian)))
+        elif btype == 6:
+            iface, ts_high, ts_low, cap_len = struct.unpack_from(endian + "IIII", body)
+            if iface < len(interfaces):
+                linktype, unit = interfaces[iface]
+                yield ((ts_high << 32) | ts_low) * unit, linktype, body[20:20 + cap_len]
+        elif btype == 3 and interfaces:
+            # Simple packet block: no timestamp, interface 0, snapped to the IDB snaplen.
+            yield 0.0, interfaces[0][0], body[4:]
+
+
+def _read_jsonl(f: BinaryIO) -> Iterator[Segment]:
+    # One TCP payload per line, already in stream order:
+    # {"ts": 1.5, "src": "10.0.0.2:40000", "dst": "10.0.0.1:12345", "payload": "<hex>"}
+    # ("payload_b64" may be used instead of "payload").
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        rec = json.loads(line)
+        if "payload_b64" in rec:
+            data = base64.b64decode(rec["payload_b64"])
+        else:
+            data = bytes.fromhex(rec.get("payload", ""))
+        if data:
+            yield float(rec.get("ts", 0.0)), str(rec["src"]), str(rec["dst"]), data
+
+
+class TcpReassembler:
+    """Puts captured TCP payloads back in sequence order, per direction.
+
+    Retransmitted bytes are dropped and out-of-order segments are held until
+    the gap before them is filled. A flow first seen mid-connection starts at
+    the first segment observed.
+    """
+
+    def __init__(self) -> None:
+        self._next: Dict[Tuple[str, str], int] = {}
+        self._held: Dict[Tuple[str, str], Dict[int, Tuple[float, bytes]]] = {}
+
+    def feed(self, ts: float, src: str, dst: str, seq: int, flags: int, payload: bytes) -> Iterator[Segment]:
+        flow = (src, dst)
+        if flags & TCP_RST:
+            self._next.pop(flow, None)
+            self._held.pop(flow, None)
+            return
+        if flags & TCP_SYN:
+            self._next[flow] = (seq + 1) & 0xFFFFFFFF
+            self._held[flow] = {}
+            return
+        if not payload:
+            return
+        if flow not in self._next:
+            self._next[flow] = seq
+            self._held[flow] = {}
+        held = self._held[flow]
+        held[seq] = (ts, payload)
+        while True:
+            expected = self._next[flow]
+            ready = self._take(held, expected)
+            if ready is None:
+                return
+            ts_ready, data = ready
+            self._next[flow] = (expected + len(data)) & 0xFFFFFFFF
+            yield ts_ready, src, dst, data
+
+    @staticmethod
+    def _take(held: Dict[int, Tuple[float, bytes]], expected: int) -> Optional[Tuple[float, bytes]]:
+        # Exact hit first; otherwise a segment starting before `expected`
+        # (a retransmission overlapping new data) is trimmed, stale ones dropped.
+        if expected in held:
+            return held.pop(expected)
+        for seq in list(held):
+            behind = (expected - seq) & 0xFFFFFFFF
+            if behind >= 1 << 31:
+                continue
+            ts, data = held.pop(seq)
+            if behind < len(data):
+                return ts, data[behind:]
+        return None
+
+
+def read_segments(path: str) -> Iterator[Segment]:
+    """Yield reassembled TCP payloads from a pcap, pcapng or JSON-lines capture."""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic in PCAP_MAGICS:
+            packets = _read_pcap(f, magic)
+        elif magic == PCAPNG_SHB:
+            f.seek(0)
+            packets = _read_pcapng(f)
+        else:
+            f.seek(0)
+            yield from _read_jsonl(f)
+            return
+        reassembler = TcpReassembler()
+        for ts, linktype, data in packets:
+            ip = _ip_payload(linktype, data)
+            seg = _tcp_segment(ip) if ip is not None else None
+            if seg is not None:
+                yield from reassembler.feed(ts, *seg)
+
+
+class FrameSplitter:
+    """Cuts one direction of a connection into protocol frames (see protocol.py)."""
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._start = 0
+
+    def feed(self, data: bytes) -> Iterator[Dict]:
+        """Yield every frame completed by `data`; raises ValueError on garbage."""
+        self._buf += data
+        while len(self._buf) - self._start >= 4:
+            rtype, length = parse_frame_header(bytes(self._buf[self._start:self._start + 4]))
+            end = self._start + 4 + length
+            if len(self._buf) < end:
+                break
+            payload = bytes(self._buf[self._start + 4:end])
+            self._start = end
+            yield decode_frame(rtype, payload)
+        if self._start:
+            del self._buf[:self._start]
+            self._start = 0
@@ -1,108 +1,411 @@
 import argparse
+import secrets
+import select
 import socket
+import threading
+import time
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
 
 from .crypto import (
     choose_dh_params,
-    dh_generate_private,
-    dh_public,
+    dh_keypair,
     dh_shared,
     kdf,
+    resumed_secret,
+    resumption_master,
+)
+from .dh_params import DHParamPool
+from .protocol import (
+    FORMAT_BINARY,
+    FORMAT_JSON,
+    STREAM_CHUNK_SIZE,
+    FrameReader,
+    make_client_hello,
+    make_heartbeat,
+    make_resume_hello,
+    encode_frame_parts,
+    make_secure,
+    make_stream_chunk,
+    parse_hex_field,
+    parse_int_field,
+    send_buffers,
+    send_json,
 )
-from .protocol import make_client_hello, parse_int_field, recv_json, send_json
 from .secure_channel import SecureChannel
-from .keylog import log_keys
+from .streams import DEFAULT_STREAM, make_close_stream
+from .keylog import add_keylog_arguments, configure_keylog_from_args, log_keys
 
 
 @dataclass
 class Session:
     channel: SecureChannel
+    resumed: bool = False
+
+
+@dataclass
+class BatchPolicy:
+    """Flush thresholds for send_many/send_iter; whichever is hit first wins."""
+
+    max_count: int = 256
+    max_bytes: int = 256 * 1024
+    max_delay: float = 0.01
+
+
+@dataclass
+class SessionTicket:
+    ticket: str
+    master: bytes
+    p: int
+    g: int
 
 
 class MiniTLSClient:
-    def __init__(self, host: str, port: int, use_mac: bool = True):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        use_mac: bool = True,
+        binary_records: bool = True,
+        resume: bool = True,
+        dh_pool: Optional[DHParamPool] = None,
+        dh_bits: Optional[int] = None,
+        batch: Optional[BatchPolicy] = None,
+        tcp_nodelay: bool = False,
+        busy_retries: int = 5,
+        verbose: bool = True,
+    ):
         self.host = host
         self.port = port
         self.use_mac = use_mac
+        self.binary_records = binary_records
+        self.resume = resume
+        self.dh_pool = dh_pool
+        self.dh_bits = dh_bits
+        self.batch = batch if batch is not None else BatchPolicy()
+        self.tcp_nodelay = tcp_nodelay
+        self.busy_retries = busy_retries
+        self.verbose = verbose
         self.sock: Optional[socket.socket] = None
+        self.reader: Optional[FrameReader] = None
         self.session: Optional[Session] = None
+        # Survives END_SESSION and reconnects, so the next handshake can skip DH.
+        self.ticket: Optional[SessionTicket] = None
+        # Serialises socket use between the caller and the heartbeat thread.
+        self.lock = threading.Lock()
+        self._heartbeat_stop: Optional[threading.Event] = None
+        self._next_stream = DEFAULT_STREAM + 1
+        # Channel of the session ended last: the server may still have frames of
+        # it in flight (CLOSE_STREAM acks, broadcasts) ahead of the next SERVER_HELLO.
+        self._ended_channel: Optional[SecureChannel] = None
+        # Messages read while waiting for a handshake reply, handed out by poll().
+        self._pending: List[Dict[str, Any]] = []
+
+    def _log(self, msg: str) -> None:
+        if self.verbose:
+            print(msg)
 
     def connect(self) -> None:
         if self.sock is not None:
             return
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.tcp_nodelay:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sock.connect((self.host, self.port))
-        print(f"[client] connected to {self.host}:{self.port}")
+        self.reader = FrameReader(self.sock)
+        self._log(f"[client] connected to {self.host}:{self.port}")
 
     def start_session(self, p: Optional[int] = None, g: Optional[int] = None) -> None:
         if self.sock is None:
             raise RuntimeError("not connected")
 
+        if self.resume and self.ticket is not None and p is None and g is None:
+            if self._resume_session(self.ticket):
+                return
+
         if p is None or g is None:
-            p2, g2 = choose_dh_params()
+            p2, g2 = self.dh_pool.get() if self.dh_pool is not None else choose_dh_params(self.dh_bits)
             p = p if p is not None else p2
             g = g if g is not None else g2
 
-        a = dh_generate_private(p)
-        A = dh_public(g, a, p)
-        send_json(self.sock, make_client_hello(p, g, A))
-
-        resp = recv_json(self.sock)
+        a, A = dh_keypair(g, p)
+        for _ in range(self.busy_retries + 1):
+            send_json(self.sock, make_client_hello(p, g, A, self._formats()))
+            resp = self._recv_hello()
+            if resp.get("type") != "SERVER_BUSY":
+                break
+            retry_after = float(resp.get("retry_after", 0.5))
+            self._log(f"[client] server busy - retrying handshake in {retry_after}s")
+            time.sleep(retry_after)
+        else:
+            raise RuntimeError("server busy; handshake not accepted")
         if resp.get("type") != "SERVER_HELLO":
             raise RuntimeError(f"unexpected server message: {resp}")
         B = parse_int_field(resp, "B")
+        binary = resp.get("format") == FORMAT_BINARY and self.binary_records
 
         shared = dh_shared(B, a, p)
         enc_key, mac_key = kdf(shared)
-        self.session = Session(channel=SecureChannel(enc_key, mac_key, use_mac=self.use_mac))
+        self.session = Session(channel=SecureChannel(enc_key, mac_key, use_mac=self.use_mac, binary=binary))
+        self._ended_channel = None
         log_keys(role="client", client_id=None, p=p, g=g, A=A, B=B, shared=shared, enc_key=enc_key, mac_key=mac_key)
-        print(f"[client] handshake complete (p={p}, g={g})")
+        ticket = resp.get("ticket")
+        if self.resume and isinstance(ticket, str):
+            self.ticket = SessionTicket(ticket=ticket, master=resumption_master(shared), p=p, g=g)
+        fmt = FORMAT_BINARY if binary else FORMAT_JSON
+        self._log(f"[client] handshake complete (p={p}, g={g}, format={fmt})")
+
+    def _recv_hello(self) -> Dict[str, Any]:
+        """Next handshake reply; SECURE frames of the old session are kept for poll()."""
+        channel = self.session.channel if self.session is not None else self._ended_channel
+        while True:
+            frame = self.reader.recv_frame()
+            if frame.get("type") != "SECURE":
+                return frame
+            try:
+                frame = _open_frame(frame, channel)
+            except ValueError:
+                pass  # not sealed under a session we know; hand it out as received
+            self._pending.append(frame)
 
-    def send_data(self, text: str) -> None:
+    def _formats(self) -> Optional[List[str]]:
+        return [FORMAT_BINARY, FORMAT_JSON] if self.binary_records else None
+
+    def _resume_session(self, ticket: SessionTicket) -> bool:
+        nonce = secrets.token_bytes(16)
+        send_json(self.sock, make_resume_hello(ticket.ticket, nonce, self._formats()))
+
+        resp = self._recv_hello()
+        if resp.get("type") != "SERVER_HELLO":
+            raise RuntimeError(f"unexpected server message: {resp}")
+        if resp.get("resumed") is not True:
+            self.ticket = None
+            self._log("[client] session ticket rejected - falling back to full handshake")
+            return False
+        server_nonce = parse_hex_field(resp, "nonce")
+        binary = resp.get("format") == FORMAT_BINARY and self.binary_records
+
+        shared = resumed_secret(ticket.master, nonce, server_nonce)
+        enc_key, mac_key = kdf(shared)
+        self.session = Session(
+            channel=SecureChannel(enc_key, mac_key, use_mac=self.use_mac, binary=binary),
+            resumed=True,
+        )
+        self._ended_channel = None
+        log_keys(
+            role="client",
+            client_id=None,
+            p=ticket.p,
+            g=ticket.g,
+            A=0,
+            B=0,
+            shared=shared,
+            enc_key=enc_key,
+            mac_key=mac_key,
+            ticket=ticket.ticket,
+        )
+        fmt = FORMAT_BINARY if binary else FORMAT_JSON
+        self._log(f"[client] session resumed (p={ticket.p}, g={ticket.g}, format={fmt})")
+        return True
+
+    def send_data(self, text: str, stream: int = DEFAULT_STREAM) -> None:
         if self.sock is None:
             raise RuntimeError("not connected")
         if self.session is None:
             raise RuntimeError("no active session; run 'handshake' first")
 
-        ciphertext_b64, mac_b64 = self.session.channel.seal({"type": "DATA", "text": text})
-        out = {"type": "SECURE", "ciphertext": ciphertext_b64}
-        if mac_b64 is not None:
-            out["mac"] = mac_b64
-        send_json(self.sock, out)
-        print("[client] sent")
+        ciphertext, mac = self.session.channel.seal(_data(text, stream))
+        send_json(self.sock, make_secure(ciphertext, mac))
+        self._log("[client] sent")
+
+    def send_many(self, texts: Iterable[str], stream: int = DEFAULT_STREAM) -> int:
+        """Send several DATA messages, coalesced into few vectored writes."""
+        count = self.send_iter(texts, stream=stream)
+        self._log(f"[client] sent {count} messages")
+        return count
+
+    def send_iter(
+        self, texts: Iterable[str], batch: Optional[BatchPolicy] = None, stream: int = DEFAULT_STREAM
+    ) -> int:
+        """Seal DATA messages as the iterable yields them and flush by policy.
+
+        Frames are buffered until `max_count` frames or `max_bytes` bytes are
+        pending, or `max_delay` seconds have passed since the first pending
+        frame (checked as each new text arrives), then written with a single
+        sendmsg(). Whatever is left is flushed when the iterable is exhausted.
+        `stream` selects the logical stream the messages belong to.
+        """
+        if self.sock is None:
+            raise RuntimeError("not connected")
+        if self.session is None:
+            raise RuntimeError("no active session; run 'handshake' first")
+        policy = batch if batch is not None else self.batch
+        channel = self.session.channel
+
+        pending: List[bytes] = []
+        pending_frames = pending_bytes = total = 0
+        first_at = 0.0
+        for text in texts:
+            ciphertext, mac = channel.seal(_data(text, stream))
+            parts = encode_frame_parts(make_secure(ciphertext, mac))
+            if not pending:
+                first_at = time.monotonic()
+            pending.extend(parts)
+            pending_frames += 1
+            pending_bytes += sum(len(part) for part in parts)
+            total += 1
+            if (
+                pending_frames >= policy.max_count
+                or pending_bytes >= policy.max_bytes
+                or time.monotonic() - first_at >= policy.max_delay
+            ):
+                send_buffers(self.sock, pending)
+                pending, pending_frames, pending_bytes = [], 0, 0
+        if pending:
+            send_buffers(self.sock, pending)
+        return total
+
+    def open_stream(self) -> int:
+        """Allocate a logical stream id; it is opened by the first DATA sent on it."""
+        sid = self._next_stream
+        self._next_stream += 1
+        return sid
+
+    def close_stream(self, stream: int) -> None:
+        """Send CLOSE_STREAM; the server acknowledges it (see poll()) once the stream's messages are handled."""
+        if self.sock is None:
+            raise RuntimeError("not connected")
+        if self.session is None:
+            raise RuntimeError("no active session; run 'handshake' first")
+
+        ciphertext, mac = self.session.channel.seal(make_close_stream(stream))
+        send_json(self.sock, make_secure(ciphertext, mac))
+        self._log(f"[client] stream {stream} closed")
+
+    def send_stream(self, fileobj: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        """Send a file-like object of any size as STREAM_BEGIN, chunk records, STREAM_END.
+
+        Only one chunk is held in memory at a time; returns the bytes sent.
+        """
+        if self.sock is None:
+            raise RuntimeError("not connected")
+        if self.session is None:
+            raise RuntimeError("no active session; run 'handshake' first")
+        channel = self.session.channel
+
+        ciphertext, mac = channel.seal({"type": "STREAM_BEGIN"})
+        send_buffers(self.sock, encode_frame_parts(make_secure(ciphertext, mac)))
+        sealer = channel.stream_sealer()
+        while True:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+            send_buffers(self.sock, encode_frame_parts(make_stream_chunk(sealer.seal_chunk(data))))
+        ciphertext, mac = sealer.finish()
+        send_buffers(self.sock, encode_frame_parts(make_secure(ciphertext, mac)))
+        self._log(f"[client] streamed {sealer.length} bytes")
+        return sealer.length
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """Read whatever the server has sent so far, without waiting for more.
+
+        SECURE frames are decrypted; an END_SESSION from the server clears the
+        session. Returns the messages read (inner messages for SECURE frames),
+        starting with those that arrived while a handshake waited for its reply.
+        Raises ConnectionError when the server has closed the connection.
+        """
+        if self.sock is None:
+            raise RuntimeError("not connected")
+        messages, self._pending = self._pending, []
+        while self.reader.has_buffered_frame() or select.select([self.sock], [], [], 0)[0]:
+            frame = self.reader.recv_frame()
+            if frame.get("type") == "SECURE" and self.session is not None:
+                frame = _open_frame(frame, self.session.channel)
+                if frame.get("type") == "END_SESSION":
+                    self._ended_channel = self.session.channel
+                    self.session = None
+                    self._log("[client] server ended the session")
+            messages.append(frame)
+        return messages
+
+    def heartbeat(self) -> None:
+        """Send a plaintext HEARTBEAT so an idle-reaping server keeps the connection."""
+        if self.sock is None:
+            raise RuntimeError("not connected")
+        send_json(self.sock, make_heartbeat())
+
+    def start_heartbeat(self, interval: float) -> None:
+        """Send a heartbeat every `interval` seconds from a daemon thread until close()."""
+        if self._heartbeat_stop is not None:
+            return
+        stop = self._heartbeat_stop = threading.Event()
+
+        def run() -> None:
+            while not stop.wait(interval):
+                with self.lock:
+                    if self.sock is None:
+                        continue
+                    try:
+                        self.heartbeat()
+                    except OSError as e:
+                        self._log(f"[client] heartbeat failed: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
 
     def end_session(self) -> None:
         if self.sock is None:
             raise RuntimeError("not connected")
         if self.session is None:
-            print("[client] no active session")
+            self._log("[client] no active session")
             return
 
-        ciphertext_b64, mac_b64 = self.session.channel.seal({"type": "END_SESSION"})
-        out = {"type": "SECURE", "ciphertext": ciphertext_b64}
-        if mac_b64 is not None:
-            out["mac"] = mac_b64
-        send_json(self.sock, out)
+        ciphertext, mac = self.session.channel.seal({"type": "END_SESSION"})
+        send_json(self.sock, make_secure(ciphertext, mac))
+        self._ended_channel = self.session.channel
         self.session = None
-        print("[client] EndSession sent - session reset")
+        self._log("[client] EndSession sent - session reset")
 
     def close(self) -> None:
+        if self._heartbeat_stop is not None:
+            self._heartbeat_stop.set()
+            self._heartbeat_stop = None
         if self.sock is not None:
             try:
                 self.sock.close()
             except OSError:
                 pass
         self.sock = None
+        self.reader = None
         self.session = None
+        self._ended_channel = None
+        self._pending = []
+
+
+def _open_frame(frame: Dict[str, Any], channel: Optional[SecureChannel]) -> Dict[str, Any]:
+    if frame.get("type") != "SECURE" or channel is None:
+        return frame
+    mac = frame.get("mac")
+    return channel.open(frame.get("ciphertext"), mac if isinstance(mac, (str, bytes)) else None)
+
+
+def _data(text: str, stream: int) -> Dict[str, Any]:
+    # Stream 0 omits "sid", so the default stream stays readable by older servers.
+    if stream == DEFAULT_STREAM:
+        return {"type": "DATA", "text": text}
+    return {"type": "DATA", "text": text, "sid": stream}
 
 
 def repl(client: MiniTLSClient) -> None:
     help_text = (
         "Commands:\n"
         "  connect                      - open TCP connection\n"
-        "  handshake [p] [g]            - start new session (DH), optional ints\n"
+        "  handshake [p] [g]            - start new session (resumes via ticket if held; p/g force full DH)\n"
         "  send <text>                  - send encrypted DATA\n"
+        "  burst <n> <text>             - send <text> n times in batched writes\n"
+        "  stream <id> <text>           - send encrypted DATA on logical stream <id> ('stream new' picks an id)\n"
+        "  close <id>                   - close logical stream <id>\n"
+        "  sendfile <path>              - stream a file of any size in chunks\n"
+        "  ping                         - send a plaintext HEARTBEAT (keeps an idle session alive)\n"
         "  end                          - send encrypted EndSession\n"
         "  quit                         - close\n"
     )
@@ -120,36 +423,64 @@ def repl(client: MiniTLSClient) -> None:
         parts = line.split(maxsplit=1)
         cmd = parts[0].lower()
 
-        try:
-            if cmd == "connect":
-                client.connect()
-
-            elif cmd == "handshake":
-                p = g = None
-                rest = parts[1] if len(parts) == 2 else ""
-                if rest:
-                    nums = rest.split()
-                    if len(nums) >= 1:
-                        p = int(nums[0])
-                    if len(nums) >= 2:
-                        g = int(nums[1])
-                client.start_session(p=p, g=g)
-
-            elif cmd == "send" and len(parts) == 2:
-                client.send_data(parts[1])
-
-            elif cmd == "end":
-                client.end_session()
-
-            elif cmd == "quit":
-                client.close()
-                break
+        # The heartbeat thread waits while a command uses the socket.
+        with client.lock:
+            try:
+                if cmd == "connect":
+                    client.connect()
+
+                elif cmd == "handshake":
+                    p = g = None
+                    rest = parts[1] if len(parts) == 2 else ""
+                    if rest:
+                        nums = rest.split()
+                        if len(nums) >= 1:
+                            p = int(nums[0])
+                        if len(nums) >= 2:
+                            g = int(nums[1])
+                    client.start_session(p=p, g=g)
+
+                elif cmd == "send" and len(parts) == 2:
+                    client.send_data(parts[1])
+
+                elif cmd == "burst" and len(parts) == 2:
+                    count, _, text = parts[1].partition(" ")
+                    client.send_many(text for _ in range(int(count)))
+
+                elif cmd == "stream" and len(parts) == 2:
+                    if parts[1].strip() == "new":
+                        print(f"[client] stream id: {client.open_stream()}")
+                    else:
+                        sid, _, text = parts[1].partition(" ")
+                        client.send_data(text, stream=int(sid))
+
+                elif cmd == "close" and len(parts) == 2:
+                    client.close_stream(int(parts[1]))
+
+                elif cmd == "sendfile" and len(parts) == 2:
+                    with open(parts[1], "rb") as f:
+                        client.send_stream(f)
 
-            else:
-                print(help_text)
+                elif cmd == "ping":
+                    client.heartbeat()
 
-        except Exception as e:
-            print(f"[client] error: {e}")
+                elif cmd == "end":
+                    client.end_session()
+
+                elif cmd == "quit":
+                    client.close()
+                    break
+
+                else:
+                    print(help_text)
+
+                # Stream acks and broadcasts arrive unasked; show them after each command.
+                if client.sock is not None:
+                    for msg in client.poll():
+                        print(f"[client] server: {msg}")
+
+            except Exception as e:
+                print(f"[client] error: {e}")
 
 
 def main() -> None:
@@ -157,9 +488,35 @@ def main() -> None:
     parser.add_argument("--host", default="server")
     parser.add_argument("--port", type=int, default=12345)
     parser.add_argument("--no-mac", action="store_true", help="disable MAC (variant W3-like)")
+    parser.add_argument("--json-records", action="store_true", help="do not offer binary records")
+    parser.add_argument("--no-resume", action="store_true", help="always run a full DH handshake")
+    parser.add_argument("--dh-bits", type=int, default=None, help="safe-prime size in bits (default: small demo primes)")
+    parser.add_argument("--dh-pool", type=int, default=16, help="pre-generated DH groups kept ready (0 disables)")
+    parser.add_argument("--dh-pool-file", default=None, help="persist the DH group pool here for fast startup")
+    parser.add_argument("--tcp-nodelay", action="store_true", help="disable Nagle's algorithm")
+    parser.add_argument(
+        "--heartbeat", type=float, default=0.0, help="send a HEARTBEAT every N seconds while connected (0 disables)"
+    )
+    add_keylog_arguments(parser)
     args = parser.parse_args()
-
-    client = MiniTLSClient(args.host, args.port, use_mac=not args.no_mac)
+    configure_keylog_from_args(args)
+
+    dh_pool = None
+    if args.dh_pool > 0:
+        dh_pool = DHParamPool(args.dh_pool, bits=args.dh_bits, path=args.dh_pool_file).start()
+
+    client = MiniTLSClient(
+        args.host,
+        args.port,
+        use_mac=not args.no_mac,
+        binary_records=not args.json_records,
+        resume=not args.no_resume,
+        dh_pool=dh_pool,
+        dh_bits=args.dh_bits,
+        tcp_nodelay=args.tcp_nodelay,
+    )
+    if args.heartbeat > 0:
+        client.start_heartbeat(args.heartbeat)
     repl(client)
 
 
@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from .client import MiniTLSClient
+
+
+class PoolTimeout(TimeoutError):
+    """No warm connection became free within the allowed wait."""
+
+
+class MiniTLSClientPool:
+    """Keeps `size` connected, already-handshaked MiniTLSClient sessions ready.
+
+    `acquire()` hands out a warm client (waiting at most `max_wait` seconds
+    for one to come back) and `release()` returns it; `connection()` and
+    `connection_async()` wrap the pair. Connect and handshake only ever run
+    on the pool's maintenance thread, which also health-checks idle clients
+    every `health_interval` seconds: a client whose socket failed is
+    reconnected, one whose session the server ended (END_SESSION) shakes
+    hands again - via its session ticket when the server still knows it -
+    and with `heartbeat_interval` idle clients send HEARTBEAT so an
+    idle-reaping server keeps them. Messages the server pushes to an idle
+    client are discarded.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        size: int = 4,
+        max_wait: float = 5.0,
+        health_interval: float = 1.0,
+        heartbeat_interval: float = 0.0,
+        retry_delay: float = 0.5,
+        **client_kwargs: Any,
+    ):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.max_wait = max_wait
+        self.health_interval = health_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_delay = retry_delay
+        client_kwargs.setdefault("verbose", False)
+        self.client_kwargs = client_kwargs
+
+        self.reconnects = 0
+        self.timeouts = 0
+        self._idle: Deque[MiniTLSClient] = deque()
+        # Clients that need connect and/or handshake before they can be handed out.
+        self._repair: Deque[MiniTLSClient] = deque(MiniTLSClient(host, port, **client_kwargs) for _ in range(size))
+        self._busy = 0
+        self._last_used: Dict[MiniTLSClient, float] = {}
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, wait: bool = True) -> "MiniTLSClientPool":
+        """Start the maintenance thread; with `wait`, block until the pool is warm (up to max_wait)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain_loop, daemon=True)
+            self._thread.start()
+        if wait:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._idle) >= self.size, self.max_wait)
+        return self
+
+    def acquire(self, timeout: Optional[float] = None) -> MiniTLSClient:
+        """Take a warm client; raises PoolTimeout after `timeout` (default max_wait) seconds."""
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        while True:
+            with self._cond:
+                while not self._idle:
+                    if self._closed:
+                        raise RuntimeError("pool closed")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"no connection free within {self.max_wait if timeout is None else timeout}s")
+                    self._cond.wait(remaining)
+                # Most recently used first: its socket is the least likely to have gone stale.
+                client = self._idle.pop()
+                self._busy += 1
+            # Catch an END_SESSION or close that arrived since the last health check.
+            if self._healthy(client):
+                return client
+            self.release(client, discard=True)
+
+    def release(self, client: MiniTLSClient, discard: bool = False) -> None:
+        """Give a client back; `discard` (or a lost session) sends it for repair."""
+        if discard:
+            client.close()
+        with self._cond:
+            self._busy -= 1
+            self._last_used[client] = time.monotonic()
+            if self._closed:
+                client.close()
+            elif client.sock is None or client.session is None:
+                self._repair.append(client)
+                self._wake.set()
+            else:
+                self._idle.append(client)
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[MiniTLSClient]:
+        """`with pool.connection() as client:`; a socket error discards the connection."""
+        client = self.acquire(timeout)
+        try:
+            yield client
+        except OSError:
+            self.release(client, discard=True)
+            raise
+        except BaseException:
+            self.release(client)
+            raise
+        else:
+            self.release(client)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> MiniTLSClient:
+        # The wait happens on a worker thread so the event loop keeps running.
+        return await asyncio.to_thread(self.acquire, timeout)
+
+    @asynccontextmanager
+    async def connection_async(self, timeout: Optional[float] = None) -> AsyncIterator[MiniTLSClient]:
+        """Async variant of connection(); the client's calls still block, run them with to_thread."""
+        client = await self.acquire_async(timeout)
+        try:
+            yield client
+        except OSError:
+            self.release(client, discard=True)
+            raise
+        except BaseException:
+            self.release(client)
+            raise
+        else:
+            self.release(client)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "busy": self._busy,
+                "repairing": len(self._repair),
+                "reconnects": self.reconnects,
+                "timeouts": self.timeouts,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            clients = list(self._idle) + list(self._repair)
+            self._idle.clear()
+            self._repair.clear()
+            self._cond.notify_all()
+        self._wake.set()
+        for client in clients:
+            client.close()
+
+    def _healthy(self, client: MiniTLSClient) -> bool:
+        if client.sock is None:
+            return False
+        try:
+            client.poll()
+        except (OSError, ValueError):
+            client.close()
+            return False
+        return client.session is not None
+
+    def _maintain_loop(self) -> None:
+        while not self._closed:
+            self._repair_all()
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+            if not self._closed:
+                self._check_idle()
+
+    def _repair_all(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed or not self._repair:
+                    return
+                client = self._repair.popleft()
+            try:
+                if client.sock is None:
+                    client.connect()
+                client.start_session()
+            except (OSError, RuntimeError, ValueError) as e:
+                client.close()
+                with self._cond:
+                    self._repair.append(client)
+                print(f"[pool] connecting to {self.host}:{self.port} failed: {e}; retrying in {self.retry_delay}s")
+                self._wake.wait(self.retry_delay)
+                continue
+            with self._cond:
+                if self._closed:
+                    client.close()
+                    return
+                if client in self._last_used:
+                    self.reconnects += 1
+                self._last_used[client] = time.monotonic()
+                self._idle.appendleft(client)
+                self._cond.notify()
+
+    def _check_idle(self) -> None:
+        now = time.monotonic()
+        with self._cond:
+            count = len(self._idle)
+        for _ in range(count):
+            with self._cond:
+                if not self._idle:
+                    return
+                # Oldest first; each client is out of the idle list only while checked.
+                client = self._idle.popleft()
+            ok = self._healthy(client)
+            if ok and self.heartbeat_interval and now - self._last_used.get(client, 0.0) >= self.heartbeat_interval:
+                try:
+                    client.heartbeat()
+                    self._last_used[client] = now
+                except OSError:
+                    client.close()
+                    ok = False
+            with self._cond:
+                if ok:
+                    self._idle.append(client)
+                    self._cond.notify()
+                else:
+                    self._repair.append(client)
+                    self._wake.set()
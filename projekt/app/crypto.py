@@ -1,23 +1,57 @@
 import base64
 import hashlib
 import hmac
+import math
 import secrets
-from typing import Tuple
+from typing import Optional, Tuple
+
+
+def _small_primes(limit: int) -> Tuple[int, ...]:
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for i in range(2, int(limit ** 0.5) + 1):
+        if sieve[i]:
+            sieve[i * i :: i] = bytes(len(range(i * i, limit + 1, i)))
+    return tuple(i for i, v in enumerate(sieve) if v)
+
+
+SMALL_PRIMES = _small_primes(2000)
+_SMALL_PRIMES_PRODUCT = math.prod(SMALL_PRIMES)
+
+# Miller-Rabin with these bases is deterministic for n < 3.3 * 10**24.
+_MR_DETERMINISTIC_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+_MR_DETERMINISTIC_LIMIT = 3_317_044_064_679_887_385_961_981
+
+
+def _miller_rabin(n: int, bases) -> bool:
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
 
 
-def is_prime(n: int) -> bool:
+def is_prime(n: int, rounds: int = 40) -> bool:
     if n <= 1:
         return False
-    if n <= 3:
+    for q in SMALL_PRIMES:
+        if n % q == 0:
+            return n == q
+    if n < SMALL_PRIMES[-1] ** 2:
         return True
-    if n % 2 == 0:
-        return False
-    i = 3
-    while i * i <= n:
-        if n % i == 0:
-            return False
-        i += 2
-    return True
+    if n < _MR_DETERMINISTIC_LIMIT:
+        return _miller_rabin(n, _MR_DETERMINISTIC_BASES)
+    return _miller_rabin(n, (secrets.randbelow(n - 3) + 2 for _ in range(rounds)))
 
 
 def random_prime(min_n: int = 2000, max_n: int = 10000) -> int:
@@ -34,10 +68,27 @@ def random_prime(min_n: int = 2000, max_n: int = 10000) -> int:
             return n
 
 
-def choose_dh_params() -> Tuple[int, int]:
-    p = random_prime(2000, 10000)
-    g = secrets.randbelow(p - 3) + 2
-    return p, g
+def random_safe_prime(bits: int) -> int:
+    """Random p = 2q + 1 with q prime and p exactly `bits` long."""
+    if bits < 16:
+        raise ValueError("bits must be >= 16")
+    while True:
+        q = secrets.randbits(bits - 1) | (1 << (bits - 2)) | 1
+        p = 2 * q + 1
+        # Cheap sieve on both candidates before any modexp.
+        if math.gcd(q * p, _SMALL_PRIMES_PRODUCT) != 1:
+            continue
+        if is_prime(q) and is_prime(p):
+            return p
+
+
+def choose_dh_params(bits: Optional[int] = None) -> Tuple[int, int]:
+    if bits is None:
+        p = random_prime(2000, 10000)
+        g = secrets.randbelow(p - 3) + 2
+        return p, g
+    # For a safe prime, 4 = 2^2 generates the subgroup of prime order q.
+    return random_safe_prime(bits), 4
 
 
 def dh_generate_private(p: int) -> int:
@@ -50,6 +101,18 @@ def dh_public(g: int, a: int, p: int) -> int:
     return pow(g, a, p)
 
 
+def dh_keypair(g: int, p: int) -> Tuple[int, int]:
+    """(private, public) with the public value in [2, p-2], which the peer requires.
+
+    Demo groups use a random g, so g^a can hit 1 or p-1; draw again then.
+    """
+    while True:
+        a = dh_generate_private(p)
+        A = dh_public(g, a, p)
+        if 2 <= A <= p - 2:
+            return a, A
+
+
 def dh_shared(other_public: int, a: int, p: int) -> int:
     return pow(other_public, a, p)
 
@@ -61,13 +124,94 @@ def kdf(shared_secret: int) -> Tuple[bytes, bytes]:
     return enc_key, mac_key
 
 
-def xor_stream(data: bytes, key: bytes) -> bytes:
+def resumption_master(shared_secret: int) -> bytes:
+    return hashlib.sha256(b"res|" + str(shared_secret).encode("utf-8")).digest()
+
+
+def resumed_secret(master: bytes, client_nonce: bytes, server_nonce: bytes) -> int:
+    # Fresh per-session secret from the cached master and both nonces; fed to
+    # kdf() in place of a DH shared value, so resumption needs no modexp.
+    digest = hashlib.sha256(b"resume|" + master + client_nonce + server_nonce).digest()
+    return int.from_bytes(digest, "big")
+
+
+# Size of the per-session repeated-key buffer. Longer payloads are XORed in
+# blocks of this size, each reusing the cached buffer at its own offset, so a
+# session never pins more than one block of key material.
+KEYSTREAM_CACHE_LIMIT = 64 * 1024
+
+
+def repeat_key(key: bytes, n: int, offset: int = 0) -> bytes:
+    if not key:
+        raise ValueError("empty key")
+    start = offset % len(key)
+    reps = (start + n) // len(key) + 1
+    return (key * reps)[start:start + n]
+
+
+def xor_bytes(data, keystream) -> bytes:
+    # Whole-buffer XOR through Python big ints: one C-level pass per operand
+    # instead of an interpreted loop per byte.
+    n = len(data)
+    if n == 0:
+        return b""
+    x = int.from_bytes(data, "little") ^ int.from_bytes(keystream, "little")
+    return x.to_bytes(n, "little")
+
+
+class KeyStream:
+    """Repeated-key XOR keystream over a small cached key buffer.
+
+    The buffer holds `block` key bytes plus one key length, so a block-sized
+    window exists at every key phase; payloads longer than `block` are
+    processed block by block.
+    """
+
+    def __init__(self, key: bytes, cache_limit: int = KEYSTREAM_CACHE_LIMIT):
+        if not key:
+            raise ValueError("empty key")
+        self.key = bytes(key)
+        self.block = max(1, cache_limit)
+        self._buf = b""
+
+    def keystream(self, n: int, offset: int = 0) -> memoryview:
+        start = offset % len(self.key)
+        need = start + n
+        if need > len(self._buf):
+            limit = self.block + len(self.key)
+            if need > limit:
+                return memoryview(repeat_key(self.key, n, offset))
+            self._buf = repeat_key(self.key, min(max(need, 2 * len(self._buf)), limit))
+        return memoryview(self._buf)[start:need]
+
+    def xor(self, data, offset: int = 0) -> bytes:
+        n = len(data)
+        if n <= self.block:
+            return xor_bytes(data, self.keystream(n, offset))
+        src = memoryview(data)
+        return b"".join(
+            xor_bytes(src[i:i + self.block], self.keystream(min(self.block, n - i), offset + i))
+            for i in range(0, n, self.block)
+        )
+
+    def xor_into(self, out, data, offset: int = 0) -> int:
+        """XOR `data` into `out` block by block; scratch memory stays at one block."""
+        n = len(data)
+        if len(out) < n:
+            if not isinstance(out, bytearray):
+                raise ValueError("output buffer too small")
+            out.extend(bytes(n - len(out)))
+        with memoryview(data) as src, memoryview(out) as dst:
+            for i in range(0, n, self.block):
+                j = min(i + self.block, n)
+                dst[i:j] = xor_bytes(src[i:j], self.keystream(j - i, offset + i))
+        return n
+
+
+def xor_stream(data: bytes, key: bytes, offset: int = 0) -> bytes:
     if not key:
         raise ValueError("empty key")
-    out = bytearray(len(data))
-    for i, b in enumerate(data):
-        out[i] = b ^ key[i % len(key)]
-    return bytes(out)
+    return xor_bytes(data, repeat_key(key, len(data), offset))
 
 
 def mac_tag(mac_key: bytes, data: bytes) -> bytes:
@@ -0,0 +1,141 @@
+import json
+import os
+import secrets
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Deque, List, Optional, Tuple
+
+from .crypto import choose_dh_params, is_prime
+
+
+@lru_cache(maxsize=4096)
+def _group_ok(p: int, g: int) -> bool:
+    return p >= 5 and 2 <= g <= p - 2 and is_prime(p)
+
+
+def check_client_group(p: int, g: int, A: int) -> None:
+    """Reject a client-offered group or public value; group checks are cached."""
+    if not _group_ok(p, g):
+        raise ValueError("invalid DH group")
+    if not 2 <= A <= p - 2:
+        raise ValueError("invalid DH public value")
+
+
+def group_cache_counts() -> Tuple[int, int, int, int]:
+    """(hits, misses, size, maxsize) of this process's validated-group cache."""
+    info = _group_ok.cache_info()
+    return info.hits, info.misses, info.currsize, info.maxsize
+
+
+def format_group_cache(hits: int, misses: int, size: int, maxsize: int) -> str:
+    return f"hits={hits} misses={misses} size={size}/{maxsize}"
+
+
+def group_cache_info() -> str:
+    return format_group_cache(*group_cache_counts())
+
+
+class DHParamPool:
+    """Pre-validated (p, g) pairs kept topped up by a background thread.
+
+    `get()` never searches for a prime once the pool has been filled at least
+    once: when the queue runs dry it hands out the most recent pair again.
+    With `path`, the pool is loaded on start and saved after every refill.
+    """
+
+    def __init__(self, size: int = 16, bits: Optional[int] = None, path: Optional[str] = None):
+        if size <= 0:
+            raise ValueError("size must be > 0")
+        self.size = size
+        self.bits = bits
+        self.path = path
+
+        self._pairs: Deque[Tuple[int, int]] = deque()
+        self._last: Optional[Tuple[int, int]] = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        if path is not None:
+            self._load()
+
+    def start(self) -> "DHParamPool":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._fill_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def get(self) -> Tuple[int, int]:
+        with self._cond:
+            if self._pairs:
+                pair = self._pairs.popleft()
+                self._last = pair
+                self._cond.notify_all()
+                return pair
+            if self._last is not None:
+                self._cond.notify_all()
+                return self._last
+        # Cold start without a persisted pool: the only case that pays for
+        # a prime search on the caller's path.
+        pair = choose_dh_params(self.bits)
+        with self._cond:
+            self._last = pair
+        return pair
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pairs)
+
+    def _fill_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and len(self._pairs) >= self.size:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            pair = choose_dh_params(self.bits)
+            with self._cond:
+                self._pairs.append(pair)
+                full = len(self._pairs) >= self.size
+            if full and self.path is not None:
+                self._save()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(entries, dict) or entries.get("bits") != self.bits:
+            return
+        pairs: List[Tuple[int, int]] = []
+        for item in entries.get("pairs", []):
+            try:
+                p, g = int(item[0]), int(item[1])
+            except (TypeError, ValueError, IndexError):
+                continue
+            # Cheap with Miller-Rabin; guards against a tampered cache file.
+            if _group_ok(p, g):
+                pairs.append((p, g))
+        secrets.SystemRandom().shuffle(pairs)
+        with self._cond:
+            self._pairs.extend(pairs[: self.size])
+            if self._pairs:
+                self._last = self._pairs[-1]
+
+    def _save(self) -> None:
+        with self._cond:
+            data = {"bits": self.bits, "pairs": [list(pair) for pair in self._pairs]}
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[dh] could not save parameter pool to {self.path}: {e}")
@@ -0,0 +1,145 @@
+import secrets
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from .crypto import (
+    dh_keypair,
+    dh_shared,
+    kdf,
+    resumed_secret,
+    resumption_master,
+)
+from .dh_params import check_client_group
+from .keylog import log_keys
+from .protocol import (
+    FORMAT_BINARY,
+    make_resume_rejected,
+    make_resumed_hello,
+    make_server_hello,
+    negotiate_format,
+    parse_hex_field,
+    parse_int_field,
+    parse_str_field,
+)
+from .secure_channel import SecureChannel
+from .session_cache import SessionCache
+
+
+@dataclass
+class HandshakeResult:
+    channel: Optional[SecureChannel]
+    p: int
+    fmt: str
+    reply: Dict[str, Any]
+    resumed: bool = False
+    busy: bool = False
+
+
+def server_handshake(
+    msg: Dict[str, Any],
+    *,
+    client_id: Optional[int],
+    use_mac: bool,
+    allow_binary: bool = True,
+    session_cache: Optional[SessionCache] = None,
+) -> HandshakeResult:
+    """Answer a CLIENT_HELLO: derive session keys and build the SERVER_HELLO.
+
+    A hello carrying a ticket is answered from `session_cache` without any
+    modexp; an unknown or expired ticket yields a result with no channel and
+    a `resumed: false` reply, after which the client sends a full hello.
+    """
+    fmt = negotiate_format(msg, allow_binary)
+    if "ticket" in msg:
+        return _resume(msg, fmt, client_id=client_id, use_mac=use_mac, session_cache=session_cache)
+
+    p, g, A = parse_full_hello(msg)
+    B, shared = compute_server_keys(p, g, A)
+    return complete_full_handshake(
+        p, g, A, B, shared, fmt, client_id=client_id, use_mac=use_mac, session_cache=session_cache
+    )
+
+
+def parse_full_hello(msg: Dict[str, Any]) -> Tuple[int, int, int]:
+    return parse_int_field(msg, "p"), parse_int_field(msg, "g"), parse_int_field(msg, "A")
+
+
+def compute_server_keys(p: int, g: int, A: int) -> Tuple[int, int]:
+    """The CPU-heavy part of a full handshake: validate the group, return (B, shared).
+
+    Kept free of server state so it can run in a worker process.
+    """
+    check_client_group(p, g, A)
+    b, B = dh_keypair(g, p)
+    return B, dh_shared(A, b, p)
+
+
+def complete_full_handshake(
+    p: int,
+    g: int,
+    A: int,
+    B: int,
+    shared: int,
+    fmt: str,
+    *,
+    client_id: Optional[int],
+    use_mac: bool,
+    session_cache: Optional[SessionCache],
+) -> HandshakeResult:
+    enc_key, mac_key = kdf(shared)
+
+    # For the final report: store keys so you can manually decrypt
+    # payload captured in Wireshark.
+    log_keys(
+        role="server",
+        client_id=client_id,
+        p=p,
+        g=g,
+        A=A,
+        B=B,
+        shared=shared,
+        enc_key=enc_key,
+        mac_key=mac_key,
+    )
+    ticket = session_cache.issue(resumption_master(shared), p, g) if session_cache is not None else None
+    channel = SecureChannel(enc_key, mac_key, use_mac=use_mac, binary=fmt == FORMAT_BINARY)
+    return HandshakeResult(channel=channel, p=p, fmt=fmt, reply=make_server_hello(B, fmt, ticket))
+
+
+def _resume(
+    msg: Dict[str, Any],
+    fmt: str,
+    *,
+    client_id: Optional[int],
+    use_mac: bool,
+    session_cache: Optional[SessionCache],
+) -> HandshakeResult:
+    ticket = parse_str_field(msg, "ticket")
+    client_nonce = parse_hex_field(msg, "nonce")
+    entry = session_cache.lookup(ticket) if session_cache is not None else None
+    if entry is None:
+        return HandshakeResult(channel=None, p=0, fmt=fmt, reply=make_resume_rejected())
+
+    server_nonce = secrets.token_bytes(16)
+    shared = resumed_secret(entry.master, client_nonce, server_nonce)
+    enc_key, mac_key = kdf(shared)
+    log_keys(
+        role="server",
+        client_id=client_id,
+        p=entry.p,
+        g=entry.g,
+        A=0,
+        B=0,
+        shared=shared,
+        enc_key=enc_key,
+        mac_key=mac_key,
+        ticket=ticket,
+    )
+    channel = SecureChannel(enc_key, mac_key, use_mac=use_mac, binary=fmt == FORMAT_BINARY)
+    return HandshakeResult(
+        channel=channel,
+        p=entry.p,
+        fmt=fmt,
+        reply=make_resumed_hello(server_nonce, fmt),
+        resumed=True,
+    )
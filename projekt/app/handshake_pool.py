@@ -0,0 +1,193 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, CancelledError, Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .handshake import (
+    HandshakeResult,
+    complete_full_handshake,
+    compute_server_keys,
+    parse_full_hello,
+    server_handshake,
+)
+from .dh_params import format_group_cache, group_cache_counts
+from .metrics import Histogram
+from .protocol import make_server_busy, negotiate_format
+from .session_cache import SessionCache
+
+
+def _timed_compute(
+    p: int, g: int, A: int, submitted_at: float
+) -> Tuple[int, int, float, int, Tuple[int, int, int, int]]:
+    # CLOCK_MONOTONIC is system-wide, so the queue wait can be measured across processes.
+    wait = time.monotonic() - submitted_at
+    B, shared = compute_server_keys(p, g, A)
+    # Group validation is cached per worker process; its counters ride back with the result.
+    return B, shared, wait, os.getpid(), group_cache_counts()
+
+
+class HandshakePool:
+    """Runs group validation and modexp of full handshakes in worker processes.
+
+    At most `workers + queue_depth` handshakes are in flight; beyond that the
+    client gets SERVER_BUSY with a `retry_after` hint right away instead of
+    waiting behind the queue. Resumed handshakes need no modexp and stay
+    inline. Key derivation, key logging and ticket issuing also stay in the
+    server process. A handshake the pool cannot finish - cancelled by
+    shutdown(), or lost with a worker that died - also gets SERVER_BUSY; a
+    broken pool is replaced so later handshakes get fresh workers.
+    """
+
+    def __init__(self, workers: int, queue_depth: int = 64, retry_after: float = 0.5):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self.retry_after = retry_after
+        self.depth = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.restarts = 0
+        self.wait = Histogram()
+        self._group_caches: Dict[int, Tuple[int, int, int, int]] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking would copy the server's threads and locks into the workers.
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def handshake(
+        self,
+        msg: Dict[str, Any],
+        *,
+        client_id: Optional[int],
+        use_mac: bool,
+        allow_binary: bool = True,
+        session_cache: Optional[SessionCache] = None,
+    ) -> HandshakeResult:
+        """Blocking counterpart of handshake.server_handshake for thread-per-client servers."""
+        if "ticket" in msg:
+            return server_handshake(
+                msg, client_id=client_id, use_mac=use_mac, allow_binary=allow_binary, session_cache=session_cache
+            )
+        fmt = negotiate_format(msg, allow_binary)
+        p, g, A = parse_full_hello(msg)
+        fut = self._submit(p, g, A)
+        if fut is None:
+            return self._busy(p, fmt)
+        try:
+            B, shared = fut.result()[:2]
+        except (CancelledError, RuntimeError) as e:
+            return self._failed(p, fmt, e)
+        return complete_full_handshake(
+            p, g, A, B, shared, fmt, client_id=client_id, use_mac=use_mac, session_cache=session_cache
+        )
+
+    async def handshake_async(
+        self,
+        msg: Dict[str, Any],
+        *,
+        client_id: Optional[int],
+        use_mac: bool,
+        allow_binary: bool = True,
+        session_cache: Optional[SessionCache] = None,
+    ) -> HandshakeResult:
+        if "ticket" in msg:
+            return server_handshake(
+                msg, client_id=client_id, use_mac=use_mac, allow_binary=allow_binary, session_cache=session_cache
+            )
+        fmt = negotiate_format(msg, allow_binary)
+        p, g, A = parse_full_hello(msg)
+        fut = self._submit(p, g, A)
+        if fut is None:
+            return self._busy(p, fmt)
+        try:
+            B, shared = (await asyncio.wrap_future(fut))[:2]
+        except asyncio.CancelledError as e:
+            # Cancelling this task cancels `fut` too; only the pool's own cancellation is ours to answer.
+            if asyncio.current_task().cancelling():
+                raise
+            return self._failed(p, fmt, e)
+        except RuntimeError as e:
+            return self._failed(p, fmt, e)
+        return complete_full_handshake(
+            p, g, A, B, shared, fmt, client_id=client_id, use_mac=use_mac, session_cache=session_cache
+        )
+
+    def _submit(self, p: int, g: int, A: int) -> Optional[Future]:
+        with self._lock:
+            if self.depth >= self.capacity:
+                self.rejected += 1
+                return None
+            self.depth += 1
+            self.submitted += 1
+            executor = self._executor
+        try:
+            try:
+                fut = executor.submit(_timed_compute, p, g, A, time.monotonic())
+            except BrokenExecutor:
+                # A worker died earlier; the executor refuses new work until replaced.
+                fut = self._replace(executor).submit(_timed_compute, p, g, A, time.monotonic())
+        except RuntimeError as e:  # shut down (or broken again): fail like an accepted handshake would
+            fut = Future()
+            fut.set_exception(e)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _replace(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is broken and not self._closed:
+                self._executor = self._new_executor()
+                self.restarts += 1
+            executor = self._executor
+        broken.shutdown(wait=False)
+        return executor
+
+    def _done(self, fut: Future) -> None:
+        with self._lock:
+            self.depth -= 1
+            if not fut.cancelled() and fut.exception() is None:
+                _, _, wait, pid, cache = fut.result()
+                self.wait.observe(wait)
+                self._group_caches[pid] = cache
+
+    def _failed(self, p: int, fmt: str, error: BaseException) -> HandshakeResult:
+        # Cancelled by shutdown() or lost with a dead worker: the client may retry.
+        with self._lock:
+            self.failed += 1
+        print(f"[server] handshake pool: handshake not completed ({type(error).__name__}); replying SERVER_BUSY")
+        return self._busy(p, fmt)
+
+    def _busy(self, p: int, fmt: str) -> HandshakeResult:
+        return HandshakeResult(channel=None, p=p, fmt=fmt, reply=make_server_busy(self.retry_after), busy=True)
+
+    def group_cache_info(self) -> str:
+        """Validated-group cache counters summed over the worker processes."""
+        with self._lock:
+            caches = list(self._group_caches.values())
+        totals = [sum(column) for column in zip(*caches)] if caches else [0, 0, 0, 0]
+        return f"{format_group_cache(*totals)} in {len(caches)} worker process(es)"
+
+    def report(self) -> List[str]:
+        with self._lock:
+            line = (
+                f"[server] handshake pool: workers={self.workers} depth={self.depth}/{self.capacity} "
+                f"submitted={self.submitted} rejected={self.rejected} failed={self.failed} restarts={self.restarts}"
+            )
+            if self.wait.count:
+                line += (
+                    f" wait avg={self.wait.sum / self.wait.count * 1000:.3f}ms "
+                    f"p99<={self.wait.quantile(0.99) * 1000:g}ms"
+                )
+        return [line]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+        # Waiting matters: a process that exits with the pool still shutting
+        # down in the background can hang joining its workers.
+        self._executor.shutdown(wait=True, cancel_futures=True)
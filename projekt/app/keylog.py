@@ -1,14 +1,325 @@
 from __future__ import annotations
 
+import argparse
+import atexit
 import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+KEYLOG_MODES = ("sync", "async", "off")
+KEYLOG_POLICIES = ("drop", "block")
 
 
 def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
+def _utc_stamp() -> str:
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+def format_record(
+    *,
+    p: int,
+    g: int,
+    A: int,
+    B: int,
+    shared: int,
+    enc_key: bytes,
+    mac_key: bytes,
+    ticket: Optional[str] = None,
+    stamp: Optional[str] = None,
+) -> str:
+    if stamp is None:
+        stamp = _utc_stamp()
+    resumed = f" resumed={ticket}" if ticket is not None else ""
+    return (
+        f"[{stamp}] p={p} g={g} A={A} B={B} shared={shared}{resumed}\n"
+        f"enc_key_hex={enc_key.hex()}\n"
+        f"mac_key_hex={mac_key.hex()}\n"
+        "\n"
+    )
+
+
+@dataclass
+class KeyRecord:
+    """One parsed key-log record; `client_id` is None for client-side logs."""
+
+    role: str
+    client_id: Optional[int]
+    timestamp: str
+    p: int
+    g: int
+    A: int
+    B: int
+    shared: int
+    enc_key: bytes
+    mac_key: bytes
+    ticket: Optional[str] = None
+
+
+_RECORD_HEADER = re.compile(
+    r"^\[(?P<ts>[^\]]+)\] p=(?P<p>\d+) g=(?P<g>\d+) A=(?P<A>\d+) B=(?P<B>\d+) "
+    r"shared=(?P<shared>\d+)(?: resumed=(?P<ticket>\S+))?$"
+)
+# server_<id>.log, client.log and their rotated copies (.1, .2, ...)
+_LOG_NAME = re.compile(r"^(?P<role>[a-z]+)(?:_(?P<id>\d+))?\.log(?:\.\d+)?$")
+
+
+def parse_keylog(lines: Iterable[str], role: str, client_id: Optional[int]) -> Iterator[KeyRecord]:
+    """Parse the text written by format_record; incomplete records are skipped."""
+    header = None
+    keys: Dict[str, bytes] = {}
+    for line in lines:
+        line = line.strip()
+        m = _RECORD_HEADER.match(line)
+        if m is not None:
+            header, keys = m, {}
+            continue
+        name, sep, value = line.partition("=")
+        if header is None or not sep or name not in ("enc_key_hex", "mac_key_hex"):
+            continue
+        keys[name] = bytes.fromhex(value)
+        if len(keys) == 2:
+            yield KeyRecord(
+                role=role,
+                client_id=client_id,
+                timestamp=header["ts"],
+                p=int(header["p"]),
+                g=int(header["g"]),
+                A=int(header["A"]),
+                B=int(header["B"]),
+                shared=int(header["shared"]),
+                enc_key=keys["enc_key_hex"],
+                mac_key=keys["mac_key_hex"],
+                ticket=header["ticket"],
+            )
+            header = None
+
+
+def read_keylog_dir(out_dir: str = "keys") -> Iterator[KeyRecord]:
+    """Yield the records of every key-log file in `out_dir`, rotated ones included."""
+    for name in sorted(os.listdir(out_dir)):
+        m = _LOG_NAME.match(name)
+        if m is None:
+            continue
+        client_id = int(m["id"]) if m["id"] is not None else None
+        with open(os.path.join(out_dir, name), encoding="utf-8") as f:
+            yield from parse_keylog(f, m["role"], client_id)
+
+
+class KeyLogWriter:
+    """Appends key-log records, optionally batched from a background thread.
+
+    With `background=True`, `submit()` only enqueues; a writer thread drains
+    the queue in batches and keeps the log files open. When the queue is full
+    the `policy` decides whether the record is dropped or the caller waits.
+    Files are rotated to `<name>.1`, `<name>.2`, ... once they exceed
+    `max_bytes` or are older than `rotate_interval` seconds (0 disables).
+    With a `store` (keystore.KeyStore), each batch is also inserted there in
+    one transaction.
+    """
+
+    def __init__(
+        self,
+        out_dir: str = "keys",
+        *,
+        background: bool = True,
+        queue_size: int = 10_000,
+        policy: str = "drop",
+        batch_size: int = 256,
+        flush_interval: float = 0.2,
+        max_bytes: int = 0,
+        rotate_interval: float = 0.0,
+        backup_count: int = 5,
+        max_open_files: int = 64,
+        store=None,
+    ):
+        if policy not in KEYLOG_POLICIES:
+            raise ValueError(f"unknown keylog policy: {policy}")
+        self.out_dir = out_dir
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.max_open_files = max_open_files
+        self.store = store
+
+        self.written = 0
+        self.dropped = 0
+
+        # Server key logs are per client, so only the most recent handles stay open.
+        self._files: "OrderedDict[str, TextIO]" = OrderedDict()
+        self._born: Dict[str, float] = {}
+        self._io_lock = threading.Lock()
+        self._queue: Optional["queue.Queue[Optional[Tuple[str, str, Optional[KeyRecord]]]]"] = None
+        self._thread: Optional[threading.Thread] = None
+
+        _ensure_dir(out_dir)
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self._thread.start()
+
+    def submit(self, name: str, text: str, record: Optional[KeyRecord] = None) -> bool:
+        if self._queue is None:
+            with self._io_lock:
+                self._write_batch([(name, text, record)])
+            return True
+        try:
+            self._queue.put((name, text, record), block=self.policy == "block")
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        with self._io_lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+    def _writer_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch: List[Tuple[str, str, Optional[KeyRecord]]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            with self._io_lock:
+                self._write_batch(batch)
+            if item is None:
+                return
+
+    def _write_batch(self, batch: List[Tuple[str, str, Optional[KeyRecord]]]) -> None:
+        by_file: Dict[str, List[str]] = {}
+        for name, text, _ in batch:
+            by_file.setdefault(name, []).append(text)
+        for name, texts in by_file.items():
+            try:
+                self._append(name, "".join(texts))
+            except OSError as e:
+                print(f"[keylog] write to {name} failed: {e}")
+                continue
+            self.written += len(texts)
+        if self.store is not None:
+            records = [record for _, _, record in batch if record is not None]
+            try:
+                self.store.add_many(records)
+            except Exception as e:  # sqlite3.Error; the text logs above are already written
+                print(f"[keylog] store insert failed: {e}")
+
+    def _append(self, name: str, text: str) -> None:
+        path = os.path.join(self.out_dir, name)
+        f = self._files.pop(name, None) or self._open(name, path)
+        if self._needs_rotation(name, f):
+            f.close()
+            self._rotate(path)
+            self._born.pop(name, None)
+            f = self._open(name, path)
+        f.write(text)
+        f.flush()
+        self._files[name] = f
+        while len(self._files) > self.max_open_files:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+
+    def _open(self, name: str, path: str) -> TextIO:
+        self._born.setdefault(name, time.monotonic())
+        return open(path, "a", encoding="utf-8")
+
+    def _needs_rotation(self, name: str, f: TextIO) -> bool:
+        if self.max_bytes and f.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self._born[name] >= self.rotate_interval
+
+    def _rotate(self, path: str) -> None:
+        if self.backup_count <= 0:
+            os.remove(path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{path}.{i + 1}")
+        os.replace(path, f"{path}.1")
+
+
+_writer: Optional[KeyLogWriter] = None
+_enabled = True
+
+
+def configure_keylog(mode: str = "sync", out_dir: str = "keys", db_path: Optional[str] = None, **writer_opts) -> None:
+    """Select the key-log backend; "off" makes log_keys a no-op.
+
+    With `db_path`, records also go to an indexed keystore.KeyStore file.
+    """
+    global _writer, _enabled
+    if mode not in KEYLOG_MODES:
+        raise ValueError(f"unknown keylog mode: {mode}")
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+    _enabled = mode != "off"
+    if _enabled:
+        store = None
+        if db_path is not None:
+            from .keystore import KeyStore  # keystore imports this module
+
+            store = KeyStore(db_path)
+        _writer = KeyLogWriter(out_dir, background=mode == "async", store=store, **writer_opts)
+
+
+def add_keylog_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--keylog", choices=KEYLOG_MODES, default="sync", help="key-log backend")
+    parser.add_argument("--keylog-dir", default="keys", help="directory for key-log files")
+    parser.add_argument("--keylog-queue", type=int, default=10_000, help="async mode: max queued records")
+    parser.add_argument("--keylog-policy", choices=KEYLOG_POLICIES, default="drop", help="async mode: queue-full behaviour")
+    parser.add_argument("--keylog-max-bytes", type=int, default=0, help="rotate files above this size (0 disables)")
+    parser.add_argument("--keylog-rotate-interval", type=float, default=0.0, help="rotate files every N seconds (0 disables)")
+    parser.add_argument("--keylog-db", default=None, help="also record keys in this indexed SQLite store")
+
+
+def configure_keylog_from_args(args: argparse.Namespace) -> None:
+    configure_keylog(
+        args.keylog,
+        args.keylog_dir,
+        db_path=args.keylog_db,
+        queue_size=args.keylog_queue,
+        policy=args.keylog_policy,
+        max_bytes=args.keylog_max_bytes,
+        rotate_interval=args.keylog_rotate_interval,
+    )
+
+
+@atexit.register
+def _close_writer() -> None:
+    if _writer is not None:
+        _writer.close()
+
+
 def log_keys(
     *,
     role: str,
@@ -20,15 +331,26 @@ def log_keys(
     shared: int,
     enc_key: bytes,
     mac_key: bytes,
-    out_dir: str = "keys",
+    out_dir: Optional[str] = None,
+    ticket: Optional[str] = None,
 ) -> None:
-    _ensure_dir(out_dir)
-    stamp = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    global _writer
+    if not _enabled:
+        return
     suffix = f"_{client_id}" if client_id is not None else ""
-    fname = os.path.join(out_dir, f"{role}{suffix}.log")
-
-    with open(fname, "a", encoding="utf-8") as f:
-        f.write(f"[{stamp}] p={p} g={g} A={A} B={B} shared={shared}\n")
-        f.write(f"enc_key_hex={enc_key.hex()}\n")
-        f.write(f"mac_key_hex={mac_key.hex()}\n")
-        f.write("\n")
+    stamp = _utc_stamp()
+    text = format_record(
+        p=p, g=g, A=A, B=B, shared=shared, enc_key=enc_key, mac_key=mac_key, ticket=ticket, stamp=stamp
+    )
+    if out_dir is not None and (_writer is None or out_dir != _writer.out_dir):
+        one_off = KeyLogWriter(out_dir, background=False)
+        one_off.submit(f"{role}{suffix}.log", text)
+        one_off.close()
+        return
+    if _writer is None:
+        # Unconfigured callers keep the original behaviour: synchronous append.
+        _writer = KeyLogWriter(background=False)
+    record = None
+    if _writer.store is not None:
+        record = KeyRecord(role, client_id, stamp, p, g, A, B, shared, enc_key, mac_key, ticket)
+    _writer.submit(f"{role}{suffix}.log", text, record)
@@ -0,0 +1,206 @@
+import argparse
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+from .keylog import KeyRecord, format_record, read_keylog_dir
+
+# DH values can be thousands of bits, so they are stored as decimal text;
+# equality lookups through the indexes work the same.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    role TEXT NOT NULL,
+    client_id INTEGER,
+    p TEXT NOT NULL,
+    g TEXT NOT NULL,
+    A TEXT NOT NULL,
+    B TEXT NOT NULL,
+    shared TEXT NOT NULL,
+    enc_key BLOB NOT NULL,
+    mac_key BLOB NOT NULL,
+    ticket TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS keys_record ON keys(role, IFNULL(client_id, -1), ts, enc_key);
+CREATE INDEX IF NOT EXISTS keys_client ON keys(client_id, ts);
+CREATE INDEX IF NOT EXISTS keys_ts ON keys(ts);
+CREATE INDEX IF NOT EXISTS keys_a ON keys(A);
+CREATE INDEX IF NOT EXISTS keys_b ON keys(B);
+CREATE INDEX IF NOT EXISTS keys_ticket ON keys(ticket);
+"""
+
+_COLUMNS = "role, client_id, ts, p, g, A, B, shared, enc_key, mac_key, ticket"
+
+
+def _row(rec: KeyRecord) -> tuple:
+    return (
+        rec.role,
+        rec.client_id,
+        rec.timestamp,
+        str(rec.p),
+        str(rec.g),
+        str(rec.A),
+        str(rec.B),
+        str(rec.shared),
+        rec.enc_key,
+        rec.mac_key,
+        rec.ticket,
+    )
+
+
+def _record(row: tuple) -> KeyRecord:
+    role, client_id, ts, p, g, A, B, shared, enc_key, mac_key, ticket = row
+    return KeyRecord(
+        role=role,
+        client_id=client_id,
+        timestamp=ts,
+        p=int(p),
+        g=int(g),
+        A=int(A),
+        B=int(B),
+        shared=int(shared),
+        enc_key=bytes(enc_key),
+        mac_key=bytes(mac_key),
+        ticket=ticket,
+    )
+
+
+class KeyStore:
+    """Key-log records in an indexed SQLite file.
+
+    Holds the same fields as the text logs. Lookups by client id, time range,
+    public value (A or B) or ticket go through B-tree indexes, so they stay
+    O(log n) however many sessions were logged. Timestamps are the ISO-8601
+    UTC strings of the text logs, which sort chronologically. Re-adding a
+    record is a no-op, so importing the same logs twice is harmless. Safe to
+    share between threads; several processes may write the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        with self._lock:
+            # WAL lets readers query while a server keeps appending.
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+
+    def add_many(self, records: Iterable[KeyRecord]) -> int:
+        """Insert records in one transaction; returns how many were new."""
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO keys ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_row(rec) for rec in records),
+            )
+            return self._db.total_changes - before
+
+    def add(self, record: KeyRecord) -> bool:
+        return self.add_many([record]) == 1
+
+    def import_dir(self, keys_dir: str = "keys") -> int:
+        """Import every text key log in `keys_dir`; returns the number of new records."""
+        return self.add_many(read_keylog_dir(keys_dir))
+
+    def _query(self, where: str, args: tuple) -> List[KeyRecord]:
+        with self._lock:
+            rows = self._db.execute(f"SELECT {_COLUMNS} FROM keys WHERE {where} ORDER BY ts, id", args).fetchall()
+        return [_record(row) for row in rows]
+
+    def by_client(self, client_id: Optional[int]) -> List[KeyRecord]:
+        """Records of one server-side client id; None selects the client-side logs."""
+        if client_id is None:
+            return self._query("client_id IS NULL", ())
+        return self._query("client_id = ?", (client_id,))
+
+    def between(self, start: Optional[str] = None, end: Optional[str] = None) -> List[KeyRecord]:
+        """Records with start <= timestamp <= end (ISO-8601 prefixes such as "2024-05-01T10" work)."""
+        # A prefix as upper bound should include everything it covers.
+        return self._query("ts >= ? AND ts <= ?", (start or "", (end or "") + "\uffff"))
+
+    def by_public(self, value: int) -> List[KeyRecord]:
+        """Records where `value` is either public value, A or B."""
+        return self._query("A = ?1 OR B = ?1", (str(value),))
+
+    def by_handshake(self, p: int, g: int, A: int, B: int) -> List[KeyRecord]:
+        return self._query("A = ? AND B = ? AND p = ? AND g = ?", (str(A), str(B), str(p), str(g)))
+
+    def by_ticket(self, ticket: str) -> List[KeyRecord]:
+        return self._query("ticket = ?", (ticket,))
+
+    def __iter__(self) -> Iterator[KeyRecord]:
+        with self._lock:
+            rows = self._db.execute(f"SELECT {_COLUMNS} FROM keys ORDER BY ts, id").fetchall()
+        return (_record(row) for row in rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _print(records: List[KeyRecord]) -> None:
+    for rec in records:
+        who = rec.role if rec.client_id is None else f"{rec.role}_{rec.client_id}"
+        print(f"# {who}")
+        print(
+            format_record(
+                p=rec.p,
+                g=rec.g,
+                A=rec.A,
+                B=rec.B,
+                shared=rec.shared,
+                enc_key=rec.enc_key,
+                mac_key=rec.mac_key,
+                ticket=rec.ticket,
+                stamp=rec.timestamp,
+            ),
+            end="",
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Indexed key-log store (SQLite)")
+    parser.add_argument("--db", default="keys.db", help="store file")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="import text key logs")
+    imp.add_argument("keys_dir", nargs="?", default="keys")
+    query = sub.add_parser("query", help="look records up")
+    what = query.add_mutually_exclusive_group(required=True)
+    what.add_argument("--client", type=int, help="server-side client id")
+    what.add_argument("--client-log", action="store_true", help="records from the client's own log")
+    what.add_argument("--since", help="ISO-8601 start (with --until for a range)")
+    what.add_argument("--public", type=int, help="DH public value A or B")
+    what.add_argument("--ticket", help="session ticket id")
+    query.add_argument("--until", help="ISO-8601 end of the --since range")
+    args = parser.parse_args()
+
+    store = KeyStore(args.db)
+    try:
+        if args.cmd == "import":
+            added = store.import_dir(args.keys_dir)
+            print(f"[keystore] imported {added} new records ({len(store)} total) into {args.db}")
+            return
+        if args.client is not None:
+            records = store.by_client(args.client)
+        elif args.client_log:
+            records = store.by_client(None)
+        elif args.since is not None:
+            records = store.between(args.since, args.until)
+        elif args.public is not None:
+            records = store.by_public(args.public)
+        else:
+            records = store.by_ticket(args.ticket)
+        _print(records)
+        print(f"[keystore] {len(records)} record(s)")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import json
+import multiprocessing
+import random
+import string
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from .client import MiniTLSClient
+from .dh_params import DHParamPool
+from .keylog import configure_keylog
+
+OPS = ("data", "end", "reconnect")
+
+
+@dataclass
+class LoadConfig:
+    host: str
+    port: int
+    connections: int = 10
+    duration: float = 10.0
+    mix: Dict[str, float] = field(default_factory=lambda: {"data": 20.0, "end": 1.0, "reconnect": 0.0})
+    sizes: List[int] = field(default_factory=lambda: [64])
+    batch: int = 1
+    use_mac: bool = True
+    binary_records: bool = True
+    resume: bool = True
+    dh_bits: Optional[int] = None
+    seed: Optional[int] = None
+
+
+@dataclass
+class WorkerResult:
+    handshakes: int = 0
+    resumed: int = 0
+    messages: int = 0
+    payload_bytes: int = 0
+    ends: int = 0
+    reconnects: int = 0
+    errors: int = 0
+    handshake_ms: List[float] = field(default_factory=list)
+    data_ms: List[float] = field(default_factory=list)
+
+    def merge(self, other: "WorkerResult") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {op: 0.0 for op in OPS}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPS:
+            raise argparse.ArgumentTypeError(f"unknown op in mix: {name!r} (expected one of {', '.join(OPS)})")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("mix weights must not all be zero")
+    return mix
+
+
+def _worker(cfg: LoadConfig, pool: Optional[DHParamPool], deadline: float, rng: random.Random) -> WorkerResult:
+    res = WorkerResult()
+    ops = list(cfg.mix)
+    weights = [cfg.mix[op] for op in ops]
+    client = MiniTLSClient(
+        cfg.host,
+        cfg.port,
+        use_mac=cfg.use_mac,
+        binary_records=cfg.binary_records,
+        resume=cfg.resume,
+        dh_pool=pool,
+        dh_bits=cfg.dh_bits,
+        verbose=False,
+    )
+    while time.monotonic() < deadline:
+        try:
+            if client.sock is None:
+                client.connect()
+            if client.session is None:
+                # The server only accepts CLIENT_HELLO outside a session, so every
+                # op below runs on an established one.
+                t0 = time.perf_counter()
+                client.start_session()
+                res.handshake_ms.append((time.perf_counter() - t0) * 1000)
+                res.handshakes += 1
+                res.resumed += client.session.resumed
+                continue
+
+            op = rng.choices(ops, weights)[0]
+            if op == "data":
+                texts = ["".join(rng.choices(string.ascii_letters, k=rng.choice(cfg.sizes))) for _ in range(cfg.batch)]
+                t0 = time.perf_counter()
+                if cfg.batch == 1:
+                    client.send_data(texts[0])
+                else:
+                    client.send_iter(texts)
+                res.data_ms.append((time.perf_counter() - t0) * 1000 / cfg.batch)
+                res.messages += cfg.batch
+                res.payload_bytes += sum(len(t) for t in texts)
+            elif op == "end":
+                client.end_session()
+                res.ends += 1
+            else:
+                client.close()
+                res.reconnects += 1
+        except (ConnectionError, OSError, RuntimeError, ValueError):
+            res.errors += 1
+            client.close()
+            time.sleep(0.01)
+    client.close()
+    return res
+
+
+def run_threads(cfg: LoadConfig, connections: int, worker_seed: int) -> WorkerResult:
+    # Every thread talks to its own connection; the DH pool is shared.
+    pool = DHParamPool(max(4, connections), bits=cfg.dh_bits).start()
+    pool.get()
+    deadline = time.monotonic() + cfg.duration
+    results = [WorkerResult() for _ in range(connections)]
+
+    def run(i: int) -> None:
+        results[i] = _worker(cfg, pool, deadline, random.Random(worker_seed * 100_003 + i))
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pool.stop()
+
+    total = WorkerResult()
+    for r in results:
+        total.merge(r)
+    return total
+
+
+def _run_process(args) -> WorkerResult:
+    cfg, connections, seed = args
+    configure_keylog("off")
+    return run_threads(cfg, connections, seed)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "p50": round(rank(0.50), 3),
+        "p95": round(rank(0.95), 3),
+        "p99": round(rank(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def run_load(cfg: LoadConfig, processes: int = 1) -> Dict[str, object]:
+    base_seed = cfg.seed if cfg.seed is not None else random.randrange(1 << 30)
+    start = time.perf_counter()
+    if processes <= 1:
+        total = run_threads(cfg, cfg.connections, base_seed)
+    else:
+        # Client-side crypto is CPU bound too; spread connections over processes.
+        shares = [cfg.connections // processes + (i < cfg.connections % processes) for i in range(processes)]
+        jobs = [(cfg, n, base_seed + i) for i, n in enumerate(shares) if n]
+        with multiprocessing.Pool(len(jobs)) as mp:
+            total = WorkerResult()
+            for r in mp.map(_run_process, jobs):
+                total.merge(r)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "config": {**asdict(cfg), "processes": processes, "seed": base_seed},
+        "elapsed_s": round(elapsed, 3),
+        "handshakes": total.handshakes,
+        "resumed_handshakes": total.resumed,
+        "handshakes_per_s": round(total.handshakes / elapsed, 1),
+        "messages": total.messages,
+        "messages_per_s": round(total.messages / elapsed, 1),
+        "payload_bytes": total.payload_bytes,
+        "bytes_per_s": round(total.payload_bytes / elapsed, 1),
+        "end_sessions": total.ends,
+        "reconnects": total.reconnects,
+        "errors": total.errors,
+        # DATA is not acknowledged by the server, so message latency is the
+        # client-side seal + write time per message.
+        "latency_ms": {
+            "handshake": percentiles(total.handshake_ms),
+            "data": percentiles(total.data_ms),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless load generator for the mini TLS server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("-c", "--connections", type=int, default=10, help="concurrent connections")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--processes", type=int, default=1, help="spread connections over N processes")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="data=20,end=1,reconnect=0",
+        help="weights of ops run inside a session (a handshake starts every session)",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64], help="DATA payload sizes, picked at random")
+    parser.add_argument("--batch", type=int, default=1, help="DATA messages per op (>1 uses send_iter)")
+    parser.add_argument("--no-mac", action="store_true")
+    parser.add_argument("--json-records", action="store_true")
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("--dh-bits", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    configure_keylog("off")
+    cfg = LoadConfig(
+        host=args.host,
+        port=args.port,
+        connections=args.connections,
+        duration=args.duration,
+        mix=args.mix,
+        sizes=args.sizes,
+        batch=max(1, args.batch),
+        use_mac=not args.no_mac,
+        binary_records=not args.json_records,
+        resume=not args.no_resume,
+        dh_bits=args.dh_bits,
+        seed=args.seed,
+    )
+    report = json.dumps(run_load(cfg, args.processes), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,16 @@ from .crypto import xor_stream
 def main() -> None:
     parser = argparse.ArgumentParser(description="Manual decrypt helper for Wireshark demo")
     parser.add_argument("--enc-key-hex", required=True, help="enc_key in hex (from keys/*.log)")
-    parser.add_argument("--ciphertext-b64", required=True, help="ciphertext field (base64) from SECURE message")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--ciphertext-b64", help="ciphertext field (base64) from SECURE message")
+    src.add_argument("--ciphertext-hex", help="raw ciphertext (hex) from a binary SECURE record")
     args = parser.parse_args()
 
     enc_key = bytes.fromhex(args.enc_key_hex)
-    ciphertext = base64.b64decode(args.ciphertext_b64)
+    if args.ciphertext_hex is not None:
+        ciphertext = bytes.fromhex(args.ciphertext_hex)
+    else:
+        ciphertext = base64.b64decode(args.ciphertext_b64)
     plaintext = xor_stream(ciphertext, enc_key)
     print(plaintext.decode("utf-8", errors="replace"))
 
@@ -0,0 +1,198 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Upper bounds in seconds, Prometheus-style; the implicit last bucket is +Inf.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+COUNTERS = (
+    ("bytes_in", "Bytes received from clients"),
+    ("bytes_out", "Bytes sent to clients"),
+    ("frames_in", "Frames received from clients"),
+    ("frames_out", "Frames sent to clients"),
+    ("heartbeats", "HEARTBEAT keep-alive frames received"),
+    ("slow_consumer_drops", "Clients dropped because their outbound queue overflowed"),
+    ("handshakes", "Completed handshakes (full and resumed)"),
+    ("resumed", "Handshakes completed from a session ticket"),
+    ("handshakes_busy", "Handshakes answered SERVER_BUSY (handshake queue full, or the pool could not finish them)"),
+    ("mac_failures", "SECURE frames rejected by the MAC check"),
+    ("open_failures", "SECURE frames that failed to decrypt or parse"),
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf if past the last)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, c in zip(LATENCY_BUCKETS, self.counts):
+            seen += c
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class ClientMetrics:
+    """Counters of one connection.
+
+    Only the connection's own thread (or the event loop) updates them, so plain
+    attribute increments need no lock; readers take a best-effort snapshot.
+    """
+
+    __slots__ = tuple(name for name, _ in COUNTERS) + ("handshake_latency", "message_latency")
+
+    def __init__(self) -> None:
+        for name, _ in COUNTERS:
+            setattr(self, name, 0)
+        self.handshake_latency = Histogram()
+        self.message_latency = Histogram()
+
+    def merge(self, other: "ClientMetrics") -> None:
+        for name, _ in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.handshake_latency.merge(other.handshake_latency)
+        self.message_latency.merge(other.message_latency)
+
+
+def format_stats(m: ClientMetrics) -> str:
+    counters = " ".join(f"{name}={getattr(m, name)}" for name, _ in COUNTERS)
+    lines = [counters]
+    for label, h in (("handshake", m.handshake_latency), ("message", m.message_latency)):
+        if h.count:
+            avg_ms = h.sum / h.count * 1000
+            lines.append(
+                f"{label} latency: n={h.count} avg={avg_ms:.3f}ms "
+                f"p50<={h.quantile(0.5) * 1000:g}ms p99<={h.quantile(0.99) * 1000:g}ms"
+            )
+    return "\n".join(lines)
+
+
+class ServerMetrics:
+    def __init__(self, per_client_export: bool = False, handshake_pool=None):
+        self.per_client_export = per_client_export
+        # Optional handshake_pool.HandshakePool; its queue depth and waits are exported too.
+        self.handshake_pool = handshake_pool
+        self._live: Dict[int, ClientMetrics] = {}
+        self._retired = ClientMetrics()
+        self._lock = threading.Lock()
+
+    def register(self, client_id: int) -> ClientMetrics:
+        m = ClientMetrics()
+        with self._lock:
+            self._live[client_id] = m
+        return m
+
+    def retire(self, client_id: int) -> None:
+        # Fold a closed connection into the global totals so they never go down.
+        with self._lock:
+            m = self._live.pop(client_id, None)
+            if m is not None:
+                self._retired.merge(m)
+
+    def client(self, client_id: int) -> Optional[ClientMetrics]:
+        with self._lock:
+            return self._live.get(client_id)
+
+    def totals(self) -> ClientMetrics:
+        total = ClientMetrics()
+        with self._lock:
+            total.merge(self._retired)
+            live = list(self._live.values())
+        for m in live:
+            total.merge(m)
+        return total
+
+    def render_prometheus(self) -> str:
+        out: List[str] = []
+        total = self.totals()
+        with self._lock:
+            live = list(self._live.items()) if self.per_client_export else []
+            out.append("# HELP minitls_clients Currently connected clients")
+            out.append("# TYPE minitls_clients gauge")
+            out.append(f"minitls_clients {len(self._live)}")
+
+        for name, help_text in COUNTERS:
+            metric = f"minitls_{name}_total"
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} counter")
+            out.append(f"{metric} {getattr(total, name)}")
+            for cid, m in live:
+                out.append(f'{metric}{{client="{cid}"}} {getattr(m, name)}')
+
+        for name, attr, help_text in (
+            ("minitls_handshake_seconds", "handshake_latency", "Server-side handshake processing time"),
+            ("minitls_message_seconds", "message_latency", "Server-side SECURE message processing time"),
+        ):
+            _render_histogram(out, name, help_text, getattr(total, attr))
+
+        pool = self.handshake_pool
+        if pool is not None:
+            out.append("# HELP minitls_handshake_queue_depth Full handshakes queued or running in the pool")
+            out.append("# TYPE minitls_handshake_queue_depth gauge")
+            out.append(f"minitls_handshake_queue_depth {pool.depth}")
+            out.append("# HELP minitls_handshake_queue_capacity In-flight handshakes allowed before SERVER_BUSY")
+            out.append("# TYPE minitls_handshake_queue_capacity gauge")
+            out.append(f"minitls_handshake_queue_capacity {pool.capacity}")
+            _render_histogram(
+                out, "minitls_handshake_wait_seconds", "Time a full handshake waited for a pool worker", pool.wait
+            )
+        return "\n".join(out) + "\n"
+
+
+def _render_histogram(out: List[str], name: str, help_text: str, h: Histogram) -> None:
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} histogram")
+    cumulative = 0
+    for bound, c in zip(LATENCY_BUCKETS, h.counts):
+        cumulative += c
+        out.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+    out.append(f'{name}_bucket{{le="+Inf"}} {h.count}')
+    out.append(f"{name}_sum {h.sum:.6f}")
+    out.append(f"{name}_count {h.count}")
+
+
+def serve_metrics(metrics: ServerMetrics, host: str, port: int) -> ThreadingHTTPServer:
+    """Expose /metrics in Prometheus text format from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,221 @@
+import selectors
+import socket
+import threading
+from collections import deque
+from typing import Deque, List, Optional, Union
+
+from .metrics import ClientMetrics
+from .protocol import IOV_MAX
+
+# Default bound on bytes waiting to be written to one client.
+DEFAULT_OUTBOX_BYTES = 1 << 20
+
+# Non-blocking for one call only: the socket stays blocking for its reader thread.
+_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class Outbox:
+    """Bounded queue of encoded frames for one client, drained by a shared OutboxWriter.
+
+    `put` never blocks the caller: a client that lets more than `max_bytes`
+    pile up is a slow consumer, `put` returns False and the caller decides
+    what to do with it (the servers drop it). Whatever is queued when the
+    writer gets to the client goes out in one vectored write.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        metrics: ClientMetrics,
+        writer: "OutboxWriter",
+        max_bytes: int = DEFAULT_OUTBOX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.pending = 0
+        self._sock = sock
+        self._metrics = metrics
+        self._writer = writer
+        self._frames: Deque[Union[bytes, memoryview]] = deque()
+        self._cond = threading.Condition()
+        self._writing = False
+        self._closed = False
+        # Owned by the writer, under its lock: queued for a write or waiting for EVENT_WRITE.
+        self._scheduled = False
+        self._registered = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, frame: bytes) -> bool:
+        with self._cond:
+            if self._closed or self.pending + len(frame) > self.max_bytes:
+                return False
+            self._frames.append(frame)
+            self.pending += len(frame)
+        self._writer.schedule(self)
+        return True
+
+    def flush(self, timeout: float) -> bool:
+        """Wait until everything queued so far has been written; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed or not (self._frames or self._writing), timeout)
+
+    def close(self) -> None:
+        """Stop writing; frames still queued are discarded.
+
+        Returns only once no write of this outbox is in progress, so its
+        metrics are final afterwards and the socket can be closed.
+        """
+        with self._cond:
+            self._closed = True
+            self._frames.clear()
+            self.pending = 0
+            self._cond.notify_all()
+            if not self._writer.on_writer_thread():
+                self._cond.wait_for(lambda: not self._writing)
+        self._writer.forget(self)
+
+    def _write(self) -> Optional[bool]:
+        """One non-blocking vectored write (writer thread only).
+
+        True when the queue is drained, False when the socket is full,
+        None when the outbox is closed.
+        """
+        with self._cond:
+            if self._closed:
+                return None
+            if not self._frames:
+                return True
+            batch = [memoryview(frame) for frame in list(self._frames)[:IOV_MAX]]
+            self._writing = True
+        sent = 0
+        failed = False
+        try:
+            if hasattr(self._sock, "sendmsg"):
+                sent = self._sock.sendmsg(batch, [], _DONTWAIT)
+            else:
+                sent = self._sock.send(b"".join(batch), _DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            # The reading side notices the broken connection and drops the client.
+            failed = True
+        with self._cond:
+            self._writing = False
+            if not self._closed:
+                self._consume(sent)
+            self._cond.notify_all()
+            drained = not self._frames
+        if failed:
+            self.close()
+            return None
+        return drained
+
+    def _consume(self, sent: int) -> None:
+        # Under self._cond: drop what went out, counting only frames written in full.
+        self.pending -= sent
+        self._metrics.bytes_out += sent
+        while sent:
+            head = self._frames[0]
+            if sent < len(head):
+                self._frames[0] = memoryview(head)[sent:]
+                return
+            sent -= len(head)
+            self._frames.popleft()
+            self._metrics.frames_out += 1
+
+
+class OutboxWriter:
+    """One thread that writes the outboxes of every client of a server.
+
+    Writes are non-blocking; a client whose socket buffer is full waits in
+    a selector for EVENT_WRITE while the others keep being served, so the
+    thread count stays one reader per client plus this writer.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ready: Deque[Outbox] = deque()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def on_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def schedule(self, outbox: Outbox) -> None:
+        with self._lock:
+            if outbox._scheduled or self._stopped:
+                return
+            outbox._scheduled = True
+            self._ready.append(outbox)
+        self._wake()
+
+    def forget(self, outbox: Outbox) -> None:
+        # Unregister before the caller closes the socket, so a reused fd
+        # number cannot collide with a stale selector entry.
+        with self._lock:
+            if outbox._registered:
+                self._selector.unregister(outbox._sock)
+                outbox._registered = False
+                outbox._scheduled = False
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self._wake()
+        self._thread.join()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # a wake-up is already pending
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopped:
+                    break
+                batch: List[Outbox] = list(self._ready)
+                self._ready.clear()
+            for outbox in batch:
+                drained = outbox._write()
+                with self._lock:
+                    if drained is None or (drained and not outbox._frames):
+                        outbox._scheduled = False
+                    elif drained:
+                        # put() raced with the end of the write: go round again.
+                        self._ready.append(outbox)
+                    elif not outbox.closed:
+                        self._selector.register(outbox._sock, selectors.EVENT_WRITE, outbox)
+                        outbox._registered = True
+                    else:
+                        outbox._scheduled = False
+            with self._lock:
+                timeout = 0 if self._ready else None
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                with self._lock:
+                    outbox = key.data
+                    if outbox._registered:
+                        self._selector.unregister(outbox._sock)
+                        outbox._registered = False
+                        self._ready.append(outbox)
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
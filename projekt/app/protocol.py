@@ -1,48 +1,297 @@
+import asyncio
 import json
 import socket
 import struct
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+MAX_FRAME_SIZE = 10_000_000
 
-def send_json(sock: socket.socket, obj: Dict[str, Any]) -> None:
+# Every frame starts with a 4-byte big-endian header. JSON frames carry their
+# length there; since MAX_FRAME_SIZE < 2**24 their top byte is always 0. A
+# non-zero top byte marks a binary record: type (1 B) | length (3 B) followed
+# by the raw ciphertext and, for RECORD_SECURE, the raw 32-byte HMAC tag.
+# RECORD_STREAM_CHUNK carries one raw ciphertext chunk of a streamed payload;
+# its MAC travels in the closing STREAM_END message (see SecureChannel.iter_stream).
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+RECORD_JSON = 0x00
+RECORD_SECURE = 0x17
+RECORD_SECURE_NOMAC = 0x18
+RECORD_STREAM_CHUNK = 0x19
+TAG_SIZE = 32
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def encode_frame(obj: Dict[str, Any]) -> bytes:
+    return b"".join(encode_frame_parts(obj))
+
+
+def encode_frame_parts(obj: Dict[str, Any]) -> List[bytes]:
+    """Frame as a list of buffers; binary records keep ciphertext and tag unjoined."""
+    if obj.get("type") == "SECURE" and isinstance(obj.get("ciphertext"), (bytes, bytearray, memoryview)):
+        return secure_record_parts(obj["ciphertext"], obj.get("mac"))
+    if obj.get("type") == "STREAM_CHUNK" and isinstance(obj.get("ciphertext"), (bytes, bytearray, memoryview)):
+        return stream_chunk_parts(obj["ciphertext"])
     data = json.dumps(obj, separators=(",", ":")).encode("utf-8")
-    sock.sendall(struct.pack("!I", len(data)) + data)
+    return [struct.pack("!I", len(data)), data]
+
+
+def encode_secure_record(ciphertext: bytes, tag: Optional[bytes]) -> bytes:
+    return b"".join(secure_record_parts(ciphertext, tag))
+
+
+def secure_record_parts(ciphertext: bytes, tag: Optional[bytes]) -> List[bytes]:
+    if tag is None:
+        rtype, body_len = RECORD_SECURE_NOMAC, len(ciphertext)
+    else:
+        if len(tag) != TAG_SIZE:
+            raise ValueError("invalid tag length")
+        rtype, body_len = RECORD_SECURE, len(ciphertext) + TAG_SIZE
+    if body_len > MAX_FRAME_SIZE:
+        raise ValueError(f"invalid frame length: {body_len}")
+    header = struct.pack("!I", (rtype << 24) | body_len)
+    return [header, ciphertext] if tag is None else [header, ciphertext, tag]
+
+
+def stream_chunk_parts(ciphertext: bytes) -> List[bytes]:
+    if not 0 < len(ciphertext) <= MAX_FRAME_SIZE:
+        raise ValueError(f"invalid frame length: {len(ciphertext)}")
+    return [struct.pack("!I", (RECORD_STREAM_CHUNK << 24) | len(ciphertext)), ciphertext]
+
+
+def parse_frame_header(header: bytes) -> Tuple[int, int]:
+    (word,) = struct.unpack("!I", header)
+    rtype, length = word >> 24, word & 0xFFFFFF
+    if rtype not in (RECORD_JSON, RECORD_SECURE, RECORD_SECURE_NOMAC, RECORD_STREAM_CHUNK):
+        raise ValueError(f"unknown record type: {rtype:#x}")
+    if length <= 0 or length > MAX_FRAME_SIZE:
+        raise ValueError(f"invalid frame length: {length}")
+    if rtype == RECORD_SECURE and length < TAG_SIZE:
+        raise ValueError(f"record too short for tag: {length}")
+    return rtype, length
+
+
+def decode_frame(rtype: int, payload: bytes) -> Dict[str, Any]:
+    if rtype == RECORD_JSON:
+        return json.loads(payload.decode("utf-8"))
+    if rtype == RECORD_SECURE:
+        return make_secure(payload[:-TAG_SIZE], payload[-TAG_SIZE:])
+    if rtype == RECORD_STREAM_CHUNK:
+        return make_stream_chunk(payload)
+    return make_secure(payload, None)
+
+
+def send_json(sock: socket.socket, obj: Dict[str, Any]) -> None:
+    sock.sendall(encode_frame(obj))
+
+
+# Linux caps the iovec count of a single sendmsg() at IOV_MAX (1024).
+IOV_MAX = 1024
+
+
+def send_buffers(sock: socket.socket, buffers: List[bytes]) -> None:
+    """Write all buffers with vectored sendmsg() calls, resuming after partial sends."""
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(buffers))
+        return
+    views = [memoryview(b) for b in buffers if len(b)]
+    i = 0
+    while i < len(views):
+        sent = sock.sendmsg(views[i:i + IOV_MAX])
+        while sent and i < len(views):
+            n = len(views[i])
+            if sent >= n:
+                sent -= n
+                i += 1
+            else:
+                views[i] = views[i][sent:]
+                sent = 0
 
 
 def _recv_exact(sock: socket.socket, n: int) -> bytes:
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
             raise ConnectionError("connection closed")
-        buf += chunk
-    return buf
+        got += k
+    return bytes(buf)
 
 
 def recv_json(sock: socket.socket) -> Dict[str, Any]:
-    header = _recv_exact(sock, 4)
-    (length,) = struct.unpack("!I", header)
-    if length <= 0 or length > 10_000_000:
-        raise ValueError(f"invalid frame length: {length}")
-    payload = _recv_exact(sock, length)
-    return json.loads(payload.decode("utf-8"))
+    rtype, length = parse_frame_header(_recv_exact(sock, 4))
+    return decode_frame(rtype, _recv_exact(sock, length))
+
+
+class FrameReader:
+    """Buffered per-connection frame reader.
+
+    Reads with `recv_into` into one reusable, growable buffer, so a single
+    syscall can yield many small frames and large frames are assembled
+    without repeated concatenation. Iterating yields frames until the peer
+    closes the connection (ConnectionError).
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = 64 * 1024):
+        self.sock = sock
+        self._buf = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+        self.recv_calls = 0
+        self.frames = 0
+        self.bytes_received = 0
+
+    def recv_frame(self) -> Dict[str, Any]:
+        while True:
+            frame = self._next_buffered()
+            if frame is not None:
+                return frame
+            self._recv_more()
+
+    def recv_frames(self) -> List[Dict[str, Any]]:
+        """Block for at least one frame, then return every complete buffered frame."""
+        frames = [self.recv_frame()]
+        while True:
+            frame = self._next_buffered()
+            if frame is None:
+                return frames
+            frames.append(frame)
 
+    def has_buffered_frame(self) -> bool:
+        avail = self._end - self._start
+        if avail < 4:
+            return False
+        _, length = parse_frame_header(bytes(self._buf[self._start:self._start + 4]))
+        return avail >= 4 + length
 
-def make_client_hello(p: int, g: int, A: int) -> Dict[str, Any]:
-    return {"type": "CLIENT_HELLO", "p": p, "g": g, "A": A}
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            yield from self.recv_frames()
 
+    def _next_buffered(self) -> Optional[Dict[str, Any]]:
+        avail = self._end - self._start
+        if avail < 4:
+            self._reserve(4)
+            return None
+        rtype, length = parse_frame_header(bytes(self._buf[self._start:self._start + 4]))
+        if avail < 4 + length:
+            self._reserve(4 + length)
+            return None
+        begin = self._start + 4
+        payload = bytes(self._buf[begin:begin + length])
+        self._start = begin + length
+        if self._start == self._end:
+            self._start = self._end = 0
+        self.frames += 1
+        return decode_frame(rtype, payload)
 
-def make_server_hello(B: int) -> Dict[str, Any]:
-    return {"type": "SERVER_HELLO", "B": B}
+    def _reserve(self, frame_size: int) -> None:
+        # Make room for a whole frame starting at _start: compact first, grow if still short.
+        if len(self._buf) - self._start >= frame_size:
+            return
+        if self._start:
+            pending = self._end - self._start
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._start, self._end = 0, pending
+        if len(self._buf) < frame_size:
+            self._buf.extend(bytes(frame_size - len(self._buf)))
 
+    def _recv_more(self) -> None:
+        if self._end == len(self._buf):
+            self._reserve(len(self._buf) - self._start + 1)
+        with memoryview(self._buf) as view:
+            n = self.sock.recv_into(view[self._end:])
+        self.recv_calls += 1
+        if not n:
+            raise ConnectionError("connection closed")
+        self._end += n
+        self.bytes_received += n
+
+
+async def send_json_async(writer: asyncio.StreamWriter, obj: Dict[str, Any]) -> None:
+    writer.write(encode_frame(obj))
+    await writer.drain()
+
+
+async def recv_json_async(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    frame, _ = await recv_frame_async(reader)
+    return frame
+
+
+async def recv_frame_async(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], int]:
+    """Read one frame; also returns its size on the wire."""
+    try:
+        rtype, length = parse_frame_header(await reader.readexactly(4))
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionError("connection closed") from e
+    return decode_frame(rtype, payload), 4 + length
+
+
+def make_client_hello(p: int, g: int, A: int, formats: Optional[List[str]] = None) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {"type": "CLIENT_HELLO", "p": p, "g": g, "A": A}
+    if formats:
+        msg["formats"] = formats
+    return msg
+
+
+def make_resume_hello(ticket: str, nonce: bytes, formats: Optional[List[str]] = None) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {"type": "CLIENT_HELLO", "ticket": ticket, "nonce": nonce.hex()}
+    if formats:
+        msg["formats"] = formats
+    return msg
+
+
+def make_server_hello(B: int, fmt: str = FORMAT_JSON, ticket: Optional[str] = None) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {"type": "SERVER_HELLO", "B": B}
+    if fmt != FORMAT_JSON:
+        msg["format"] = fmt
+    if ticket is not None:
+        msg["ticket"] = ticket
+    return msg
 
-def make_secure(ciphertext_b64: str, mac_b64: Optional[str]) -> Dict[str, Any]:
-    msg: Dict[str, Any] = {"type": "SECURE", "ciphertext": ciphertext_b64}
-    if mac_b64 is not None:
-        msg["mac"] = mac_b64
+
+def make_resumed_hello(nonce: bytes, fmt: str = FORMAT_JSON) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {"type": "SERVER_HELLO", "resumed": True, "nonce": nonce.hex()}
+    if fmt != FORMAT_JSON:
+        msg["format"] = fmt
+    return msg
+
+
+def make_server_busy(retry_after: float) -> Dict[str, Any]:
+    return {"type": "SERVER_BUSY", "retry_after": retry_after}
+
+
+def make_heartbeat() -> Dict[str, Any]:
+    return {"type": "HEARTBEAT"}
+
+
+def make_resume_rejected() -> Dict[str, Any]:
+    return {"type": "SERVER_HELLO", "resumed": False}
+
+
+def negotiate_format(client_hello: Dict[str, Any], allow_binary: bool = True) -> str:
+    offered = client_hello.get("formats")
+    if allow_binary and isinstance(offered, list) and FORMAT_BINARY in offered:
+        return FORMAT_BINARY
+    return FORMAT_JSON
+
+
+def make_secure(ciphertext: Union[str, bytes], mac: Union[str, bytes, None]) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {"type": "SECURE", "ciphertext": ciphertext}
+    if mac is not None:
+        msg["mac"] = mac
     return msg
 
 
+def make_stream_chunk(ciphertext: Union[str, bytes]) -> Dict[str, Any]:
+    return {"type": "STREAM_CHUNK", "ciphertext": ciphertext}
+
+
 def parse_int_field(obj: Dict[str, Any], field: str) -> int:
     if field not in obj:
         raise ValueError(f"missing field: {field}")
@@ -60,3 +309,11 @@ def parse_str_field(obj: Dict[str, Any], field: str) -> str:
     if not isinstance(val, str):
         raise ValueError(f"field {field} must be str")
     return val
+
+
+def parse_hex_field(obj: Dict[str, Any], field: str) -> bytes:
+    val = parse_str_field(obj, field)
+    try:
+        return bytes.fromhex(val)
+    except ValueError:
+        raise ValueError(f"field {field} must be hex") from None
@@ -1,37 +1,222 @@
+import hashlib
+import hmac
 import json
-from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import Executor
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
-from .crypto import b64d, b64e, mac_tag, xor_stream
+from .crypto import KeyStream, b64d, b64e
+
+# Ciphertext and tag travel as base64 text in JSON frames and as raw bytes in
+# binary records (see protocol.encode_secure_record).
+Blob = Union[str, bytes]
+
+
+class MacError(ValueError):
+    """A SECURE frame failed (or lacked) its integrity check."""
+
+
+def _raw(blob: Blob) -> bytes:
+    return b64d(blob) if isinstance(blob, str) else blob
+
+
+class StreamSealer:
+    """Encrypts one streamed payload chunk by chunk.
+
+    The XOR continues at the running byte offset, and the MAC of the whole
+    ciphertext is built incrementally; `finish()` seals it into STREAM_END.
+    """
+
+    def __init__(self, channel: "SecureChannel"):
+        self._channel = channel
+        self._hmac = channel._mac_state.copy() if channel.use_mac else None
+        self.length = 0
+
+    def seal_chunk(self, data) -> Blob:
+        ciphertext = self._channel._keystream.xor(data, self.length)
+        self.length += len(ciphertext)
+        if self._hmac is not None:
+            self._hmac.update(ciphertext)
+        return ciphertext if self._channel.binary else b64e(ciphertext)
+
+    def finish(self) -> Tuple[Blob, Optional[Blob]]:
+        end: Dict[str, Any] = {"type": "STREAM_END", "length": self.length}
+        if self._hmac is not None:
+            end["mac"] = self._hmac.hexdigest()
+        return self._channel.seal(end)
+
+
+class StreamOpener:
+    """Receiving side of StreamSealer."""
+
+    def __init__(self, channel: "SecureChannel"):
+        self._channel = channel
+        self._hmac = channel._mac_state.copy() if channel.use_mac else None
+        self.length = 0
+
+    def open_chunk(self, ciphertext: Blob) -> bytes:
+        raw = _raw(ciphertext)
+        if self._hmac is not None:
+            self._hmac.update(raw)
+        plaintext = self._channel._keystream.xor(raw, self.length)
+        self.length += len(raw)
+        return plaintext
+
+    def finish(self, end: Dict[str, Any]) -> None:
+        if end.get("type") != "STREAM_END":
+            raise ValueError(f"expected STREAM_END, got {end.get('type')}")
+        if end.get("length") != self.length:
+            raise MacError("stream length mismatch")
+        if self._hmac is None:
+            return
+        mac = end.get("mac")
+        if not isinstance(mac, str):
+            raise MacError("missing mac")
+        if not hmac.compare_digest(self._hmac.hexdigest(), mac):
+            raise MacError("bad mac")
 
 
 class SecureChannel:
-    def __init__(self, enc_key: bytes, mac_key: Optional[bytes], use_mac: bool = True):
+    def __init__(self, enc_key: bytes, mac_key: Optional[bytes], use_mac: bool = True, binary: bool = False):
         self.enc_key = enc_key
         self.mac_key = mac_key
-        
+        self.binary = binary
+        self._keystream = KeyStream(enc_key)
+
         self.use_mac = use_mac
         if self.use_mac and not self.mac_key:
             raise ValueError("MAC enabled but mac_key is missing")
+        # Keyed HMAC state (ipad/opad already absorbed); every tag starts from a copy.
+        self._mac_state = hmac.new(self.mac_key, digestmod=hashlib.sha256) if self.use_mac else None
 
-    def seal(self, inner_obj: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    def _tag(self, data) -> bytes:
+        h = self._mac_state.copy()
+        h.update(data)
+        return h.digest()
+
+    def seal(self, inner_obj: Dict[str, Any]) -> Tuple[Blob, Optional[Blob]]:
+        """Encrypt-then-MAC; base64 strings for JSON frames, raw bytes when binary."""
         plaintext = json.dumps(inner_obj, separators=(",", ":")).encode("utf-8")
-        ciphertext = xor_stream(plaintext, self.enc_key)
-        tag_b64: Optional[str] = None
-        if self.use_mac:
-            tag = mac_tag(self.mac_key, ciphertext)
-            tag_b64 = b64e(tag)
-        return b64e(ciphertext), tag_b64
+        ciphertext = self._keystream.xor(plaintext)
+        tag = self._tag(ciphertext) if self.use_mac else None
+        if self.binary:
+            return ciphertext, tag
+        return b64e(ciphertext), (b64e(tag) if tag is not None else None)
 
-    def open(self, ciphertext_b64: str, mac_b64: Optional[str]) -> Dict[str, Any]:
-        ciphertext = b64d(ciphertext_b64)
-        if self.use_mac:
-            if mac_b64 is None:
-                raise ValueError("missing mac")
-            expected = mac_tag(self.mac_key, ciphertext)
-            provided = b64d(mac_b64)
-            import hmac
-
-            if not hmac.compare_digest(expected, provided):
-                raise ValueError("bad mac")
-        plaintext = xor_stream(ciphertext, self.enc_key)
+    def open(self, ciphertext: Blob, mac: Optional[Blob]) -> Dict[str, Any]:
+        raw = _raw(ciphertext)
+        self._verify(raw, _raw(mac) if mac is not None else None)
+        plaintext = self._keystream.xor(raw)
         return json.loads(plaintext.decode("utf-8"))
+
+    def seal_into(self, inner_obj: Dict[str, Any], out) -> Tuple[int, Optional[bytes]]:
+        """Encrypt into a caller-supplied buffer; returns (length, raw tag)."""
+        plaintext = json.dumps(inner_obj, separators=(",", ":")).encode("utf-8")
+        n = self._keystream.xor_into(out, plaintext)
+        tag: Optional[bytes] = None
+        if self.use_mac:
+            tag = self._tag(memoryview(out)[:n])
+        return n, tag
+
+    def open_into(self, ciphertext, mac: Optional[bytes], out) -> int:
+        """Verify raw ciphertext and decrypt it into `out`; returns plaintext length."""
+        self._verify(ciphertext, mac)
+        return self._keystream.xor_into(out, ciphertext)
+
+    def open_batch(
+        self,
+        frames: Sequence[Tuple[Blob, Optional[Blob]]],
+        executor: Optional[Executor] = None,
+        slices: int = 4,
+        stop_types: Collection[str] = (),
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """Verify and decrypt several (ciphertext, mac) pairs in one call.
+
+        Returns one entry per opened frame, in order: the inner message, or
+        the exception that frame raised, so one bad frame does not hide the
+        rest. Opening stops after the first message whose type is in
+        `stop_types` (a message that changes the channel); the frames behind
+        it are not opened and the list is shorter than `frames`.
+
+        With an executor the batch is split into `slices` parts opened in
+        parallel. Only the HMAC releases the GIL - the XOR and json.loads
+        hold it - and bench_mac puts the HMAC at roughly 13-26% of open()
+        for 1 KiB-256 KiB frames, so threads gain little even on many cores.
+        """
+        if executor is None or len(frames) < 2:
+            return self._open_slice(frames, 0, stop_types, None)
+        step = -(-len(frames) // max(1, slices))
+        # Earliest stop message seen so far; later slices skip frames past it.
+        # A lost update between threads only costs wasted work, the cut below
+        # is taken from the results themselves.
+        stop = [len(frames)]
+        parts = [(frames[i:i + step], i) for i in range(0, len(frames), step)]
+        results: List[Union[Dict[str, Any], Exception]] = []
+        for part in executor.map(lambda p: self._open_slice(p[0], p[1], stop_types, stop), parts):
+            results.extend(part)
+        for i, inner in enumerate(results):
+            if isinstance(inner, dict) and inner.get("type") in stop_types:
+                return results[:i + 1]
+        return results
+
+    def _open_slice(
+        self,
+        frames: Sequence[Tuple[Blob, Optional[Blob]]],
+        base: int,
+        stop_types: Collection[str],
+        stop: Optional[List[int]],
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        results: List[Union[Dict[str, Any], Exception]] = []
+        for i, (ciphertext, mac) in enumerate(frames, base):
+            if stop is not None and i > stop[0]:
+                break
+            try:
+                inner = self.open(ciphertext, mac)
+            except Exception as e:
+                results.append(e)
+                continue
+            results.append(inner)
+            if isinstance(inner, dict) and inner.get("type") in stop_types:
+                if stop is not None:
+                    stop[0] = min(stop[0], i)
+                break
+        return results
+
+    def stream_sealer(self) -> StreamSealer:
+        return StreamSealer(self)
+
+    def stream_opener(self) -> StreamOpener:
+        return StreamOpener(self)
+
+    def iter_stream(self, frames: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        """Yield the plaintext chunks of a stream whose STREAM_BEGIN was just opened.
+
+        Consumes frames up to and including the sealed STREAM_END. Chunks are
+        yielded before the MAC can be checked, so a MacError at the end means
+        everything already yielded must be discarded.
+        """
+        opener = self.stream_opener()
+        for frame in frames:
+            ftype = frame.get("type")
+            if ftype == "STREAM_CHUNK":
+                ciphertext = frame.get("ciphertext")
+                if not isinstance(ciphertext, (str, bytes)):
+                    raise ValueError("malformed stream chunk")
+                yield opener.open_chunk(ciphertext)
+            elif ftype == "SECURE":
+                ciphertext, mac = frame.get("ciphertext"), frame.get("mac")
+                if not isinstance(ciphertext, (str, bytes)):
+                    raise ValueError("malformed secure message")
+                opener.finish(self.open(ciphertext, mac if isinstance(mac, (str, bytes)) else None))
+                return
+            elif ftype != "HEARTBEAT":
+                raise ValueError(f"unexpected {ftype} frame inside a stream")
+        raise ConnectionError("connection closed mid-stream")
+
+    def _verify(self, ciphertext, mac: Optional[bytes]) -> None:
+        if not self.use_mac:
+            return
+        if mac is None:
+            raise MacError("missing mac")
+        expected = self._tag(ciphertext)
+        if not hmac.compare_digest(expected, mac):
+            raise MacError("bad mac")
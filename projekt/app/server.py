@@ -1,18 +1,28 @@
 import argparse
+import os
+import select
 import socket
 import threading
-from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
-
-from .crypto import dh_generate_private, dh_public, dh_shared, kdf
-from .keylog import log_keys
-from .protocol import (
-    make_server_hello,
-    parse_int_field,
-    recv_json,
-    send_json,
-)
-from .secure_channel import SecureChannel
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from .admin import END_NO_SESSION, END_SENT, END_UNKNOWN, AdminTarget, ClientInfo, run_admin_loop
+from .admission import Admission
+from .async_server import AsyncMiniTLSServer
+from .dh_params import group_cache_info
+from .handshake import HandshakeResult, server_handshake
+from .handshake_pool import HandshakePool
+from .keylog import add_keylog_arguments, configure_keylog_from_args
+from .metrics import ClientMetrics, ServerMetrics, serve_metrics
+from .outbox import DEFAULT_OUTBOX_BYTES, Outbox, OutboxWriter
+from .protocol import FrameReader, encode_frame, make_secure
+from .secure_channel import MacError, SecureChannel
+from .session_cache import SessionCache
+from .streams import DEFAULT_STREAM, StreamMux, make_close_stream, stream_id
+from .workers import ShardedServer, serve_control
 
 
 @dataclass
@@ -20,35 +30,115 @@ class ClientState:
     client_id: int
     addr: Tuple[str, int]
     sock: socket.socket
-    lock: threading.Lock
+    outbox: Outbox
     channel: Optional[SecureChannel] = None
     dh_p: Optional[int] = None
-
-
-class MiniTLSServer:
-    def __init__(self, host: str, port: int, max_clients: int, use_mac: bool = True):
+    metrics: ClientMetrics = field(default_factory=ClientMetrics)
+    last_active: float = field(default_factory=time.monotonic)
+    streams: StreamMux = field(default_factory=StreamMux)
+
+
+# Inner messages after which the rest of a buffered batch needs a different channel.
+CHANNEL_CHANGES = ("END_SESSION", "STREAM_BEGIN")
+
+
+def _secure_fields(msg: Dict[str, Any]) -> Tuple[Any, Optional[Any]]:
+    mac = msg.get("mac")
+    return msg.get("ciphertext"), mac if isinstance(mac, (str, bytes)) else None
+
+
+def _input_waiting(sock: socket.socket, reader: FrameReader) -> bool:
+    return reader.has_buffered_frame() or bool(select.select([sock], [], [], 0)[0])
+
+
+class MiniTLSServer(AdminTarget):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_clients: int,
+        use_mac: bool = True,
+        binary_records: bool = True,
+        session_cache_size: int = 10_000,
+        session_ttl: float = 3600.0,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+        metrics_per_client: bool = False,
+        admission: Optional[Admission] = None,
+        reuse_port: bool = False,
+        stream_dir: Optional[str] = None,
+        handshake_workers: int = 0,
+        handshake_queue: int = 64,
+        handshake_retry_after: float = 0.5,
+        open_workers: int = 0,
+        admission_queue: int = 0,
+        admission_timeout: float = 5.0,
+        idle_timeout: float = 0.0,
+        idle_end_session: bool = False,
+        outbox_bytes: int = DEFAULT_OUTBOX_BYTES,
+    ):
         self.host = host
         self.port = port
         self.max_clients = max_clients
         self.use_mac = use_mac
+        self.binary_records = binary_records
+        self.session_cache: Optional[SessionCache] = (
+            SessionCache(session_cache_size, session_ttl) if session_cache_size > 0 else None
+        )
+        self.handshake_pool: Optional[HandshakePool] = (
+            HandshakePool(handshake_workers, handshake_queue, handshake_retry_after) if handshake_workers > 0 else None
+        )
+        self.metrics = ServerMetrics(per_client_export=metrics_per_client, handshake_pool=self.handshake_pool)
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.admission = admission if admission is not None else Admission(max_clients, admission_queue)
+        self.admission_timeout = admission_timeout
+        self.idle_timeout = idle_timeout
+        self.idle_end_session = idle_end_session
+        self.reaped = 0
+        self.outbox_bytes = outbox_bytes
+        # One thread writes every client's outbox; see outbox.OutboxWriter.
+        self._writer = OutboxWriter()
+        self.stream_dir = stream_dir
+        if stream_dir is not None:
+            os.makedirs(stream_dir, exist_ok=True)
+        # Shared by all connections; only used when several SECURE frames are buffered.
+        self._open_executor = ThreadPoolExecutor(open_workers) if open_workers > 0 else None
 
         self._server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self._server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         self._clients: Dict[int, ClientState] = {}
         self._clients_lock = threading.Lock()
-        self._next_id = 1
-        
+
         self._running = threading.Event()
         self._running.set()
 
     def start(self) -> None:
+        self._listen()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        run_admin_loop(self)
+
+    def run_worker(self, conn) -> None:
+        """Serve as one worker of a ShardedServer, taking console commands from `conn`."""
+        self._listen()
+        control = threading.Thread(target=serve_control, args=(self, conn))
+        control.start()
+        self._accept_loop()
+        # stop() runs on the control thread; let it finish before the process exits.
+        control.join()
+
+    def _listen(self) -> None:
         self._server_sock.bind((self.host, self.port))
         self._server_sock.listen()
         print(f"[server] listening on {self.host}:{self.port} (max_clients={self.max_clients})")
-
-        threading.Thread(target=self._accept_loop, daemon=True).start()
-        self._admin_loop()
+        if self.metrics_port is not None:
+            serve_metrics(self.metrics, self.metrics_host, self.metrics_port)
+            print(f"[server] metrics on http://{self.metrics_host}:{self.metrics_port}/metrics")
+        if self.idle_timeout > 0:
+            threading.Thread(target=self._reap_loop, daemon=True).start()
 
     def _accept_loop(self) -> None:
         while self._running.is_set():
@@ -56,59 +146,104 @@ class MiniTLSServer:
                 client_sock, addr = self._server_sock.accept()
             except OSError:
                 break
-
-            with self._clients_lock:
-                if len(self._clients) >= self.max_clients:
-                    # simplest behaviour: refuse
-                    client_sock.close()
-                    continue
-                cid = self._next_id
-                self._next_id += 1
-                state = ClientState(client_id=cid, addr=addr, sock=client_sock, lock=threading.Lock())
-                self._clients[cid] = state
-
-            print(f"[server] client#{cid} connected from {addr[0]}:{addr[1]}")
-            threading.Thread(target=self._client_loop, args=(state,), daemon=True).start()
+            # Waiting for a free slot happens on the connection's own thread.
+            threading.Thread(target=self._serve_connection, args=(client_sock, addr), daemon=True).start()
+
+    def _serve_connection(self, client_sock: socket.socket, addr: Tuple[str, int]) -> None:
+        cid = self.admission.acquire(self.admission_timeout)
+        if cid is None:
+            # no slot (queue full or wait timed out): refuse
+            client_sock.close()
+            return
+        metrics = self.metrics.register(cid)
+        with self._clients_lock:
+            state = ClientState(
+                client_id=cid,
+                addr=addr,
+                sock=client_sock,
+                outbox=Outbox(client_sock, metrics, self._writer, self.outbox_bytes),
+                metrics=metrics,
+            )
+            self._clients[cid] = state
+
+        print(f"[server] client#{cid} connected from {addr[0]}:{addr[1]}")
+        self._client_loop(state)
+
+    def _reap_loop(self) -> None:
+        interval = min(1.0, self.idle_timeout / 4)
+        while self._running.is_set():
+            time.sleep(interval)
+            deadline = time.monotonic() - self.idle_timeout
+            self._reap([state for state in self._snapshot() if state.last_active < deadline])
+
+    def _reap(self, idle: List[ClientState], grace: float = 1.0) -> None:
+        if self.idle_end_session:
+            # Queue every END_SESSION first, then give the writer one shared
+            # `grace` period to deliver them before the sockets close.
+            ended = [state for state in idle if self._end_session(state) == END_SENT]
+            flush_deadline = time.monotonic() + grace
+            for state in ended:
+                state.outbox.flush(max(0.0, flush_deadline - time.monotonic()))
+        for state in idle:
+            print(f"[server] client#{state.client_id} idle for {self.idle_timeout:g}s -> reaped")
+            if self._drop_client(state.client_id):
+                self.reaped += 1
 
     def _client_loop(self, state: ClientState) -> None:
-        sock = state.sock
+        m = state.metrics
+        reader = FrameReader(state.sock)
+        pending: Deque[Dict[str, Any]] = deque()
+
+        def next_frames() -> Iterator[Dict[str, Any]]:
+            # One source for the whole connection: streams pull their chunk frames from it too.
+            while True:
+                if not pending:
+                    if state.streams.queued and not _input_waiting(state.sock, reader):
+                        # Nothing more to read yet: finish the queued stream messages before blocking.
+                        self._dispatch_streams(state)
+                    pending.extend(reader.recv_frames())
+                yield pending.popleft()
+
+        frames = next_frames()
         try:
-            while self._running.is_set():
-                msg = recv_json(sock)
+            for msg in frames:
+                if not self._running.is_set():
+                    break
+                m.frames_in = reader.frames - len(pending)
+                m.bytes_in = reader.bytes_received
+                state.last_active = time.monotonic()
+                started = time.perf_counter()
                 mtype = msg.get("type")
 
+                if mtype == "HEARTBEAT":
+                    # Keep-alive only: refreshes last_active, no reply.
+                    m.heartbeats += 1
+                    continue
+
                 if state.channel is None:
                     # Expect ClientHello plaintext
                     if mtype != "CLIENT_HELLO":
                         print(f"[server] client#{state.client_id} unexpected plaintext type={mtype}; closing")
                         break
 
-                    p = parse_int_field(msg, "p")
-                    g = parse_int_field(msg, "g")
-                    A = parse_int_field(msg, "A")
-
-                    b = dh_generate_private(p)
-                    B = dh_public(g, b, p)
-                    shared = dh_shared(A, b, p)
-                    enc_key, mac_key = kdf(shared)
-                    state.channel = SecureChannel(enc_key, mac_key, use_mac=self.use_mac)
-                    state.dh_p = p
-
-                    # For the final report: store keys so you can manually decrypt
-                    # payload captured in Wireshark.
-                    log_keys(
-                        role="server",
+                    handshake = self.handshake_pool.handshake if self.handshake_pool is not None else server_handshake
+                    hs = handshake(
+                        msg,
                         client_id=state.client_id,
-                        p=p,
-                        g=g,
-                        A=A,
-                        B=B,
-                        shared=shared,
-                        enc_key=enc_key,
-                        mac_key=mac_key,
+                        use_mac=self.use_mac,
+                        allow_binary=self.binary_records,
+                        session_cache=self.session_cache,
                     )
-                    send_json(sock, make_server_hello(B))
-                    print(f"[server] client#{state.client_id} handshake complete (p={p})")
+                    state.channel = hs.channel
+                    state.dh_p = hs.p if hs.channel is not None else None
+                    state.streams.reset()
+                    self._send(state, hs.reply)
+                    m.handshakes_busy += hs.busy
+                    if hs.channel is not None:
+                        m.handshakes += 1
+                        m.resumed += hs.resumed
+                        m.handshake_latency.observe(time.perf_counter() - started)
+                    self._log_handshake(state, hs)
                     continue
 
                 # After handshake: everything must be SECURE
@@ -116,128 +251,248 @@ class MiniTLSServer:
                     print(f"[server] client#{state.client_id} non-secure message after handshake; ignoring")
                     continue
 
-                ciphertext = msg.get("ciphertext")
-                mac = msg.get("mac")
-                if not isinstance(ciphertext, str):
-                    print(f"[server] client#{state.client_id} malformed secure message")
-                    continue
-
-                try:
-                    inner = state.channel.open(ciphertext, mac if isinstance(mac, str) else None)
-                except Exception as e:
-                    print(f"[server] client#{state.client_id} secure open failed: {e}")
-                    continue
-
-                inner_type = inner.get("type")
-                if inner_type == "DATA":
-                    text = inner.get("text")
-                    print(f"[server] client#{state.client_id} DATA: {text}")
-                elif inner_type == "END_SESSION":
-                    print(f"[server] client#{state.client_id} END_SESSION received -> session reset")
-                    state.channel = None
-                    state.dh_p = None
-                else:
-                    print(f"[server] client#{state.client_id} unknown inner type: {inner_type}")
+                # Open every SECURE frame already buffered behind this one in one call,
+                # up to the first message that changes the channel: the frames after
+                # it belong to the next session or to the stream, so they go back
+                # unopened.
+                run = [msg]
+                while pending and pending[0].get("type") == "SECURE":
+                    run.append(pending.popleft())
+                results = state.channel.open_batch(
+                    [_secure_fields(f) for f in run], self._open_executor, stop_types=CHANNEL_CHANGES
+                )
+                pending.extendleft(reversed(run[len(results):]))
+                for inner in results:
+                    self._handle_inner(state, inner, frames)
+                handled = len(results)
+                # One round per read: messages read next join the rotation (see next_frames).
+                self._dispatch_streams(state, rounds=None if state.streams.backlogged else 1)
+                m.frames_in = reader.frames - len(pending)
+                m.bytes_in = reader.bytes_received
+                per_message = (time.perf_counter() - started) / handled
+                for _ in range(handled):
+                    m.message_latency.observe(per_message)
 
         except (ConnectionError, OSError):
             pass
+        except ValueError as e:
+            print(f"[server] client#{state.client_id} protocol error: {e}")
         finally:
             self._drop_client(state.client_id)
 
-    def _drop_client(self, client_id: int) -> None:
+    def _handle_inner(self, state: ClientState, inner: Union[Dict[str, Any], Exception], frames) -> None:
+        m = state.metrics
+        if isinstance(inner, Exception):
+            if isinstance(inner, MacError):
+                m.mac_failures += 1
+            else:
+                m.open_failures += 1
+            print(f"[server] client#{state.client_id} secure open failed: {inner}")
+            return
+
+        inner_type = inner.get("type")
+        if inner_type in ("DATA", "CLOSE_STREAM"):
+            # Dispatched per logical stream once the batch is queued (_dispatch_streams).
+            self._queue_stream(state, inner)
+            return
+        # Anything else acts on the whole connection: let queued stream messages go first.
+        self._dispatch_streams(state)
+        if inner_type == "END_SESSION":
+            print(f"[server] client#{state.client_id} END_SESSION received -> session reset")
+            state.channel = None
+            state.dh_p = None
+            state.streams.reset()
+        elif inner_type == "STREAM_BEGIN":
+            self._receive_stream(state, frames)
+        else:
+            print(f"[server] client#{state.client_id} unknown inner type: {inner_type}")
+
+    def _queue_stream(self, state: ClientState, inner: Dict[str, Any]) -> None:
+        sid = stream_id(inner)
+        if sid is None:
+            print(f"[server] client#{state.client_id} invalid stream id {inner.get('sid')!r}; ignoring")
+        elif not state.streams.push(sid, inner):
+            print(f"[server] client#{state.client_id} stream {sid} refused: {len(state.streams)} streams open")
+            self._send_inner(state, make_close_stream(sid, refused=True))
+
+    def _dispatch_streams(self, state: ClientState, rounds: Optional[int] = None) -> None:
+        for stream, inner in state.streams.drain(rounds):
+            if inner.get("type") == "CLOSE_STREAM":
+                print(
+                    f"[server] client#{state.client_id} stream {stream.sid} closed "
+                    f"({stream.messages} messages, {stream.bytes} bytes)"
+                )
+                self._send_inner(state, make_close_stream(stream.sid))
+            elif stream.sid == DEFAULT_STREAM:
+                print(f"[server] client#{state.client_id} DATA: {inner.get('text')}")
+            else:
+                print(f"[server] client#{state.client_id} stream {stream.sid} DATA: {inner.get('text')}")
+
+    def _receive_stream(self, state: ClientState, frames) -> None:
+        path = None
+        sink = None
+        if self.stream_dir is not None:
+            path = os.path.join(self.stream_dir, f"client_{state.client_id}_{time.time_ns()}.bin")
+            sink = open(path, "wb")
+        total = 0
+        try:
+            for chunk in state.channel.iter_stream(frames):
+                state.last_active = time.monotonic()
+                total += len(chunk)
+                if sink is not None:
+                    sink.write(chunk)
+        except MacError as e:
+            state.metrics.mac_failures += 1
+            print(f"[server] client#{state.client_id} stream rejected after {total} bytes: {e}")
+            if path is not None:
+                sink.close()
+                os.remove(path)
+            return
+        finally:
+            if sink is not None:
+                sink.close()
+        saved = f" -> {path}" if path is not None else ""
+        print(f"[server] client#{state.client_id} STREAM received {total} bytes{saved}")
+
+    def _log_handshake(self, state: ClientState, hs: HandshakeResult) -> None:
+        if hs.busy:
+            print(f"[server] client#{state.client_id} handshake queue full -> asked to retry later")
+        elif hs.channel is None:
+            print(f"[server] client#{state.client_id} unknown session ticket -> full handshake required")
+        elif hs.resumed:
+            print(f"[server] client#{state.client_id} session resumed (p={hs.p}, format={hs.fmt})")
+        else:
+            print(f"[server] client#{state.client_id} handshake complete (p={hs.p}, format={hs.fmt})")
+
+    def _send(self, state: ClientState, obj: Dict[str, Any]) -> bool:
+        """Queue a frame for the shared writer thread; never blocks on the socket.
+
+        A client whose outbound queue is full is not reading fast enough and
+        is dropped. Returns False when the frame was not queued.
+        """
+        if state.outbox.put(encode_frame(obj)):
+            return True
+        if not state.outbox.closed:
+            # Counted before _drop_client() folds the metrics into the totals.
+            state.metrics.slow_consumer_drops += 1
+            print(f"[server] client#{state.client_id} outbound queue full -> slow consumer dropped")
+            self._drop_client(state.client_id)
+        return False
+
+    def _send_inner(self, state: ClientState, inner: Dict[str, Any]) -> bool:
+        channel = state.channel
+        if channel is None:
+            # The console or idle reaping ended the session while this reply was queued.
+            return False
+        ciphertext, mac = channel.seal(inner)
+        return self._send(state, make_secure(ciphertext, mac))
+
+    def _snapshot(self) -> List[ClientState]:
+        with self._clients_lock:
+            return list(self._clients.values())
+
+    def _drop_client(self, client_id: int) -> bool:
         with self._clients_lock:
             state = self._clients.pop(client_id, None)
-        if state is not None:
-            try:
-                state.sock.close()
-            except OSError:
-                pass
-            print(f"[server] client#{client_id} disconnected")
+        if state is None:
+            return False
+        self.admission.release()
+        # close() waits out a write in progress, so the counters are final when retired.
+        state.outbox.close()
+        self.metrics.retire(client_id)
+        try:
+            state.sock.close()
+        except OSError:
+            pass
+        print(f"[server] client#{client_id} disconnected")
+        return True
 
-    def _send_end_session(self, state: ClientState) -> None:
-        if state.channel is None:
-            print(f"[server] client#{state.client_id} has no active session")
-            return
-        ciphertext_b64, mac_b64 = state.channel.seal({"type": "END_SESSION"})
-        out = {"type": "SECURE", "ciphertext": ciphertext_b64}
-        if mac_b64 is not None:
-            out["mac"] = mac_b64
-        with state.lock:
-            send_json(state.sock, out)
+    # Console operations (see admin.AdminTarget).
+
+    def list_clients(self) -> List[ClientInfo]:
+        with self._clients_lock:
+            return [ClientInfo(cid, st.addr, st.channel is not None) for cid, st in self._clients.items()]
+
+    def end_client_session(self, client_id: int) -> str:
+        with self._clients_lock:
+            state = self._clients.get(client_id)
+        if state is None:
+            return END_UNKNOWN
+        return self._end_session(state)
+
+    def _end_session(self, state: ClientState) -> str:
+        channel = state.channel
+        if channel is None:
+            return END_NO_SESSION
+        ciphertext, mac = channel.seal({"type": "END_SESSION"})
+        if not self._send(state, make_secure(ciphertext, mac)):
+            return END_UNKNOWN
         state.channel = None
         state.dh_p = None
-        print(f"[server] END_SESSION sent to client#{state.client_id} - session reset")
-
-    def _admin_loop(self) -> None:
-        help_text = (
-            "Commands:\n"
-            "  list                 - show connected clients\n"
-            "  end <id>              - send encrypted EndSession to client\n"
-            "  kick <id>             - close TCP connection\n"
-            "  quit                  - stop server\n"
-        )
-        print(help_text)
+        return END_SENT
 
-        while self._running.is_set():
-            try:
-                line = input("server> ").strip()
-            except EOFError:
-                line = "quit"
+    def kick_client(self, client_id: int) -> bool:
+        return self._drop_client(client_id)
 
-            if not line:
-                continue
+    def end_all_sessions(self) -> int:
+        return sum(self._end_session(state) == END_SENT for state in self._snapshot())
 
-            parts = line.split()
-            cmd = parts[0].lower()
-
-            if cmd == "list":
-                with self._clients_lock:
-                    if not self._clients:
-                        print("[server] no clients")
-                        continue
-                    for cid, st in self._clients.items():
-                        session = "ON" if st.channel is not None else "OFF"
-                        print(f"  client#{cid} {st.addr[0]}:{st.addr[1]} session={session}")
-
-            elif cmd == "end" and len(parts) == 2:
-                try:
-                    cid = int(parts[1])
-                except ValueError:
-                    print("[server] invalid id")
-                    continue
-                with self._clients_lock:
-                    st = self._clients.get(cid)
-                if st is None:
-                    print("[server] no such client")
-                else:
-                    try:
-                        self._send_end_session(st)
-                    except Exception as e:
-                        print(f"[server] failed to send EndSession: {e}")
-
-            elif cmd == "kick" and len(parts) == 2:
-                try:
-                    cid = int(parts[1])
-                except ValueError:
-                    print("[server] invalid id")
-                    continue
-                self._drop_client(cid)
-
-            elif cmd == "quit":
-                print("[server] stopping...")
-                self._running.clear()
-                try:
-                    self._server_sock.close()
-                except OSError:
-                    pass
-                with self._clients_lock:
-                    ids = list(self._clients.keys())
-                for cid in ids:
-                    self._drop_client(cid)
-                break
+    def kick_idle(self, idle_for: float) -> int:
+        deadline = time.monotonic() - idle_for
+        return sum(self._drop_client(state.client_id) for state in self._snapshot() if state.last_active < deadline)
 
-            else:
-                print(help_text)
+    def broadcast(self, text: str) -> int:
+        sent = 0
+        for state in self._snapshot():
+            channel = state.channel
+            if channel is None:
+                continue
+            ciphertext, mac = channel.seal({"type": "DATA", "text": text})
+            sent += self._send(state, make_secure(ciphertext, mac))
+        return sent
+
+    def stats_totals(self) -> ClientMetrics:
+        return self.metrics.totals()
+
+    def client_stats(self, client_id: int) -> Optional[ClientMetrics]:
+        return self.metrics.client(client_id)
+
+    def cache_report(self) -> List[str]:
+        # With a handshake pool the groups are validated (and cached) in its workers.
+        groups = self.handshake_pool.group_cache_info() if self.handshake_pool is not None else group_cache_info()
+        lines = [f"[server] validated DH groups: {groups}"]
+        if self.session_cache is None:
+            lines.append("[server] session resumption disabled")
+        else:
+            stats = self.session_cache.stats()
+            lines.append("[server] session cache: " + " ".join(f"{k}={v}" for k, v in stats.items()))
+        if self.handshake_pool is not None:
+            lines.extend(self.handshake_pool.report())
+        lines.extend(self.admission.report())
+        queued = sum(state.outbox.pending for state in self._snapshot())
+        lines.append(f"[server] outbound queues: limit={self.outbox_bytes}B queued={queued}B")
+        if self.idle_timeout > 0:
+            lines.append(f"[server] idle reaping: timeout={self.idle_timeout:g}s reaped={self.reaped}")
+        return lines
+
+    def stop(self) -> None:
+        self._running.clear()
+        try:
+            # shutdown() wakes a thread blocked in accept(); close() alone does not.
+            self._server_sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self._server_sock.close()
+        except OSError:
+            pass
+        with self._clients_lock:
+            ids = list(self._clients.keys())
+        for cid in ids:
+            self._drop_client(cid)
+        self._writer.stop()
+        if self.handshake_pool is not None:
+            self.handshake_pool.shutdown()
 
 
 def main() -> None:
@@ -246,9 +501,88 @@ def main() -> None:
     parser.add_argument("--port", type=int, default=12345)
     parser.add_argument("--max-clients", type=int, required=True, help="maximum concurrent clients")
     parser.add_argument("--no-mac", action="store_true", help="disable MAC (variant W3-like)")
+    parser.add_argument(
+        "--engine",
+        choices=("thread", "asyncio"),
+        default="thread",
+        help="thread-per-client or single event loop",
+    )
+    parser.add_argument("--json-records", action="store_true", help="refuse binary records, always use JSON+base64")
+    parser.add_argument("--session-cache-size", type=int, default=10_000, help="resumable sessions kept (0 disables)")
+    parser.add_argument("--session-ttl", type=float, default=3600.0, help="session ticket lifetime in seconds")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus /metrics on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="bind address for the metrics endpoint")
+    parser.add_argument("--metrics-per-client", action="store_true", help="export per-client series too")
+    parser.add_argument("--stream-dir", default=None, help="save streamed payloads here (default: count and discard)")
+    parser.add_argument(
+        "--open-workers",
+        type=int,
+        default=0,
+        help="thread engine: threads that verify buffered SECURE frames in parallel (0 = inline)",
+    )
+    parser.add_argument(
+        "--handshake-workers",
+        type=int,
+        default=0,
+        help="processes that run full-handshake DH math (0 = inline in the client's thread/loop)",
+    )
+    parser.add_argument("--handshake-queue", type=int, default=64, help="handshakes queued before SERVER_BUSY")
+    parser.add_argument("--handshake-retry-after", type=float, default=0.5, help="retry hint sent with SERVER_BUSY")
+    parser.add_argument(
+        "--admission-queue",
+        type=int,
+        default=0,
+        help="connections that may wait (FIFO) for a slot when max_clients is reached (0 = refuse at once)",
+    )
+    parser.add_argument("--admission-timeout", type=float, default=5.0, help="seconds a queued connection waits")
+    parser.add_argument("--idle-timeout", type=float, default=0.0, help="close clients silent this long (0 disables)")
+    parser.add_argument("--idle-end-session", action="store_true", help="send END_SESSION before reaping an idle client")
+    parser.add_argument(
+        "--outbox-bytes",
+        type=int,
+        default=DEFAULT_OUTBOX_BYTES,
+        help="per-client limit of queued outbound bytes; a client over it is dropped as a slow consumer",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes sharing the port via SO_REUSEPORT (metrics port is offset per worker)",
+    )
+    add_keylog_arguments(parser)
     args = parser.parse_args()
-
-    srv = MiniTLSServer(args.host, args.port, args.max_clients, use_mac=not args.no_mac)
+    if args.open_workers and args.engine != "thread":
+        parser.error("--open-workers needs --engine thread")
+
+    server_cls = AsyncMiniTLSServer if args.engine == "asyncio" else MiniTLSServer
+    options = dict(
+        use_mac=not args.no_mac,
+        binary_records=not args.json_records,
+        session_cache_size=args.session_cache_size,
+        session_ttl=args.session_ttl,
+        metrics_port=args.metrics_port,
+        metrics_host=args.metrics_host,
+        metrics_per_client=args.metrics_per_client,
+        stream_dir=args.stream_dir,
+        handshake_workers=args.handshake_workers,
+        handshake_queue=args.handshake_queue,
+        handshake_retry_after=args.handshake_retry_after,
+        admission_queue=args.admission_queue,
+        admission_timeout=args.admission_timeout,
+        idle_timeout=args.idle_timeout,
+        idle_end_session=args.idle_end_session,
+        outbox_bytes=args.outbox_bytes,
+    )
+    if args.open_workers:
+        options["open_workers"] = args.open_workers
+    if args.workers > 1:
+        # Each worker configures its own key-log writer.
+        srv = ShardedServer(
+            server_cls, args.workers, args.host, args.port, args.max_clients, keylog_args=args, **options
+        )
+    else:
+        configure_keylog_from_args(args)
+        srv = server_cls(args.host, args.port, args.max_clients, **options)
     srv.start()
 
 
@@ -0,0 +1,67 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class ResumableSession:
+    master: bytes
+    p: int
+    g: int
+    created: float
+
+
+class SessionCache:
+    """Bounded LRU + TTL store of resumption secrets, keyed by ticket id."""
+
+    def __init__(self, capacity: int = 10_000, ttl: float = 3600.0):
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, ResumableSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def issue(self, master: bytes, p: int, g: int) -> str:
+        ticket = secrets.token_hex(16)
+        entry = ResumableSession(master=master, p=p, g=g, created=time.monotonic())
+        with self._lock:
+            self._entries[ticket] = entry
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return ticket
+
+    def lookup(self, ticket: str) -> Optional[ResumableSession]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(ticket)
+            if entry is not None and now - entry.created > self.ttl:
+                del self._entries[ticket]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ticket)
+            self.hits += 1
+            return entry
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,129 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+# Logical streams share one session: every inner DATA message may carry a
+# "sid" (stream id, default 0), and {"type": "CLOSE_STREAM", "sid": n} ends
+# stream n. Both travel inside SECURE frames, so the record format is
+# unchanged; the server acknowledges a close with its own CLOSE_STREAM.
+DEFAULT_STREAM = 0
+DEFAULT_QUANTUM = 4096
+MAX_STREAMS = 256
+MAX_BACKLOG = 256 * 1024
+
+
+def stream_id(inner: Dict[str, Any]) -> Optional[int]:
+    """The message's stream id, DEFAULT_STREAM when absent, None when malformed."""
+    sid = inner.get("sid", DEFAULT_STREAM)
+    if not isinstance(sid, int) or isinstance(sid, bool) or sid < 0:
+        return None
+    return sid
+
+
+def make_close_stream(sid: int, refused: bool = False) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {"type": "CLOSE_STREAM", "sid": sid}
+    if refused:
+        msg["refused"] = True
+    return msg
+
+
+def _cost(inner: Dict[str, Any]) -> int:
+    text = inner.get("text")
+    return max(1, len(text)) if isinstance(text, str) else 1
+
+
+@dataclass
+class LogicalStream:
+    sid: int
+    queue: Deque[Dict[str, Any]] = field(default_factory=deque)
+    deficit: int = 0
+    messages: int = 0
+    bytes: int = 0
+
+
+class StreamMux:
+    """Per-connection queues of logical streams, dispatched by deficit round robin.
+
+    Messages of one stream come out in arrival order; between streams, each
+    round gives every stream with queued work `quantum` bytes of text, so a
+    stream with a large backlog cannot hold back the others. Fairness spans
+    reads only if the caller leaves work queued: the servers dispatch one
+    round per read while more input is waiting (drain(rounds=1)), so messages
+    read later join the rotation, and drain everything once the input stops
+    or more than `max_backlog` bytes are queued. A stream is forgotten once
+    its CLOSE_STREAM has been dispatched.
+    """
+
+    def __init__(
+        self, quantum: int = DEFAULT_QUANTUM, max_streams: int = MAX_STREAMS, max_backlog: int = MAX_BACKLOG
+    ):
+        self.quantum = quantum
+        self.max_streams = max_streams
+        self.max_backlog = max_backlog
+        self.opened = 0
+        # Bytes of text waiting in all queues (see _cost).
+        self.queued = 0
+        self._streams: Dict[int, LogicalStream] = {}
+        self._ready: Deque[int] = deque()
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    @property
+    def backlogged(self) -> bool:
+        return self.queued > self.max_backlog
+
+    def push(self, sid: int, inner: Dict[str, Any]) -> bool:
+        """Queue a message; False when it would open one stream too many."""
+        stream = self._streams.get(sid)
+        if stream is None:
+            if len(self._streams) >= self.max_streams:
+                return False
+            stream = self._streams[sid] = LogicalStream(sid)
+            self.opened += 1
+        if not stream.queue:
+            self._ready.append(sid)
+        stream.queue.append(inner)
+        self.queued += _cost(inner)
+        return True
+
+    def drain(self, rounds: Optional[int] = None) -> Iterator[Tuple[LogicalStream, Dict[str, Any]]]:
+        """Yield queued (stream, message) pairs in fair order.
+
+        With `rounds`, stop after that many rounds (one visit to each stream
+        that was ready when the round began) and keep the rest queued.
+        """
+        while self._ready and (rounds is None or rounds > 0):
+            for _ in range(len(self._ready)):
+                yield from self._visit(self._streams[self._ready.popleft()])
+            if rounds is not None:
+                rounds -= 1
+
+    def _visit(self, stream: LogicalStream) -> Iterator[Tuple[LogicalStream, Dict[str, Any]]]:
+        stream.deficit += self.quantum
+        while stream.queue and _cost(stream.queue[0]) <= stream.deficit:
+            inner = stream.queue.popleft()
+            stream.deficit -= _cost(inner)
+            self.queued -= _cost(inner)
+            if inner.get("type") != "CLOSE_STREAM":
+                stream.messages += 1
+                stream.bytes += _cost(inner)
+                yield stream, inner
+                continue
+            if not stream.queue:
+                del self._streams[stream.sid]
+            yield stream, inner
+            # Messages queued behind the close reopen the stream.
+            stream.messages = stream.bytes = 0
+            if stream.queue:
+                self.opened += 1
+        if stream.queue:
+            self._ready.append(stream.sid)
+        else:
+            stream.deficit = 0
+
+    def reset(self) -> None:
+        """Forget every stream (the session they belonged to is gone)."""
+        self._streams.clear()
+        self._ready.clear()
+        self.queued = 0
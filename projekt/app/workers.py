@@ -0,0 +1,207 @@
+import argparse
+import multiprocessing
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .admin import END_UNKNOWN, AdminTarget, ClientInfo, run_admin_loop
+from .admission import SharedAdmission
+from .keylog import configure_keylog_from_args
+from .metrics import ClientMetrics
+
+# Console operations a worker answers over its control pipe.
+CONTROL_METHODS = (
+    "list_clients",
+    "end_client_session",
+    "kick_client",
+    "end_all_sessions",
+    "kick_idle",
+    "broadcast",
+    "stats_totals",
+    "client_stats",
+    "cache_report",
+    "stop",
+)
+
+
+def serve_control(target: AdminTarget, conn) -> None:
+    """Answer (method, args) requests from the supervisor until told to stop.
+
+    A closed pipe means the supervisor is gone, so the worker stops too.
+    """
+    while True:
+        try:
+            method, args = conn.recv()
+        except (EOFError, OSError):
+            target.stop()
+            return
+        if method not in CONTROL_METHODS:
+            conn.send(("error", f"unknown control method: {method}"))
+            continue
+        if method == "stop":
+            # Reply first: stopping lets the worker process exit under us.
+            conn.send(("ok", None))
+            target.stop()
+            return
+        try:
+            result = getattr(target, method)(*args)
+        except Exception as e:
+            conn.send(("error", str(e)))
+        else:
+            conn.send(("ok", result))
+
+
+def _worker_main(
+    server_cls: type,
+    server_kwargs: Dict[str, Any],
+    keylog_args: Optional[argparse.Namespace],
+    conn,
+) -> None:
+    if keylog_args is not None:
+        configure_keylog_from_args(keylog_args)
+    srv = server_cls(**server_kwargs)
+    srv.run_worker(conn)
+
+
+class ShardedServer(AdminTarget):
+    """Runs `workers` server processes accepting on one port via SO_REUSEPORT.
+
+    The kernel spreads incoming connections over the workers. Admission is
+    shared, so `max_clients` and client ids stay global, and the console in
+    this process drives every worker through a control pipe. Session tickets
+    live in each worker's own cache, so resumption only hits when the
+    reconnect lands on the same worker. With a metrics port, worker i serves
+    /metrics on `metrics_port + i`.
+    """
+
+    def __init__(
+        self,
+        server_cls: type,
+        workers: int,
+        host: str,
+        port: int,
+        max_clients: int,
+        keylog_args: Optional[argparse.Namespace] = None,
+        **server_kwargs: Any,
+    ):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("multiple workers need SO_REUSEPORT, which this platform lacks")
+        self.server_cls = server_cls
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.keylog_args = keylog_args
+        self.server_kwargs = server_kwargs
+
+        self._procs: List[multiprocessing.Process] = []
+        self._conns: list = []
+        self._locks: List[threading.Lock] = []
+
+    def start(self) -> None:
+        # spawn: a forked child would inherit the supervisor's threads and locks.
+        # Workers are not daemonic so they may start their own handshake pools;
+        # they exit on "stop" or when this process's end of the pipe closes.
+        ctx = multiprocessing.get_context("spawn")
+        admission = SharedAdmission(self.max_clients, ctx, self.server_kwargs.get("admission_queue", 0))
+        metrics_port = self.server_kwargs.get("metrics_port")
+
+        for i in range(self.workers):
+            kwargs = dict(
+                self.server_kwargs,
+                host=self.host,
+                port=self.port,
+                max_clients=self.max_clients,
+                admission=admission,
+                reuse_port=True,
+            )
+            if metrics_port is not None:
+                kwargs["metrics_port"] = metrics_port + i
+            parent_conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(self.server_cls, kwargs, self.keylog_args, child_conn),
+                name=f"minitls-worker-{i}",
+            )
+            proc.start()
+            child_conn.close()
+            self._procs.append(proc)
+            self._conns.append(parent_conn)
+            self._locks.append(threading.Lock())
+
+        print(f"[server] started {self.workers} workers on {self.host}:{self.port}")
+        try:
+            run_admin_loop(self)
+        finally:
+            # Also on errors: multiprocessing would otherwise wait for the workers at exit.
+            self.stop()
+
+    def _call(self, index: int, method: str, *args: Any) -> Any:
+        with self._locks[index]:
+            self._conns[index].send((method, args))
+            status, result = self._conns[index].recv()
+        if status != "ok":
+            raise RuntimeError(f"worker {index}: {result}")
+        return result
+
+    def _call_all(self, method: str, *args: Any) -> List[Tuple[int, Any]]:
+        """(worker index, result) for every live worker that answered."""
+        results = []
+        for i, proc in enumerate(self._procs):
+            if not proc.is_alive():
+                continue
+            try:
+                results.append((i, self._call(i, method, *args)))
+            except (EOFError, OSError):
+                print(f"[server] worker {i} is not responding")
+        return results
+
+    # Console operations (see admin.AdminTarget), fanned out to every worker.
+
+    def list_clients(self) -> List[ClientInfo]:
+        clients = [c for _, part in self._call_all("list_clients") for c in part]
+        return sorted(clients, key=lambda c: c.client_id)
+
+    def end_client_session(self, client_id: int) -> str:
+        # Ids are global, so at most one worker knows the client.
+        for _, status in self._call_all("end_client_session", client_id):
+            if status != END_UNKNOWN:
+                return status
+        return END_UNKNOWN
+
+    def kick_client(self, client_id: int) -> bool:
+        return any(kicked for _, kicked in self._call_all("kick_client", client_id))
+
+    def end_all_sessions(self) -> int:
+        return sum(n for _, n in self._call_all("end_all_sessions"))
+
+    def kick_idle(self, idle_for: float) -> int:
+        return sum(n for _, n in self._call_all("kick_idle", idle_for))
+
+    def broadcast(self, text: str) -> int:
+        return sum(n for _, n in self._call_all("broadcast", text))
+
+    def stats_totals(self) -> ClientMetrics:
+        total = ClientMetrics()
+        for _, part in self._call_all("stats_totals"):
+            total.merge(part)
+        return total
+
+    def client_stats(self, client_id: int) -> Optional[ClientMetrics]:
+        for _, part in self._call_all("client_stats", client_id):
+            if part is not None:
+                return part
+        return None
+
+    def cache_report(self) -> List[str]:
+        lines = []
+        for i, part in self._call_all("cache_report"):
+            lines.extend(line.replace("[server]", f"[server/worker {i}]", 1) for line in part)
+        return lines
+
+    def stop(self) -> None:
+        self._call_all("stop")
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
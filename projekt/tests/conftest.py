@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.async_server import AsyncMiniTLSServer
+from app.keylog import configure_keylog
+from app.server import MiniTLSServer
+
+
+@pytest.fixture(autouse=True)
+def keylog_dir(tmp_path):
+    """Keep key logs written by handshakes out of the working tree."""
+    configure_keylog(out_dir=str(tmp_path / "keys"))
+    yield tmp_path / "keys"
+    configure_keylog()
+
+
+def _start_thread(**options):
+    server = MiniTLSServer("127.0.0.1", 0, **options)
+    server._listen()
+    threading.Thread(target=server._accept_loop, daemon=True).start()
+    return server, server._server_sock.getsockname()[1]
+
+
+def _start_asyncio(**options):
+    server = AsyncMiniTLSServer("127.0.0.1", 0, **options)
+    threading.Thread(target=asyncio.run, args=(server._main(console=False),), daemon=True).start()
+    server._ready.wait(5)
+    return server, server._server.sockets[0].getsockname()[1]
+
+
+ENGINES = {"thread": _start_thread, "asyncio": _start_asyncio}
+
+
+@pytest.fixture(params=sorted(ENGINES))
+def serve(request):
+    """Start a server of each engine on an ephemeral loopback port: serve(**options) -> (server, port)."""
+    started = []
+
+    def start(max_clients=4, **options):
+        server, port = ENGINES[request.param](max_clients=max_clients, **options)
+        started.append(server)
+        return server, port
+
+    yield start
+    for server in started:
+        server.stop()
@@ -0,0 +1,96 @@
+import io
+import os
+import time
+
+import pytest
+
+from app.admin import END_NO_SESSION, END_SENT
+from app.client import MiniTLSClient
+
+asyncio_only = pytest.mark.parametrize("serve", ["asyncio"], indirect=True)
+
+
+def connect(port, **options):
+    client = MiniTLSClient("127.0.0.1", port, verbose=False, **options)
+    client.connect()
+    client.start_session()
+    return client
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+@asyncio_only
+def test_session_resumes_on_a_new_connection(serve):
+    server, port = serve()
+    client = connect(port)
+    client.send_data("first")
+    client.close()
+    client.connect()
+    client.start_session()
+    try:
+        assert client.session.resumed
+        client.send_data("second")
+        wait_for(lambda: server.stats_totals().frames_in >= 4)
+        totals = server.stats_totals()
+        assert totals.handshakes == 2 and totals.resumed == 1
+    finally:
+        client.close()
+
+
+@asyncio_only
+def test_console_operations_run_on_the_loop(serve):
+    server, port = serve()
+    client = connect(port)
+    try:
+        [info] = server.list_clients()
+        assert info.session
+        assert server.end_client_session(info.client_id) == END_SENT
+        wait_for(lambda: client.poll() == [{"type": "END_SESSION"}])
+        assert client.session is None
+        assert server.end_client_session(info.client_id) == END_NO_SESSION
+
+        assert server.kick_client(info.client_id)
+        # poll() returns lists until it sees the server close the connection.
+        with pytest.raises(ConnectionError):
+            wait_for(lambda: client.poll() is None)
+        assert server.list_clients() == []
+    finally:
+        client.close()
+
+
+@asyncio_only
+def test_stream_is_saved_off_the_loop(serve, tmp_path):
+    stream_dir = tmp_path / "streams"
+    server, port = serve(stream_dir=str(stream_dir))
+    client = connect(port)
+    payload = os.urandom(300_000)
+    try:
+        assert client.send_stream(io.BytesIO(payload)) == len(payload)
+        wait_for(lambda: any(stream_dir.iterdir()))
+        [saved] = stream_dir.iterdir()
+        wait_for(lambda: saved.stat().st_size == len(payload))
+        assert saved.read_bytes() == payload
+    finally:
+        client.close()
+
+
+@asyncio_only
+def test_idle_clients_are_reaped_and_heartbeats_keep_them(serve):
+    server, port = serve(idle_timeout=0.3)
+    idle = connect(port)
+    alive = connect(port)
+    try:
+        deadline = time.monotonic() + 0.9
+        while time.monotonic() < deadline:
+            alive.heartbeat()
+            time.sleep(0.05)
+        assert server.reaped == 1
+        assert [info.client_id for info in server.list_clients()] == [2]
+    finally:
+        idle.close()
+        alive.close()
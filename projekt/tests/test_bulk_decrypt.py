@@ -0,0 +1,127 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+from app.bulk_decrypt import BulkDecryptor, KeyIndex
+from app.capture import FrameSplitter
+from app.keylog import KeyRecord
+from app.protocol import (
+    FORMAT_BINARY,
+    encode_frame,
+    make_client_hello,
+    make_resume_hello,
+    make_resumed_hello,
+    make_secure,
+    make_server_hello,
+    make_stream_chunk,
+)
+from app.secure_channel import SecureChannel
+
+CLIENT = "10.0.0.2:40000"
+SERVER = "10.0.0.1:12345"
+
+
+def keys(n):
+    return bytes([n]) * 32, bytes([n + 100]) * 32
+
+
+def record(n, ticket=None):
+    enc_key, mac_key = keys(n)
+    return KeyRecord("client", None, "t", 23, 5, n, n + 1, 0, enc_key, mac_key, ticket)
+
+
+class Capture:
+    """Segments of one connection, as read_segments would yield them."""
+
+    def __init__(self):
+        self.segments = []
+
+    def send(self, frame, to_server=True):
+        src, dst = (CLIENT, SERVER) if to_server else (SERVER, CLIENT)
+        self.segments.append((len(self.segments) * 0.001, src, dst, encode_frame(frame)))
+
+    def full_handshake(self, n):
+        self.send(make_client_hello(23, 5, n))
+        self.send(make_server_hello(n + 1, FORMAT_BINARY), to_server=False)
+        return SecureChannel(*keys(n), binary=True)
+
+    def secure(self, channel, inner, to_server=True):
+        self.send(make_secure(*channel.seal(inner)), to_server)
+
+
+def run(capture, index, workers=0):
+    out = io.StringIO()
+    counts = BulkDecryptor(index, out, workers=workers, batch_size=3).run(capture.segments)
+    return [json.loads(line) for line in out.getvalue().splitlines()], counts
+
+
+def test_frame_splitter_joins_frames_across_segments():
+    data = encode_frame(make_client_hello(23, 5, 7)) + encode_frame({"type": "HEARTBEAT"})
+    splitter = FrameSplitter()
+    frames = []
+    for i in range(0, len(data), 5):
+        frames += splitter.feed(data[i:i + 5])
+    assert [f["type"] for f in frames] == ["CLIENT_HELLO", "HEARTBEAT"]
+    with pytest.raises(ValueError):
+        list(FrameSplitter().feed(b"\xff" * 8))
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_decrypts_in_capture_order_and_checks_macs(workers):
+    capture = Capture()
+    channel = capture.full_handshake(1)
+    for i in range(5):
+        capture.secure(channel, {"type": "DATA", "text": f"m{i}"})
+    ciphertext, mac = channel.seal({"type": "DATA", "text": "tampered"})
+    capture.send(make_secure(ciphertext, bytes(len(mac))))
+
+    lines, counts = run(capture, KeyIndex([record(1)]), workers)
+    assert [line["n"] for line in lines] == list(range(1, 9))
+    assert [line["inner"]["text"] for line in lines[2:7]] == [f"m{i}" for i in range(5)]
+    assert lines[7]["mac"] == "bad"
+    assert (counts["frames"], counts["ok"], counts["bad"]) == (8, 5, 1)
+
+
+def test_unknown_session_is_reported_not_decrypted():
+    capture = Capture()
+    channel = capture.full_handshake(2)
+    capture.secure(channel, {"type": "DATA", "text": "secret"})
+    lines, counts = run(capture, KeyIndex([record(1)]))
+    assert lines[-1]["error"] == "no key for session"
+    assert counts["no_key"] == 1
+
+
+def test_stream_is_summarised_chunk_by_chunk():
+    capture = Capture()
+    channel = capture.full_handshake(1)
+    payload = os.urandom(10_000)
+    capture.secure(channel, {"type": "STREAM_BEGIN"})
+    sealer = channel.stream_sealer()
+    for i in range(0, len(payload), 4096):
+        capture.send(make_stream_chunk(sealer.seal_chunk(payload[i:i + 4096])))
+    capture.send(make_secure(*sealer.finish()))
+    capture.secure(channel, {"type": "DATA", "text": "after"})
+
+    lines, counts = run(capture, KeyIndex([record(1)]))
+    stream = lines[3]
+    assert stream["type"] == "STREAM" and stream["chunks"] == 3
+    assert stream["length"] == len(payload)
+    assert stream["sha256"] == hashlib.sha256(payload).hexdigest()
+    assert stream["mac"] == "ok"
+    assert lines[4]["inner"]["text"] == "after"
+
+
+def test_resumed_sessions_are_told_apart_by_mac():
+    index = KeyIndex([record(3, ticket="t1"), record(4, ticket="t1")])
+    capture = Capture()
+    for n in (4, 3):
+        capture.send(make_resume_hello("t1", b"\0" * 16, [FORMAT_BINARY]))
+        capture.send(make_resumed_hello(b"\1" * 16, FORMAT_BINARY), to_server=False)
+        capture.secure(SecureChannel(*keys(n), binary=True), {"type": "DATA", "text": f"session {n}"})
+
+    lines, counts = run(capture, index)
+    assert [line["inner"]["text"] for line in lines if "inner" in line] == ["session 4", "session 3"]
+    assert counts["ok"] == 2
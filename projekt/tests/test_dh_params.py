@@ -0,0 +1,33 @@
+import pytest
+
+from app.crypto import dh_keypair, dh_shared
+from app.dh_params import check_client_group
+
+
+def test_keypair_avoids_degenerate_public_values():
+    # 3 has order 3 mod 13: a third of all private keys give g^a = 1.
+    publics = {dh_keypair(3, 13)[1] for _ in range(200)}
+    assert publics == {3, 9}
+    for A in publics:
+        check_client_group(13, 3, A)
+
+
+def test_both_sides_agree_on_the_secret():
+    p, g = 7919, 7
+    a, A = dh_keypair(g, p)
+    b, B = dh_keypair(g, p)
+    assert dh_shared(B, a, p) == dh_shared(A, b, p)
+
+
+@pytest.mark.parametrize(
+    "p, g, A, error",
+    [
+        (15, 2, 4, "invalid DH group"),
+        (13, 12, 4, "invalid DH group"),
+        (13, 3, 1, "invalid DH public value"),
+        (13, 3, 12, "invalid DH public value"),
+    ],
+)
+def test_client_group_checks(p, g, A, error):
+    with pytest.raises(ValueError, match=error):
+        check_client_group(p, g, A)
@@ -0,0 +1,55 @@
+import socket
+
+import pytest
+
+from app.protocol import TAG_SIZE, FrameReader, encode_frame, make_secure, make_stream_chunk
+
+TAG = bytes(range(TAG_SIZE))
+FRAMES = [
+    {"type": "HEARTBEAT"},
+    make_secure(b"first", TAG),
+    make_stream_chunk(b"x" * 1000),
+    make_secure(b"second", None),
+    {"type": "DATA", "text": "y" * 5000},
+]
+WIRE = b"".join(encode_frame(f) for f in FRAMES)
+
+
+def test_one_recv_yields_every_buffered_frame():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(WIRE)
+        reader = FrameReader(b)
+        assert reader.recv_frames() == FRAMES
+        assert reader.recv_calls == 1
+        assert not reader.has_buffered_frame()
+
+
+def test_small_buffer_grows_and_reassembles_split_frames():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(WIRE)
+        a.close()
+        reader = FrameReader(b, buffer_size=16)
+        got = []
+        while len(got) < len(FRAMES):
+            got.extend(reader.recv_frames())
+        assert got == FRAMES
+        assert reader.recv_calls > 1
+        assert reader.bytes_received == len(WIRE)
+        with pytest.raises(ConnectionError):
+            reader.recv_frame()
+
+
+def test_frame_split_across_sends_waits_for_the_rest():
+    a, b = socket.socketpair()
+    with a, b:
+        reader = FrameReader(b)
+        a.sendall(WIRE[:10])
+        b.settimeout(0.05)
+        with pytest.raises(socket.timeout):
+            reader.recv_frame()
+        assert not reader.has_buffered_frame()
+        a.sendall(WIRE[10:])
+        assert [reader.recv_frame() for _ in FRAMES] == FRAMES
+
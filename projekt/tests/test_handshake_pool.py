@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from app.client import MiniTLSClient
+from app.crypto import choose_dh_params, dh_keypair
+from app.handshake_pool import HandshakePool
+from app.protocol import make_client_hello
+
+
+def hello():
+    p, g = choose_dh_params(None)
+    return make_client_hello(p, g, dh_keypair(g, p)[1])
+
+
+@pytest.fixture
+def pool():
+    pool = HandshakePool(workers=1, queue_depth=8, retry_after=0.25)
+    yield pool
+    pool.shutdown()
+
+
+def handshake(pool):
+    return pool.handshake(hello(), client_id=1, use_mac=True)
+
+
+def test_full_handshake_runs_in_worker(pool):
+    hs = handshake(pool)
+    assert hs.channel is not None and not hs.busy
+    assert hs.reply["type"] == "SERVER_HELLO"
+    assert pool.depth == 0 and pool.submitted == 1
+
+
+def test_over_capacity_is_busy():
+    pool = HandshakePool(workers=1, queue_depth=0)
+    pool.depth = pool.capacity
+    try:
+        hs = handshake(pool)
+        assert hs.busy and hs.reply == {"type": "SERVER_BUSY", "retry_after": 0.5}
+        assert pool.rejected == 1
+    finally:
+        pool.depth = 0
+        pool.shutdown()
+
+
+def test_shutdown_answers_queued_handshakes_with_busy(pool):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(handshake(pool))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 5
+    while pool.submitted < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    # The worker is still starting up, so some handshakes are queued and get cancelled.
+    pool.shutdown()
+    for t in threads:
+        t.join(5)
+    assert len(results) == 4
+    assert pool.failed == sum(hs.busy for hs in results) > 0
+    assert all(hs.reply["type"] == "SERVER_BUSY" for hs in results if hs.channel is None)
+    # After shutdown nothing is submitted, but the caller still gets a reply.
+    assert handshake(pool).busy
+    assert pool.depth == 0
+
+
+def test_dead_worker_fails_queued_handshake_and_pool_is_replaced(pool):
+    pool._executor.submit(os._exit, 1)
+    assert handshake(pool).busy
+    assert pool.failed == 1
+    hs = handshake(pool)
+    assert hs.channel is not None
+    assert pool.restarts == 1 and pool.depth == 0
+
+
+def test_async_handshake_after_shutdown_is_busy(pool):
+    pool.shutdown()
+    hs = asyncio.run(pool.handshake_async(hello(), client_id=1, use_mac=True))
+    assert hs.busy and pool.failed == 1
+
+
+def test_servers_hand_full_handshakes_to_the_pool(serve):
+    server, port = serve(handshake_workers=1)
+    client = MiniTLSClient("127.0.0.1", port, resume=False, verbose=False)
+    client.connect()
+    try:
+        client.start_session()
+        client.send_data("hello")
+        assert server.handshake_pool.submitted == 1
+    finally:
+        client.close()
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from app.keylog import KeyRecord, configure_keylog, log_keys
+from app.keystore import KeyStore
+
+BIG = 2 ** 2047 + 981
+
+
+def rec(client_id, ts, A, B=5, ticket=None, role="server"):
+    return KeyRecord(role, client_id, ts, 23, 5, A, B, 7, bytes([A % 256]) * 32, bytes([B % 256]) * 32, ticket)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = KeyStore(str(tmp_path / "keys.db"))
+    yield store
+    store.close()
+
+
+def test_adding_the_same_record_twice_is_a_no_op(store):
+    records = [rec(1, "2024-05-01T10:00:00Z", 3), rec(None, "2024-05-01T10:00:00Z", 3, role="client")]
+    assert store.add_many(records) == 2
+    assert store.add_many(records) == 0
+    assert not store.add(records[0])
+    assert len(store) == 2
+
+
+def test_indexed_lookups(store):
+    store.add_many(
+        [
+            rec(1, "2024-05-01T10:00:00Z", 3),
+            rec(2, "2024-05-01T11:30:00Z", BIG, B=11),
+            rec(2, "2024-05-02T09:00:00Z", 4, ticket="t1"),
+            rec(None, "2024-05-01T11:30:00Z", BIG, B=11, role="client"),
+        ]
+    )
+    assert [r.A for r in store.by_client(2)] == [BIG, 4]
+    assert [r.role for r in store.by_client(None)] == ["client"]
+    # An ISO prefix as the upper bound covers the whole hour.
+    assert len(store.between("2024-05-01T10", "2024-05-01T11")) == 3
+    assert len(store.between(start="2024-05-02")) == 1
+    assert {r.client_id for r in store.by_public(BIG)} == {2, None}
+    assert {r.client_id for r in store.by_public(11)} == {2, None}
+    assert store.by_handshake(23, 5, BIG, 11)[0].A == BIG
+    assert store.by_handshake(23, 5, BIG, 12) == []
+    [resumed] = store.by_ticket("t1")
+    assert resumed == rec(2, "2024-05-02T09:00:00Z", 4, ticket="t1")
+
+
+def test_key_log_feeds_the_store_and_import_skips_duplicates(tmp_path):
+    db = str(tmp_path / "keys.db")
+    configure_keylog(out_dir=str(tmp_path / "logs"), db_path=db)
+    log_keys(role="server", client_id=3, p=23, g=5, A=BIG, B=9, shared=1, enc_key=b"e" * 32, mac_key=b"m" * 32)
+    log_keys(role="client", client_id=None, p=23, g=5, A=6, B=0, shared=2, enc_key=b"f" * 32, mac_key=b"n" * 32, ticket="tk")
+    configure_keylog(out_dir=str(tmp_path / "logs"))
+
+    store = KeyStore(db)
+    try:
+        assert len(store) == 2
+        assert store.by_client(3)[0].A == BIG
+        assert store.by_ticket("tk")[0].enc_key == b"f" * 32
+        assert store.import_dir(str(tmp_path / "logs")) == 0
+    finally:
+        store.close()
+
+
+def test_threads_share_one_store(store):
+    def add(client_id):
+        store.add_many(rec(client_id, f"2024-05-01T10:00:{i:02d}Z", i + 2) for i in range(50))
+
+    threads = [threading.Thread(target=add, args=(cid,)) for cid in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store) == 200
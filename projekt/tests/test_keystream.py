@@ -0,0 +1,49 @@
+import pytest
+
+from app.crypto import KeyStream, repeat_key, xor_bytes, xor_stream
+from app.secure_channel import SecureChannel
+
+KEY = bytes(range(32))
+PAYLOAD = bytes(range(256)) * 1000
+
+
+@pytest.mark.parametrize("offset", [0, 5, 31, 999, 12345])
+def test_xor_matches_repeated_key_across_blocks(offset):
+    stream = KeyStream(KEY, cache_limit=1000)
+    assert stream.xor(PAYLOAD, offset) == xor_stream(PAYLOAD, KEY, offset)
+    out = bytearray()
+    assert stream.xor_into(out, PAYLOAD, offset) == len(PAYLOAD)
+    assert bytes(out) == xor_stream(PAYLOAD, KEY, offset)
+
+
+def test_cache_stays_one_block():
+    stream = KeyStream(KEY, cache_limit=1000)
+    stream.xor(PAYLOAD)
+    stream.keystream(len(PAYLOAD))
+    assert len(stream._buf) <= 1000 + len(KEY)
+
+
+def test_xor_into_refuses_short_fixed_buffer():
+    with pytest.raises(ValueError):
+        KeyStream(KEY).xor_into(memoryview(bytearray(10)), PAYLOAD)
+
+
+def test_xor_bytes_is_its_own_inverse():
+    ks = repeat_key(KEY, len(PAYLOAD))
+    assert xor_bytes(xor_bytes(PAYLOAD, ks), ks) == PAYLOAD
+    assert xor_bytes(b"", b"") == b""
+
+
+@pytest.mark.parametrize("use_mac", [False, True])
+def test_seal_into_and_open_into_match_seal_and_open(use_mac):
+    sender = SecureChannel(KEY, KEY[::-1], use_mac=use_mac, binary=True)
+    receiver = SecureChannel(KEY, KEY[::-1], use_mac=use_mac, binary=True)
+    inner = {"type": "DATA", "text": "x" * 5000}
+    buf = bytearray(8192)
+    n, tag = sender.seal_into(inner, buf)
+    assert (bytes(buf[:n]), tag) == sender.seal(inner)
+
+    out = bytearray()
+    assert receiver.open_into(bytes(buf[:n]), tag, out) == n
+    assert receiver.open(bytes(buf[:n]), tag) == inner
+    assert out.startswith(b'{"type":"DATA"')
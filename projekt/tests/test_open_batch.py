@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.secure_channel import MacError, SecureChannel
+
+ENC_KEY = bytes(range(32))
+MAC_KEY = bytes(range(32, 64))
+
+
+def _pair():
+    return SecureChannel(ENC_KEY, MAC_KEY, binary=True), SecureChannel(ENC_KEY, MAC_KEY, binary=True)
+
+
+def test_reused_hmac_state_gives_fresh_tags():
+    sender, receiver = _pair()
+    first = sender.seal({"type": "DATA", "text": "a"})
+    second = sender.seal({"type": "DATA", "text": "a"})
+    assert first == second
+    assert receiver.open(*first) == receiver.open(*second) == {"type": "DATA", "text": "a"}
+
+
+def test_open_rejects_bad_and_missing_mac():
+    sender, receiver = _pair()
+    ciphertext, _ = sender.seal({"type": "DATA", "text": "x"})
+    with pytest.raises(MacError):
+        receiver.open(ciphertext, bytes(32))
+    with pytest.raises(MacError):
+        receiver.open(ciphertext, None)
+
+
+@pytest.mark.parametrize("workers", [0, 3])
+def test_open_batch_keeps_order_and_per_frame_errors(workers):
+    sender, receiver = _pair()
+    messages = [{"type": "DATA", "n": i} for i in range(10)]
+    frames = [sender.seal(m) for m in messages]
+    frames[4] = (frames[4][0], bytes(32))
+    executor = ThreadPoolExecutor(workers) if workers else None
+    try:
+        results = receiver.open_batch(frames, executor, slices=3)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    assert isinstance(results[4], MacError)
+    assert results[:4] + results[5:] == messages[:4] + messages[5:]
+
+
+@pytest.mark.parametrize("workers", [0, 3])
+def test_open_batch_stops_at_channel_change(workers):
+    sender, receiver = _pair()
+    messages = [{"type": "DATA", "n": i} for i in range(6)]
+    messages[3] = {"type": "END_SESSION"}
+    frames = [sender.seal(m) for m in messages]
+    frames[1] = (frames[1][0], bytes(32))
+    executor = ThreadPoolExecutor(workers) if workers else None
+    try:
+        results = receiver.open_batch(frames, executor, slices=3, stop_types=("END_SESSION",))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    assert len(results) == 4
+    assert isinstance(results[1], MacError)
+    assert [results[0], results[2], results[3]] == [messages[0], messages[2], messages[3]]
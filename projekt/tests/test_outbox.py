@@ -0,0 +1,99 @@
+import socket
+
+import pytest
+
+from app.client import MiniTLSClient
+from app.metrics import ClientMetrics
+from app.outbox import Outbox, OutboxWriter
+
+
+@pytest.fixture
+def writer():
+    writer = OutboxWriter()
+    yield writer
+    writer.stop()
+
+
+@pytest.fixture
+def pairs():
+    made = []
+
+    def make():
+        server_side, client_side = socket.socketpair()
+        made.append((server_side, client_side))
+        return server_side, client_side
+
+    yield make
+    for a, b in made:
+        a.close()
+        b.close()
+
+
+def recv_exactly(sock, n):
+    sock.settimeout(5)
+    data = bytearray()
+    while len(data) < n:
+        data += sock.recv(n - len(data))
+    return bytes(data)
+
+
+def test_frames_go_out_in_order_and_are_counted(writer, pairs):
+    server_side, client_side = pairs()
+    metrics = ClientMetrics()
+    outbox = Outbox(server_side, metrics, writer)
+    frames = [bytes([i]) * (i + 1) for i in range(50)]
+    for frame in frames:
+        assert outbox.put(frame)
+    assert outbox.flush(5)
+    assert recv_exactly(client_side, sum(map(len, frames))) == b"".join(frames)
+    assert (metrics.frames_out, metrics.bytes_out, outbox.pending) == (50, sum(map(len, frames)), 0)
+
+
+def test_slow_consumer_is_bounded_and_does_not_stall_others(writer, pairs):
+    slow_server, slow_client = pairs()
+    fast_server, fast_client = pairs()
+    slow = Outbox(slow_server, ClientMetrics(), writer, max_bytes=256 * 1024)
+    fast = Outbox(fast_server, ClientMetrics(), writer)
+
+    chunk = b"s" * 4096
+    queued = 0
+    # Nobody reads slow_client: its socket buffer fills and then the outbox does.
+    while slow.put(chunk):
+        queued += len(chunk)
+        assert queued < 64 << 20, "outbox never filled up"
+    assert slow.pending <= slow.max_bytes
+
+    assert fast.put(b"hello")
+    assert fast.flush(5)
+    assert recv_exactly(fast_client, 5) == b"hello"
+
+    # Reading the slow side lets the writer finish it via EVENT_WRITE.
+    assert recv_exactly(slow_client, queued) == chunk * (queued // len(chunk))
+    assert slow.flush(5) and slow.pending == 0
+
+
+def test_close_discards_queued_frames(writer, pairs):
+    server_side, client_side = pairs()
+    outbox = Outbox(server_side, ClientMetrics(), writer, max_bytes=1 << 30)
+    while outbox.put(b"x" * 65536) and outbox.pending < 8 << 20:
+        pass
+    outbox.close()
+    assert outbox.closed and outbox.pending == 0
+    assert outbox.flush(0)
+    assert not outbox.put(b"late")
+
+
+def test_servers_drop_a_client_that_stops_reading(serve):
+    server, port = serve(outbox_bytes=64 * 1024)
+    client = MiniTLSClient("127.0.0.1", port, verbose=False)
+    client.connect()
+    client.start_session()
+    try:
+        text = "b" * 8192
+        for _ in range(2000):
+            if server.broadcast(text) == 0:
+                break
+        assert server.stats_totals().slow_consumer_drops == 1
+        assert server.list_clients() == []
+    finally:
+        client.close()
@@ -0,0 +1,87 @@
+import pytest
+
+from app.protocol import (
+    FORMAT_BINARY,
+    FORMAT_JSON,
+    MAX_FRAME_SIZE,
+    RECORD_JSON,
+    RECORD_SECURE,
+    RECORD_SECURE_NOMAC,
+    RECORD_STREAM_CHUNK,
+    TAG_SIZE,
+    decode_frame,
+    encode_frame,
+    make_client_hello,
+    make_secure,
+    make_stream_chunk,
+    negotiate_format,
+    parse_frame_header,
+)
+from app.secure_channel import SecureChannel
+
+TAG = bytes(range(TAG_SIZE))
+
+
+def _decode(wire: bytes):
+    rtype, length = parse_frame_header(wire[:4])
+    assert len(wire) == 4 + length
+    return rtype, decode_frame(rtype, wire[4:])
+
+
+def test_json_frame_round_trip():
+    obj = {"type": "CLIENT_HELLO", "p": 23, "g": 5, "A": 8, "formats": ["binary", "json"]}
+    assert _decode(encode_frame(obj)) == (RECORD_JSON, obj)
+
+
+def test_json_secure_frame_keeps_base64_fields():
+    obj = make_secure("YWJj", "ZGVm")
+    assert _decode(encode_frame(obj)) == (RECORD_JSON, obj)
+
+
+def test_binary_secure_record_round_trip():
+    rtype, frame = _decode(encode_frame(make_secure(b"\x00ciphertext\xff", TAG)))
+    assert rtype == RECORD_SECURE
+    assert frame == {"type": "SECURE", "ciphertext": b"\x00ciphertext\xff", "mac": TAG}
+
+
+def test_binary_record_without_mac():
+    rtype, frame = _decode(encode_frame(make_secure(b"abc", None)))
+    assert rtype == RECORD_SECURE_NOMAC
+    assert frame["ciphertext"] == b"abc"
+    assert frame.get("mac") is None
+
+
+def test_stream_chunk_record_round_trip():
+    rtype, frame = _decode(encode_frame(make_stream_chunk(b"chunk")))
+    assert rtype == RECORD_STREAM_CHUNK
+    assert frame == {"type": "STREAM_CHUNK", "ciphertext": b"chunk"}
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_sealed_frame_round_trip(binary):
+    sender = SecureChannel(b"k" * 32, b"m" * 32, binary=binary)
+    receiver = SecureChannel(b"k" * 32, b"m" * 32, binary=binary)
+    inner = {"type": "DATA", "text": "zażółć"}
+    rtype, frame = _decode(encode_frame(make_secure(*sender.seal(inner))))
+    assert rtype == (RECORD_SECURE if binary else RECORD_JSON)
+    assert receiver.open(frame["ciphertext"], frame["mac"]) == inner
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b"\x00\x00\x00\x00",  # empty frame
+        (0x42 << 24 | 1).to_bytes(4, "big"),  # unknown record type
+        (RECORD_SECURE << 24 | TAG_SIZE - 1).to_bytes(4, "big"),  # no room for the tag
+        (MAX_FRAME_SIZE + 1).to_bytes(4, "big"),
+    ],
+)
+def test_bad_headers_are_rejected(header):
+    with pytest.raises(ValueError):
+        parse_frame_header(header)
+
+
+def test_format_negotiation_falls_back_to_json():
+    assert negotiate_format(make_client_hello(23, 5, 8, [FORMAT_BINARY, FORMAT_JSON])) == FORMAT_BINARY
+    assert negotiate_format(make_client_hello(23, 5, 8, [FORMAT_BINARY]), allow_binary=False) == FORMAT_JSON
+    assert negotiate_format(make_client_hello(23, 5, 8)) == FORMAT_JSON
@@ -0,0 +1,81 @@
+import pytest
+
+from app.crypto import xor_stream
+from app.secure_channel import MacError, SecureChannel
+
+ENC_KEY = bytes(range(32))
+MAC_KEY = bytes(range(32, 64))
+PAYLOAD = bytes(range(256)) * 1000
+
+
+def _pair(binary=True, use_mac=True):
+    return (
+        SecureChannel(ENC_KEY, MAC_KEY, use_mac=use_mac, binary=binary),
+        SecureChannel(ENC_KEY, MAC_KEY, use_mac=use_mac, binary=binary),
+    )
+
+
+def _seal_stream(channel, data, chunk=70000):
+    sealer = channel.stream_sealer()
+    chunks = [sealer.seal_chunk(data[i:i + chunk]) for i in range(0, len(data), chunk)]
+    return chunks, sealer.finish()
+
+
+def _open_stream(channel, chunks, end):
+    opener = channel.stream_opener()
+    plain = b"".join(opener.open_chunk(c) for c in chunks)
+    opener.finish(channel.open(*end))
+    return plain
+
+
+@pytest.mark.parametrize("binary", [False, True])
+@pytest.mark.parametrize("use_mac", [False, True])
+def test_stream_round_trip(binary, use_mac):
+    sender, receiver = _pair(binary, use_mac)
+    chunks, end = _seal_stream(sender, PAYLOAD)
+    assert len(chunks) == 4
+    assert _open_stream(receiver, chunks, end) == PAYLOAD
+
+
+def test_stream_chunks_continue_the_keystream():
+    sender, _ = _pair()
+    chunks, _ = _seal_stream(sender, PAYLOAD)
+    assert b"".join(chunks) == xor_stream(PAYLOAD, ENC_KEY)
+
+
+def test_stream_mac_detects_tampered_chunk():
+    sender, receiver = _pair()
+    chunks, end = _seal_stream(sender, PAYLOAD)
+    chunks[1] = bytes([chunks[1][0] ^ 1]) + chunks[1][1:]
+    with pytest.raises(MacError, match="bad mac"):
+        _open_stream(receiver, chunks, end)
+
+
+def test_stream_mac_detects_reordered_chunks():
+    sender, receiver = _pair()
+    chunks, end = _seal_stream(sender, PAYLOAD[:140000])
+    with pytest.raises(MacError):
+        _open_stream(receiver, chunks[::-1], end)
+
+
+def test_stream_end_checks_length():
+    sender, receiver = _pair()
+    chunks, end = _seal_stream(sender, PAYLOAD)
+    with pytest.raises(MacError, match="length"):
+        _open_stream(receiver, chunks[:-1], end)
+
+
+def test_stream_end_without_mac_is_rejected_on_a_mac_channel():
+    sender, receiver = _pair()
+    chunks, _ = _seal_stream(sender, PAYLOAD)
+    end = sender.seal({"type": "STREAM_END", "length": len(PAYLOAD)})
+    with pytest.raises(MacError, match="missing mac"):
+        _open_stream(receiver, chunks, end)
+
+
+def test_iter_stream_yields_plaintext_chunks():
+    sender, receiver = _pair()
+    chunks, end = _seal_stream(sender, PAYLOAD)
+    frames = [{"type": "STREAM_CHUNK", "ciphertext": c} for c in chunks]
+    frames.append({"type": "SECURE", "ciphertext": end[0], "mac": end[1]})
+    assert b"".join(receiver.iter_stream(iter(frames))) == PAYLOAD
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from app.client import MiniTLSClient
+from app.streams import StreamMux, make_close_stream
+
+
+def data(sid, size):
+    return {"type": "DATA", "text": "x" * size, "sid": sid}
+
+
+def order(mux, rounds=None):
+    return [stream.sid for stream, _ in mux.drain(rounds)]
+
+
+def test_deficit_round_robin_between_streams():
+    mux = StreamMux(quantum=100)
+    for _ in range(3):
+        mux.push(1, data(1, 100))
+    mux.push(2, data(2, 10))
+    mux.push(2, data(2, 10))
+    assert order(mux) == [1, 2, 2, 1, 1]
+    assert mux.queued == 0
+
+
+def test_backlog_is_shared_with_messages_read_later():
+    mux = StreamMux(quantum=100)
+    for _ in range(4):
+        mux.push(1, data(1, 100))
+    assert order(mux, rounds=1) == [1]
+    # Stream 2 shows up in the next read, behind stream 1's backlog.
+    mux.push(2, data(2, 100))
+    assert order(mux) == [1, 2, 1, 1]
+
+
+def test_close_forgets_stream_and_later_messages_reopen_it():
+    mux = StreamMux()
+    mux.push(1, data(1, 5))
+    mux.push(1, make_close_stream(1))
+    mux.push(1, data(1, 5))
+    drained = [(stream.sid, inner["type"], stream.messages) for stream, inner in mux.drain()]
+    assert drained == [(1, "DATA", 1), (1, "CLOSE_STREAM", 1), (1, "DATA", 1)]
+    assert mux.opened == 2 and len(mux) == 1
+
+
+def test_refuses_streams_over_the_limit_and_tracks_backlog():
+    mux = StreamMux(max_streams=2, max_backlog=150)
+    assert mux.push(1, data(1, 100)) and mux.push(2, data(2, 10))
+    assert not mux.push(3, data(3, 10))
+    assert not mux.backlogged
+    mux.push(1, data(1, 100))
+    assert mux.backlogged
+    mux.reset()
+    assert mux.queued == 0 and len(mux) == 0
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_rehandshake_after_close_stream(serve, resume):
+    server, port = serve()
+    client = MiniTLSClient("127.0.0.1", port, resume=resume, verbose=False)
+    client.connect()
+    try:
+        client.start_session()
+        client.send_data("hello", stream=1)
+        client.close_stream(1)
+        client.end_session()
+        # The CLOSE_STREAM ack is still in flight ahead of SERVER_HELLO.
+        client.start_session()
+        assert client.session.resumed is resume
+        assert client.poll() == [{"type": "CLOSE_STREAM", "sid": 1}]
+        client.send_data("again")
+        assert client.poll() == []
+    finally:
+        client.close()
+
+
+def test_broadcast_is_read_by_poll(serve):
+    server, port = serve()
+    client = MiniTLSClient("127.0.0.1", port, verbose=False)
+    client.connect()
+    try:
+        client.start_session()
+        client.send_data("hello")
+        assert server.broadcast("news") == 1
+        client.end_session()
+        client.start_session()
+        assert [msg.get("text") for msg in client.poll()] == ["news"]
+    finally:
+        client.close()
+
+
+def test_queued_stream_messages_are_dispatched_once_input_stops(serve):
+    server, port = serve()
+    client = MiniTLSClient("127.0.0.1", port, verbose=False)
+    client.connect()
+    try:
+        client.start_session()
+        client.send_many(("y" * 1000 for _ in range(300)), stream=1)
+        client.send_many(("z" for _ in range(3)), stream=2)
+        client.close_stream(1)
+        client.close_stream(2)
+        acks = []
+        deadline = time.monotonic() + 5
+        while len(acks) < 2 and time.monotonic() < deadline:
+            acks += client.poll()
+            time.sleep(0.01)
+        assert sorted(msg["sid"] for msg in acks) == [1, 2]
+    finally:
+        client.close()
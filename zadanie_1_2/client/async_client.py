@@ -0,0 +1,349 @@
+import sys
+
+import asyncio
+import hashlib
+import os
+import time
+
+from client import (
+    DATA_HEADER,
+    HASH_TIMEOUT,
+    MAX_RETRIES,
+    MODE_SELECTIVE_REPEAT,
+    MODE_STOP_AND_WAIT,
+    RttEstimator,
+    TransferStats,
+    WindowSender,
+    build_data_packet,
+    build_start_packet,
+    chunk_count,
+    effective_window,
+    map_file,
+    parse_reply,
+    stale_ack_window,
+)
+
+DEFAULT_CONCURRENCY = 8
+
+
+def collect_files(source, manifest=False):
+    """Lista plikow: z manifestu (sciezka w linii, '#' to komentarz), z katalogu albo jeden plik."""
+    if manifest:
+        base = os.path.dirname(os.path.abspath(source))
+        files = []
+        with open(source) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    files.append(os.path.join(base, line))
+        return files
+    if os.path.isdir(source):
+        files = []
+        for root, dirs, names in os.walk(source):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                if os.path.isfile(path):
+                    files.append(path)
+        return files
+    return [source]
+
+
+def parse_rate(text):
+    """Przepustowosc w B/s: liczba z opcjonalnym sufiksem K, M albo G (potegi 1024)."""
+    text = text.strip().upper().rstrip("B")
+    scale = 1
+    if text and text[-1] in "KMG":
+        scale = 1024 ** ("KMG".index(text[-1]) + 1)
+        text = text[:-1]
+    return float(text) * scale
+
+
+class TokenBucket:
+    """Wspolny limit przepustowosci wszystkich transferow (bajty/s).
+
+    Dopuszcza paczke do `burst` bajtow (domyslnie 100 ms ruchu, co najmniej
+    jeden najwiekszy datagram); nadawca czeka, az uzbiera sie tyle tokenow,
+    ile bajtow chce wyslac.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate / 10, 65536)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def take(self, size):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= min(size, self.capacity):
+                self.tokens -= size
+                return
+            await asyncio.sleep((min(size, self.capacity) - self.tokens) / self.rate)
+
+
+class FlowProtocol(asyncio.DatagramProtocol):
+    """Gniazdo jednego transferu; odpowiedzi serwera trafiaja do kolejki.
+
+    Kazda odpowiedz to (rodzaj, wartosc, czas odebrania) - RTT liczy sie
+    od czasu odebrania, a nie od chwili, w ktorej petla ja przeczytala
+    (np. po czekaniu na tokeny limitu przepustowosci).
+    """
+
+    def __init__(self):
+        self.replies = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        kind, value = parse_reply(data)
+        self.replies.put_nowait((kind, value, time.monotonic()))
+
+    def error_received(self, exc):
+        # ICMP (np. port unreachable) traktujemy jak zgubiony pakiet - zadziala RTO.
+        pass
+
+    def recv_nowait(self):
+        if self.replies.empty():
+            return None
+        return self.replies.get_nowait()
+
+    async def recv(self, timeout):
+        if not self.replies.empty():
+            return self.replies.get_nowait()
+        try:
+            return await asyncio.wait_for(self.replies.get(), max(timeout, 0.001))
+        except asyncio.TimeoutError:
+            return None
+
+
+class FileResult:
+    def __init__(self, path, size, stats):
+        self.path = path
+        self.size = size
+        self.stats = stats
+        self.local_hash = None
+        self.server_hash = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.local_hash == self.server_hash
+
+
+class Flow:
+    """Jeden plik przesylany wlasnym gniazdem (asyncio), logika jak w client.py."""
+
+    def __init__(self, transport, protocol, stats, bucket):
+        self.transport = transport
+        self.protocol = protocol
+        self.stats = stats
+        self.bucket = bucket
+
+    async def send(self, packet):
+        if isinstance(packet, list):
+            # Transport asyncio nie ma sendmsg - naglowek i dane sa sklejane.
+            packet = b"".join(packet)
+        if self.bucket is not None:
+            await self.bucket.take(len(packet))
+        self.transport.sendto(packet)
+
+    async def send_with_ack(self, packet, expected_seq, stale_acks=0):
+        attempt = 0
+        while attempt < MAX_RETRIES:
+            attempt += 1
+            await self.send(packet)
+            sent_at = time.monotonic()
+            self.stats.sent(retransmission=attempt > 1)
+
+            deadline = sent_at + self.stats.rtt.timeout(attempt)
+            while True:
+                reply = await self.protocol.recv(deadline - time.monotonic())
+                if reply is None:
+                    break
+                kind, seq, now = reply
+                if kind == "ack" and seq == expected_seq:
+                    if stale_acks and now - sent_at < stale_ack_window(self.stats.rtt):
+                        stale_acks -= 1
+                        continue
+                    if attempt == 1:
+                        self.stats.rtt.sample(now - sent_at)
+                    return attempt
+
+        raise RuntimeError("Za duzo prob wysłania pakietu seq=%d" % expected_seq)
+
+    async def send_window(self, sender):
+        while not sender.done:
+            for seq in sender.due(time.monotonic()):
+                # ACK, ktore przyszly w trakcie czekania na tokeny, przesuwaja
+                # okno, zanim pakiet zostanie wyslany (moze juz nie byc potrzebny).
+                server_hash = self.handle_replies(sender)
+                if server_hash is not None:
+                    return server_hash
+                if sender.outstanding(seq):
+                    await self.send_data(sender, seq)
+
+            reply = await self.protocol.recv(sender.deadline() - time.monotonic())
+            if reply is None:
+                continue
+            kind, value, received_at = reply
+            if kind == "hash":
+                return value
+            if kind == "ack":
+                sender.on_ack(value, received_at)
+        return None
+
+    def handle_replies(self, sender):
+        """Obsluguje odpowiedzi czekajace w kolejce; zwraca hash, jesli byl wsrod nich."""
+        while True:
+            reply = self.protocol.recv_nowait()
+            if reply is None:
+                return None
+            kind, value, received_at = reply
+            if kind == "hash":
+                return value
+            if kind == "ack":
+                sender.on_ack(value, received_at)
+
+    async def send_data(self, sender, seq):
+        # Tokeny przed transmit(), zeby czekanie na limit nie zawyzalo RTT.
+        if self.bucket is not None:
+            await self.bucket.take(DATA_HEADER.size + sender.chunk_size)
+        self.transport.sendto(b"".join(sender.transmit(seq)))
+
+    async def wait_for_hash(self, last_packet):
+        tries = 0
+        while tries < MAX_RETRIES:
+            tries += 1
+            deadline = time.monotonic() + min(HASH_TIMEOUT, self.stats.rtt.timeout(tries))
+            while True:
+                reply = await self.protocol.recv(deadline - time.monotonic())
+                if reply is None:
+                    break
+                kind, value, _ = reply
+                if kind == "hash":
+                    return value
+            await self.send(last_packet)
+            self.stats.sent(retransmission=True)
+
+        raise RuntimeError("Nie udało odebrać poprawnego hashu od serwera")
+
+    async def send_file(self, view, mode, window, chunk_size):
+        total_size = len(view)
+        hasher = hashlib.sha256()
+
+        start_packet = build_start_packet(total_size, chunk_size)
+        stale_acks = await self.send_with_ack(start_packet, expected_seq=0) - 1
+
+        count = chunk_count(total_size, chunk_size)
+        if count:
+            last = count - 1
+            last_packet = build_data_packet(last, view[last * chunk_size:])
+        else:
+            last_packet = start_packet
+
+        # Stop-and-wait to okno jednego pakietu.
+        if mode == MODE_STOP_AND_WAIT:
+            window = 1
+        sender = WindowSender(view, effective_window(window, chunk_size),
+                              mode == MODE_SELECTIVE_REPEAT,
+                              self.stats, hasher, chunk_size, stale_acks)
+        server_hash = await self.send_window(sender)
+        if server_hash is None:
+            server_hash = await self.wait_for_hash(last_packet)
+        self.stats.finish(total_size)
+        return hasher.digest(), server_hash
+
+
+async def transfer_file(path, addr, mode, window, chunk_size, rto, semaphore, bucket):
+    async with semaphore:
+        stats = TransferStats(RttEstimator(*rto))
+        result = FileResult(path, 0, stats)
+        try:
+            mm, view = map_file(path)
+        except OSError as e:
+            result.error = "blad odczytu: %s" % e
+            stats.finish(0)
+            return result
+        result.size = len(view)
+
+        loop = asyncio.get_running_loop()
+        transport = None
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(FlowProtocol, remote_addr=addr)
+            flow = Flow(transport, protocol, stats, bucket)
+            result.local_hash, result.server_hash = await flow.send_file(view, mode, window, chunk_size)
+        except (OSError, RuntimeError) as e:
+            result.error = str(e)
+            stats.finish(result.size)
+        finally:
+            if transport is not None:
+                transport.close()
+            view.release()
+            if mm is not None:
+                try:
+                    mm.close()
+                except BufferError:
+                    # Wycinki trzyma jeszcze traceback bledu; mapowanie zamknie GC.
+                    pass
+        return result
+
+
+async def transfer_many(paths, addr, mode, window, chunk_size, rto,
+                        concurrency=DEFAULT_CONCURRENCY, bandwidth=0.0):
+    """Przesyla pliki rownolegle (najwyzej `concurrency` naraz, lacznie do `bandwidth` B/s)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(bandwidth) if bandwidth > 0 else None
+    tasks = [transfer_file(path, addr, mode, window, chunk_size, rto, semaphore, bucket)
+             for path in paths]
+    return await asyncio.gather(*tasks)
+
+
+def report(results, elapsed):
+    """Raport per plik i laczny; zwraca kod wyjscia (0 OK, 1 blad, 2 rozne hashe)."""
+    width = max([len(r.path) for r in results] + [4])
+    print("%-*s %12s %9s %12s %6s %10s  %s" %
+          (width, "plik", "bajty", "czas [s]", "KiB/s", "retr", "RTT p50", "wynik"))
+    total_bytes = 0
+    retransmissions = 0
+    failed = mismatched = 0
+    for r in results:
+        stats = r.stats
+        duration = (stats.finished or time.monotonic()) - stats.started
+        samples = sorted(stats.rtt.samples)
+        p50 = "%.2f ms" % (samples[len(samples) // 2] * 1000) if samples else "-"
+        if r.error is not None:
+            outcome = "BLAD: %s" % r.error
+            failed += 1
+        elif r.ok:
+            outcome = "OK"
+            total_bytes += r.size
+        else:
+            outcome = "HASHE ROZNE"
+            mismatched += 1
+        retransmissions += stats.retransmissions
+        print("%-*s %12d %9.3f %12.1f %6d %10s  %s" %
+              (width, r.path, r.size, duration, r.size / duration / 1024 if duration > 0 else 0.0,
+               stats.retransmissions, p50, outcome))
+
+    print("Razem: %d plikow (%d OK, %d bledow, %d z roznym hashem), %d B w %.3f s, "
+          "%.1f KiB/s, %d retransmisji" %
+          (len(results), len(results) - failed - mismatched, failed, mismatched, total_bytes,
+           elapsed, total_bytes / elapsed / 1024 if elapsed > 0 else 0.0, retransmissions))
+    if failed:
+        return 1
+    if mismatched:
+        return 2
+    return 0
+
+
+def run_many(paths, addr, mode, window, chunk_size, rto, concurrency, bandwidth):
+    started = time.monotonic()
+    results = asyncio.run(transfer_many(paths, addr, mode, window, chunk_size, rto,
+                                        concurrency, bandwidth))
+    return report(results, time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    print("Uzyj: python client.py <host> <port> <katalog> albo --manifest <plik>", file=sys.stderr)
+    sys.exit(1)
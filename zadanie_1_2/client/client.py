@@ -1,50 +1,336 @@
 import sys
 
+import argparse
+import errno
+import json
+import os
 import socket
 import struct
 import hashlib
-
-from pathlib import Path
+import mmap
+import random
+import tempfile
+import time
 
 MSG_START = b"S"
 MSG_DATA  = b"D"
 MSG_ACK   = b"A"
 MSG_HASH  = b"H"
+MSG_PROBE = b"P"
 
 CHUNK_SIZE = 100
-FILE_SIZE  = 10000
-SOCKET_TIMEOUT = 0.5
 HASH_TIMEOUT   = 2.0
 MAX_RETRIES    = 20
 RECV_BUF_SIZE  = 2048
 
+MODE_STOP_AND_WAIT    = "saw"
+MODE_GO_BACK_N        = "gbn"
+MODE_SELECTIVE_REPEAT = "sr"
+DEFAULT_WINDOW = 32
+# Tyle pakietow poza kolejnoscia serwer potrafi przechowac (MAX_WINDOW
+# i MAX_WINDOW_BYTES w server.c); wieksze okno jest przycinane.
+MAX_WINDOW       = 1024
+MAX_WINDOW_BYTES = 4 * 1024 * 1024
+
+# Pole seq ma 32 bity: numer fragmentu idzie na drut modulo 2^32, a odbiorca
+# odtwarza go wzgledem poczatku okna (okno jest duzo mniejsze niz 2^31).
+SEQ_MOD = 1 << 32
+# Rozmiar >= 4 GiB nie miesci sie w polu file_size pakietu START: pole
+# dostaje ten znacznik, a pelny rozmiar idzie na 8 bajtach za naglowkiem.
+START_SIZE_EXTENDED = 0xFFFFFFFF
+
+DATA_HEADER = struct.Struct("!cIH")
+PROBE_HEADER = struct.Struct("!cI")
+
+# Wybor chunk_size: najwiekszy datagram, ktory dochodzi bez fragmentacji.
+UDP_MAX_PAYLOAD  = 65507
+IP_UDP_OVERHEAD  = 28
+# Bez Linuksowego IP_PMTUDISC_DO nie da sie zabronic fragmentacji - wtedy
+# sondujemy najwyzej do ramki Ethernet.
+ETHERNET_PAYLOAD = 1500 - IP_UDP_OVERHEAD
+# Timeout sondy: 4 x RTT sondy minimalnej, w tych granicach [s].
+PROBE_TIMEOUT     = 0.3
+PROBE_TIMEOUT_MIN = 0.05
+PROBE_TRIES   = 3
+MTU_CACHE_TTL = 600.0
+MTU_CACHE_FILE = os.path.join(tempfile.gettempdir(), "udp_file_pmtu.json")
+# Stale z <linux/in.h>; Python ich nie eksportuje.
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO  = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU          = getattr(socket, "IP_MTU", 14)
+# Co tyle bajtow potwierdzonego pliku strony mapowania sa oddawane systemowi.
+RELEASE_EVERY = 8 << 20
+
+# Granice RTO w sekundach; RTO_INITIAL obowiazuje do pierwszego pomiaru RTT.
+RTO_INITIAL = 0.5
+RTO_MIN     = 0.02
+RTO_MAX     = 4.0
+RTT_SAMPLES_KEPT = 4096
+
+
+class RttEstimator:
+    """Estymator RTT i RTO jak w TCP (RFC 6298).
+
+    SRTT i RTTVAR sa wygladzane wykladniczo (alfa = 1/8, beta = 1/4),
+    RTO = SRTT + 4 * RTTVAR, obciete do [rto_min, rto_max]. Pomiary
+    pochodza tylko z pakietow wyslanych raz (regula Karna), a kazda
+    retransmisja pakietu podwaja jego RTO. Do statystyk trzymana jest
+    losowa probka co najwyzej RTT_SAMPLES_KEPT pomiarow.
+    """
+
+    def __init__(self, rto_initial=RTO_INITIAL, rto_min=RTO_MIN, rto_max=RTO_MAX):
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.rto = min(max(rto_initial, rto_min), rto_max)
+        self.srtt = None
+        self.rttvar = None
+        self.count = 0
+        self.samples = []
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.rto_min), self.rto_max)
+
+        self.count += 1
+        if len(self.samples) < RTT_SAMPLES_KEPT:
+            self.samples.append(rtt)
+        else:
+            slot = random.randrange(self.count)
+            if slot < RTT_SAMPLES_KEPT:
+                self.samples[slot] = rtt
+
+    def timeout(self, attempts):
+        """RTO pakietu wyslanego juz `attempts` razy (podwajane przy kazdej retransmisji)."""
+        return min(self.rto * (2 ** (attempts - 1)), self.rto_max)
+
+
+class TransferStats:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.packets_sent = 0
+        self.retransmissions = 0
+        self.file_bytes = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def sent(self, retransmission):
+        self.packets_sent += 1
+        if retransmission:
+            self.retransmissions += 1
+
+    def finish(self, file_bytes):
+        self.file_bytes = file_bytes
+        self.finished = time.monotonic()
+
+    def summary(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        goodput = self.file_bytes / elapsed if elapsed > 0 else 0.0
+        lines = [
+            "Przeslano %d B w %.3f s, goodput %.1f KiB/s" % (self.file_bytes, elapsed, goodput / 1024),
+            "Pakiety: %d wyslanych, %d retransmisji" % (self.packets_sent, self.retransmissions),
+        ]
+        samples = sorted(self.rtt.samples)
+        if samples:
+            def pct(q):
+                return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+            lines.append(
+                "RTT [ms]: n=%d min=%.3f p50=%.3f p90=%.3f p99=%.3f max=%.3f, SRTT=%.3f, RTO=%.3f"
+                % (self.rtt.count, samples[0] * 1000, pct(0.5), pct(0.9), pct(0.99),
+                   samples[-1] * 1000, self.rtt.srtt * 1000, self.rtt.rto * 1000))
+        else:
+            lines.append("RTT: brak pomiarow (wszystkie pakiety retransmitowane)")
+        return lines
+
+
+def map_file(filename):
+    """Mapuje plik do pamieci; zwraca (mmap albo None dla pustego pliku, memoryview).
+
+    Fragmenty sa wycinkami memoryview, wiec nic nie jest kopiowane, a strony
+    pliku wczytuje i zwalnia system - zuzycie pamieci nie zalezy od rozmiaru.
+    Blad odczytu zglasza OSError.
+    """
+    with open(filename, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return None, memoryview(b"")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm, memoryview(mm)
+
+
+def release_pages(view, upto):
+    """Zwalnia strony mapowania przed `upto` (dane juz potwierdzone przez serwer)."""
+    mm = view.obj
+    if not isinstance(mm, mmap.mmap) or not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    upto -= upto % mmap.PAGESIZE
+    if upto:
+        mm.madvise(mmap.MADV_DONTNEED, 0, upto)
+
+
+def build_probe_packet(size):
+    return PROBE_HEADER.pack(MSG_PROBE, size) + bytes(size - PROBE_HEADER.size)
+
+
+def _kernel_path_mtu(sock):
+    """Ladunek UDP wg PMTU, ktore zna jadro (po ICMP "fragmentation needed" maleje)."""
+    try:
+        return sock.getsockopt(socket.IPPROTO_IP, IP_MTU) - IP_UDP_OVERHEAD
+    except OSError:
+        return UDP_MAX_PAYLOAD
+
 
-def read_file_bytes(filename):
+def _probe_once(sock, size, timeout):
+    """True/False gdy wiadomo, czy datagram `size` bajtow przeszedl; None po timeoucie."""
     try:
-        data = Path(filename).read_bytes()
+        sock.send(build_probe_packet(size))
     except OSError as e:
-        print("Blad odczytu pliku %s: %s" % (filename, e), file=sys.stderr)
-        sys.exit(1)
+        if e.errno == errno.EMSGSIZE:
+            return False
+        raise RuntimeError("Błąd send (sonda): %s" % e)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        sock.settimeout(remaining)
+        try:
+            data = sock.recv(RECV_BUF_SIZE)
+        except socket.timeout:
+            return None
+        except OSError as e:
+            raise RuntimeError("Błąd recv (sonda): %s" % e)
+        if len(data) >= PROBE_HEADER.size:
+            msg_type, echoed = PROBE_HEADER.unpack_from(data)
+            if msg_type == MSG_PROBE and echoed == size:
+                return True
+
+
+def datagram_fits(sock, size, timeout=PROBE_TIMEOUT):
+    for _ in range(PROBE_TRIES):
+        result = _probe_once(sock, size, timeout)
+        if result is not None:
+            return result
+    return False
+
+
+def probe_path_mtu(addr, floor=CHUNK_SIZE + DATA_HEADER.size):
+    """Najwiekszy ladunek UDP, ktory dochodzi do `addr` bez fragmentacji.
+
+    Jak w zadaniu 1.1 wysylamy datagramy roznej wielkosci i czekamy na
+    odpowiedz serwera (pakiet PROBE z powtorzona dlugoscia). Na Linuksie
+    gniazdo ma ustawione DF (IP_PMTUDISC_DO), wiec za duzy datagram nie
+    jest fragmentowany, tylko ginie albo konczy sie EMSGSIZE. Najpierw
+    probujemy gornej granicy (PMTU jadra), potem szukamy binarnie
+    miedzy `floor` (dotychczasowy rozmiar) a ta granica. Gdy nie wraca
+    nawet sonda `floor`, serwer nie zna sond i zostaje `floor`.
+    Osobne gniazdo sprawia, ze spoznione odpowiedzi nie trafia do transferu.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(addr)
+        if sys.platform.startswith("linux"):
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+            high = min(UDP_MAX_PAYLOAD, _kernel_path_mtu(sock))
+        else:
+            high = ETHERNET_PAYLOAD
+
+        low = floor
+        started = time.monotonic()
+        if not datagram_fits(sock, low):
+            # Serwer bez obslugi sond (albo nieosiagalny) - zostaje dotychczasowy rozmiar.
+            return low
+        timeout = min(max(4 * (time.monotonic() - started), PROBE_TIMEOUT_MIN), PROBE_TIMEOUT)
+        if high <= low or datagram_fits(sock, high, timeout):
+            return max(high, low)
+        # Niezmiennik: `low` przechodzi, `high` nie.
+        while high - low > 1:
+            mid = (low + high) // 2
+            if datagram_fits(sock, mid, timeout):
+                low = mid
+            else:
+                high = min(mid, max(_kernel_path_mtu(sock) + 1, low + 1))
+        return low
+    except OSError as e:
+        raise RuntimeError("Błąd sondowania MTU: %s" % e)
+    finally:
+        sock.close()
 
-    if len(data) != FILE_SIZE:
-        print("Blad: plik musi mieć dokładnie %d bajtow, a ma %d." %
-              (FILE_SIZE, len(data)), file=sys.stderr)
-        sys.exit(1)
 
-    return data
+_chunk_cache = {}
+
+
+def _load_mtu_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
 
-def compute_sha256(data):
-    return hashlib.sha256(data).digest()
+def _store_mtu_cache(path, key, entry):
+    cache = _load_mtu_cache(path)
+    cache[key] = entry
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def negotiated_chunk_size(addr, cache_file=MTU_CACHE_FILE):
+    """chunk_size dla `addr`: z cache (w procesie i w pliku, wazny MTU_CACHE_TTL s) albo z sondowania."""
+    key = "%s:%d" % addr
+    now = time.time()
+    entry = _chunk_cache.get(key)
+    if entry is None and cache_file:
+        entry = _load_mtu_cache(cache_file).get(key)
+    if entry is not None and now - entry.get("ts", 0) < MTU_CACHE_TTL:
+        _chunk_cache[key] = entry
+        return entry["chunk_size"]
+
+    payload = probe_path_mtu(addr)
+    entry = {"chunk_size": payload - DATA_HEADER.size, "ts": now}
+    _chunk_cache[key] = entry
+    if cache_file:
+        _store_mtu_cache(cache_file, key, entry)
+    print("Sondowanie MTU: %s przyjmuje datagramy do %d B, chunk_size=%d" %
+          (key, payload, entry["chunk_size"]))
+    return entry["chunk_size"]
+
+
+def chunk_count(file_size, chunk_size=CHUNK_SIZE):
+    return (file_size + chunk_size - 1) // chunk_size
 
 
 def build_start_packet(file_size, chunk_size):
-    return struct.pack("!cIH", MSG_START, file_size, chunk_size)
+    if file_size < START_SIZE_EXTENDED:
+        return struct.pack("!cIH", MSG_START, file_size, chunk_size)
+    return struct.pack("!cIHQ", MSG_START, START_SIZE_EXTENDED, chunk_size, file_size)
+
 
+def build_data_packet(index, chunk):
+    """Naglowek i dane jako osobne bufory (wysylane jednym sendmsg, bez sklejania)."""
+    return [DATA_HEADER.pack(MSG_DATA, index % SEQ_MOD, len(chunk)), chunk]
 
-def build_data_packet(seq, chunk):
-    data_len = len(chunk)
-    return struct.pack("!cIH", MSG_DATA, seq, data_len) + chunk
+
+def send_packet(sock, addr, packet):
+    try:
+        if isinstance(packet, list):
+            sock.sendmsg(packet, [], 0, addr)
+        else:
+            sock.sendto(packet, addr)
+    except OSError as e:
+        raise RuntimeError("Błąd sendto: %s" % e)
 
 
 def parse_ack_packet(packet):
@@ -64,118 +350,392 @@ def parse_hash_packet(packet):
     return msg_type, hash_bytes
 
 
-def send_with_ack(sock, addr, packet, expected_seq):
+def stale_ack_window(rtt):
+    """Jak dlugo po wyslaniu DATA 0 ACK 0 moze byc spoznionym ACK powtorzonego START.
+
+    Serwer potwierdza START i DATA 0 tym samym ACK 0. ACK powtorzonego START
+    jest juz w drodze, gdy wychodzi DATA 0, wiec przychodzi przed uplywem
+    mniej wiecej jednego RTT od jego wyslania; prawdziwe ACK DATA 0 - po nim.
+    Bez pomiaru RTT (START ponawiany, regula Karna) granica jest RTO.
+    """
+    return rtt.srtt if rtt.srtt is not None else rtt.rto
+
+
+def send_with_ack(sock, addr, packet, expected_seq, stats, stale_acks=0):
+    """Wysyla pakiet do skutku; zwraca liczbe prob.
+
+    `stale_acks` to liczba spoznionych ACK o tym samym numerze, ktore moga
+    jeszcze przyjsc (patrz stale_ack_window) - takie ACK sa pomijane.
+    """
     attempt = 0
     while attempt < MAX_RETRIES:
         attempt += 1
-        try:
-            sock.sendto(packet, addr)
-        except OSError as e:
-            raise RuntimeError("Błąd sendto: %s" % e)
+        send_packet(sock, addr, packet)
+        sent_at = time.monotonic()
+        stats.sent(retransmission=attempt > 1)
+
+        # Spoznione ACK wczesniejszych pakietow nie skracaja czekania.
+        deadline = sent_at + stats.rtt.timeout(attempt)
+        while True:
+            reply = recv_reply(sock, deadline - time.monotonic())
+            if reply is None:
+                break
+            kind, seq = reply
+            if kind == "ack" and seq == expected_seq % SEQ_MOD:
+                now = time.monotonic()
+                if stale_acks and now - sent_at < stale_ack_window(stats.rtt):
+                    stale_acks -= 1
+                    continue
+                if attempt == 1:
+                    stats.rtt.sample(now - sent_at)
+                return attempt
 
-        try:
-            data, _ = sock.recvfrom(RECV_BUF_SIZE)
-        except socket.timeout:
-            continue
-        except OSError as e:
-            raise RuntimeError("Błąd recvfrom: %s" % e)
+    raise RuntimeError("Za duzo prob wysłania pakietu seq=%d" % expected_seq)
 
+
+def parse_reply(data):
+    """Pakiet od serwera jako ("ack", seq), ("hash", bytes) albo ("other", None)."""
+    if data[:1] == MSG_HASH:
         try:
-            msg_type, seq = parse_ack_packet(data)
+            _, hash_bytes = parse_hash_packet(data)
         except ValueError:
-            continue
+            return ("other", None)
+        return ("hash", hash_bytes)
+
+    try:
+        msg_type, seq = parse_ack_packet(data)
+    except ValueError:
+        return ("other", None)
+    if msg_type != MSG_ACK:
+        return ("other", None)
+    return ("ack", seq)
 
-        if msg_type != MSG_ACK:
-            continue
 
-        if seq == expected_seq:
+def recv_reply(sock, timeout):
+    """Jeden pakiet od serwera (jak parse_reply) albo None po timeoucie."""
+    sock.settimeout(max(timeout, 0.001))
+    try:
+        data, _ = sock.recvfrom(RECV_BUF_SIZE)
+    except socket.timeout:
+        return None
+    except OSError as e:
+        raise RuntimeError("Błąd recvfrom: %s" % e)
+    return parse_reply(data)
+
+
+def effective_window(window, chunk_size):
+    """Okno nadawcy ograniczone do tego, co serwer moze zbuforowac."""
+    return max(1, min(window, MAX_WINDOW, MAX_WINDOW_BYTES // chunk_size))
+
+
+class WindowSender:
+    """Stan nadawcy z oknem przesuwnym, niezalezny od sposobu wysylania.
+
+    ACK serwera potwierdza pojedynczy pakiet (serwer buforuje pakiety poza
+    kolejnoscia), wiec nadawca pamieta, ktore numery z okna sa jeszcze
+    niepotwierdzone, a dublikaty i ACK spoza okna pomija. Okno przesuwa sie
+    po ciaglym prefiksie potwierdzonych pakietow.
+
+    Go-Back-N (selective=False) ma jeden zegar - najstarszego
+    niepotwierdzonego pakietu; po jego uplywie wraca do poczatku okna
+    i wysyla ponownie wszystkie niepotwierdzone. Selective repeat ma zegar
+    dla kazdego pakietu i ponawia tylko te, ktorych czas minal. Czas
+    oczekiwania wyznacza RTO z `stats.rtt`.
+
+    Pierwsze wyslania ida po kolei, wiec wtedy fragment trafia do `hasher`.
+    ACK 0 potwierdza tez START: jesli START byl ponawiany (`stale_acks`
+    to liczba jego dodatkowych wyslan), ACK 0 przychodzace za szybko po
+    DATA 0 (stale_ack_window) jest pomijane, zeby spoznione ACK START nie
+    potwierdzilo zgubionego DATA 0.
+
+    Stan (numery, czasy, proby) obejmuje tylko pakiety z okna. Petla
+    wysylajaca wola due(), transmit() dla kazdego zwroconego numeru,
+    a on_ack() dla kazdego ACK; deadline() mowi, jak dlugo mozna czekac.
+    """
+
+    def __init__(self, view, window, selective, stats, hasher, chunk_size=CHUNK_SIZE, stale_acks=0):
+        self.view = view
+        self.window = window
+        self.selective = selective
+        self.stats = stats
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        self.count = chunk_count(len(view), chunk_size)
+        self.base = 0
+        self.next_seq = 0
+        self.released = 0
+        self.acked = set()
+        self.sent_at = {}
+        self.attempts = {}
+        self.stale_acks = stale_acks
+
+    @property
+    def done(self):
+        return self.base >= self.count
+
+    def outstanding(self, seq):
+        """Czy pakiet `seq` nadal czeka na ACK (albo jeszcze nie byl wyslany)."""
+        return seq >= self.base and seq not in self.acked
+
+    def _expires(self, seq):
+        return self.sent_at[seq] + self.stats.rtt.timeout(self.attempts[seq])
+
+    def deadline(self):
+        if not self.sent_at:
+            return time.monotonic()
+        if self.selective:
+            return min(self._expires(seq) for seq in self.sent_at)
+        return self._expires(self.base)
+
+    def due(self, now):
+        """Numery do wyslania teraz: nowe w oknie i te, ktorych zegar minal."""
+        if self.sent_at and now >= self.deadline():
+            expired = [seq for seq in range(self.base, self.next_seq)
+                       if seq not in self.acked and (not self.selective or now >= self._expires(seq))]
+        else:
+            expired = []
+        fresh = range(self.next_seq, min(self.count, self.base + self.window))
+        self.next_seq = max(self.next_seq, fresh.stop)
+        return expired + list(fresh)
+
+    def transmit(self, seq):
+        """Pakiet DATA numer `seq` do wyslania (liczy proby i czas wyslania)."""
+        attempts = self.attempts[seq] = self.attempts.get(seq, 0) + 1
+        if attempts > MAX_RETRIES:
+            raise RuntimeError("Za duzo prob wysłania pakietu seq=%d" % seq)
+        chunk = self.view[seq * self.chunk_size:(seq + 1) * self.chunk_size]
+        if attempts == 1:
+            self.hasher.update(chunk)
+        self.sent_at[seq] = time.monotonic()
+        self.stats.sent(retransmission=attempts > 1)
+        return build_data_packet(seq, chunk)
+
+    def on_ack(self, wire_seq, now):
+        seq = self.base + (wire_seq - self.base) % SEQ_MOD
+        # Tylko pakiety w locie: nie wyslane jeszcze (due() juz je przydzielilo),
+        # potwierdzone i spoza okna sa pomijane.
+        if seq not in self.sent_at:
+            return
+        if seq == 0 and self.stale_acks and now - self.sent_at[0] < stale_ack_window(self.stats.rtt):
+            self.stale_acks -= 1
             return
+        if self.attempts[seq] == 1:
+            self.stats.rtt.sample(now - self.sent_at[seq])
+        self.acked.add(seq)
+        del self.sent_at[seq]
+        while self.base in self.acked:
+            self.acked.remove(self.base)
+            del self.attempts[self.base]
+            self.base += 1
+        if (self.base * self.chunk_size) - self.released >= RELEASE_EVERY:
+            self.released = self.base * self.chunk_size
+            release_pages(self.view, self.released)
+
+
+def send_window(sock, addr, view, window, selective, stats, hasher, chunk_size=CHUNK_SIZE,
+                stale_acks=0):
+    """Wysyla DATA oknem `window` pakietow (WindowSender); zwraca hash, jesli przyszedl w trakcie."""
+    sender = WindowSender(view, window, selective, stats, hasher, chunk_size, stale_acks)
+    while not sender.done:
+        for seq in sender.due(time.monotonic()):
+            send_packet(sock, addr, sender.transmit(seq))
+
+        reply = recv_reply(sock, sender.deadline() - time.monotonic())
+        if reply is None:
+            continue
+        kind, value = reply
+        if kind == "hash":
+            # Serwer liczy hash dopiero po odebraniu calego pliku.
+            return value
+        if kind == "ack":
+            sender.on_ack(value, time.monotonic())
 
-    raise RuntimeError("Za duzo prob wysłania pakietu seq=%d" % expected_seq)
+    return None
 
 
-def wait_for_hash(sock):
-    sock.settimeout(HASH_TIMEOUT)
+def wait_for_hash(sock, addr, last_packet, stats):
+    """Czeka na HASH; po kazdym timeoucie wysyla ponownie ostatni pakiet.
 
+    Serwer odpowiada na powtorzony pakiet zakonczonego transferu ponownym
+    hashem, wiec zgubiony HASH nie konczy transferu bledem.
+    """
     tries = 0
     while tries < MAX_RETRIES:
         tries += 1
-        try:
-            data, _ = sock.recvfrom(RECV_BUF_SIZE)
-
-            # print(data)
-        except socket.timeout:
-            continue
-        except OSError as e:
-            raise RuntimeError("Błąd recvfrom (hash): %s" % e)
+        deadline = time.monotonic() + min(HASH_TIMEOUT, stats.rtt.timeout(tries))
+        while True:
+            reply = recv_reply(sock, deadline - time.monotonic())
+            if reply is None:
+                break
+            kind, value = reply
+            if kind == "hash":
+                return value
+        send_packet(sock, addr, last_packet)
+        stats.sent(retransmission=True)
 
-        try:
-            msg_type, hash_bytes = parse_hash_packet(data)
-        except ValueError:
-            continue
+    raise RuntimeError("Nie udało odebrać poprawnego hashu od serwera")
 
-        if msg_type != MSG_HASH:
-            continue
 
-        if len(hash_bytes) == 32:
-            return hash_bytes
+def send_file(sock, addr, view, mode=MODE_STOP_AND_WAIT, window=DEFAULT_WINDOW, stats=None,
+              chunk_size=CHUNK_SIZE):
+    """Wysyla plik (bufor/memoryview); zwraca (hash lokalny, hash serwera).
 
-    raise RuntimeError("Nie udało odebrać poprawnego hashu od serwera")
+    Hash lokalny jest liczony w trakcie wysylania, bez osobnego przebiegu.
+    """
+    total_size = len(view)
+    if stats is None:
+        stats = TransferStats(RttEstimator())
+    hasher = hashlib.sha256()
 
+    start_packet = build_start_packet(total_size, chunk_size)
+    # Kazde dodatkowe wyslanie START moze dac spoznione ACK 0.
+    stale_acks = send_with_ack(sock, addr, start_packet, expected_seq=0, stats=stats) - 1
 
-def send_file(sock, addr, file_bytes):
-    total_size = len(file_bytes)
+    count = chunk_count(total_size, chunk_size)
+    if count:
+        last = count - 1
+        last_packet = build_data_packet(last, view[last * chunk_size:])
+    else:
+        last_packet = start_packet
 
-    start_packet = build_start_packet(total_size, CHUNK_SIZE)
-    send_with_ack(sock, addr, start_packet, expected_seq=0)
+    if mode != MODE_STOP_AND_WAIT:
+        server_hash = send_window(sock, addr, view, effective_window(window, chunk_size),
+                                  selective=(mode == MODE_SELECTIVE_REPEAT), stats=stats,
+                                  hasher=hasher, chunk_size=chunk_size, stale_acks=stale_acks)
+        if server_hash is None:
+            server_hash = wait_for_hash(sock, addr, last_packet, stats)
+        stats.finish(total_size)
+        return hasher.digest(), server_hash
 
     seq = 0
 
     offset = 0
     while offset < total_size:
-        chunk = file_bytes[offset:offset + CHUNK_SIZE]
+        chunk = view[offset:offset + chunk_size]
+        hasher.update(chunk)
         data_packet = build_data_packet(seq, chunk)
-        send_with_ack(sock, addr, data_packet, expected_seq=seq)
-        offset += CHUNK_SIZE
+        send_with_ack(sock, addr, data_packet, expected_seq=seq, stats=stats,
+                      stale_acks=stale_acks if seq == 0 else 0)
+        offset += chunk_size
         seq += 1
+        if offset % RELEASE_EVERY < chunk_size:
+            release_pages(view, offset)
 
-    server_hash = wait_for_hash(sock)
-    return server_hash
+    server_hash = wait_for_hash(sock, addr, last_packet, stats)
+    stats.finish(total_size)
+    return hasher.digest(), server_hash
 
 
 def main():
-    if len(sys.argv) != 4:
-
-        print("Usage: %s <server_host> <server_port> <file>" % sys.argv[0],
-              file=sys.stderr)
-
-        sys.exit(1)
-
-    server_host = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Klient przesylania pliku po UDP")
+    parser.add_argument("server_host")
+    parser.add_argument("server_port")
+    parser.add_argument("file", help="plik, katalog (wszystkie pliki w nim) albo manifest z --manifest")
+    parser.add_argument("--mode", default=MODE_STOP_AND_WAIT,
+                        choices=(MODE_STOP_AND_WAIT, MODE_GO_BACK_N, MODE_SELECTIVE_REPEAT),
+                        help="saw = stop-and-wait, gbn = Go-Back-N, sr = selective repeat")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="rozmiar okna (pakiety w locie) dla gbn/sr")
+    parser.add_argument("--rto-initial", type=float, default=RTO_INITIAL,
+                        help="RTO [s] przed pierwszym pomiarem RTT")
+    parser.add_argument("--rto-min", type=float, default=RTO_MIN, help="dolna granica RTO [s]")
+    parser.add_argument("--rto-max", type=float, default=RTO_MAX, help="gorna granica RTO [s]")
+    parser.add_argument("--chunk-size", default="auto",
+                        help="bajty danych w pakiecie DATA albo 'auto' (sondowanie MTU sciezki)")
+    parser.add_argument("--mtu-cache", default=MTU_CACHE_FILE,
+                        help="plik z wynikami sondowania (pusty = bez zapisu na dysk)")
+    parser.add_argument("--manifest", action="store_true",
+                        help="'file' to lista sciezek (jedna w linii) do przeslania rownolegle")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="ile plikow przesylac naraz (katalog/manifest)")
+    parser.add_argument("--bandwidth", default="0",
+                        help="laczny limit przepustowosci w B/s, sufiksy K/M/G (0 = bez limitu)")
+    args = parser.parse_args()
+
+    server_host = args.server_host
     try:
-        server_port = int(sys.argv[2])
+        server_port = int(args.server_port)
     except ValueError:
         print("Blad: port musi byc liczba całkowita.", file=sys.stderr)
         sys.exit(1)
 
-    filename = sys.argv[3]
+    if not 1 <= args.window <= MAX_WINDOW:
+        print("Blad: okno musi miec od 1 do %d pakietow." % MAX_WINDOW, file=sys.stderr)
+        sys.exit(1)
+
+    max_chunk = UDP_MAX_PAYLOAD - DATA_HEADER.size
+    if args.chunk_size != "auto":
+        try:
+            chunk_size = int(args.chunk_size)
+        except ValueError:
+            chunk_size = 0
+        if not 1 <= chunk_size <= max_chunk:
+            print("Blad: chunk_size musi byc liczba od 1 do %d albo 'auto'." % max_chunk,
+                  file=sys.stderr)
+            sys.exit(1)
+
+    if args.concurrency < 1:
+        print("Blad: concurrency musi byc co najmniej 1.", file=sys.stderr)
+        sys.exit(1)
+
+    filename = args.file
+    many = args.manifest or os.path.isdir(filename)
 
-    file_bytes = read_file_bytes(filename)
-    local_hash = compute_sha256(file_bytes)
+    if not many:
+        try:
+            mm, view = map_file(filename)
+        except OSError as e:
+            print("Blad odczytu pliku %s: %s" % (filename, e), file=sys.stderr)
+            sys.exit(1)
 
     addr = (server_host, server_port)
 
+    if args.chunk_size == "auto":
+        try:
+            chunk_size = negotiated_chunk_size(addr, args.mtu_cache)
+        except RuntimeError as e:
+            print("Blad protokolu: %s" % e, file=sys.stderr)
+            sys.exit(1)
+
+    if many:
+        # Wiele plikow: silnik asyncio, kazdy plik na wlasnym gniezdzie.
+        import async_client
+
+        try:
+            bandwidth = async_client.parse_rate(args.bandwidth)
+        except ValueError:
+            print("Blad: niepoprawny limit przepustowosci '%s'." % args.bandwidth, file=sys.stderr)
+            sys.exit(1)
+        try:
+            paths = async_client.collect_files(filename, args.manifest)
+        except OSError as e:
+            print("Blad odczytu %s: %s" % (filename, e), file=sys.stderr)
+            sys.exit(1)
+        if not paths:
+            print("Brak plikow do przeslania w %s" % filename, file=sys.stderr)
+            sys.exit(1)
+        rto = (args.rto_initial, args.rto_min, args.rto_max)
+        sys.exit(async_client.run_many(paths, addr, args.mode, args.window, chunk_size, rto,
+                                       args.concurrency, bandwidth))
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(SOCKET_TIMEOUT)
+    stats = TransferStats(RttEstimator(args.rto_initial, args.rto_min, args.rto_max))
 
     try:
-        server_hash = send_file(sock, addr, file_bytes)
+        local_hash, server_hash = send_file(sock, addr, view, args.mode, args.window, stats,
+                                            chunk_size)
     except RuntimeError as e:
         print("Blad protokolu: %s" % e, file=sys.stderr)
         sock.close()
         sys.exit(1)
 
     sock.close()
+    view.release()
+    if mm is not None:
+        mm.close()
+
+    for line in stats.summary():
+        print(line)
 
     print("Local hash: %s" % local_hash.hex())
     print("Server hash: %s" % server_hash.hex())
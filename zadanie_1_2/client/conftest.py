@@ -0,0 +1,36 @@
+import hashlib
+
+import pytest
+
+import client
+from client import RttEstimator, TransferStats, WindowSender
+
+DATA = bytes(range(256)) * 40
+CHUNK = 512
+
+
+class FakeClock:
+    """Zastepuje modul time w client.py - czas plynie tylko, gdy test go przesunie."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(client, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def make_sender():
+    def make(selective, window=8, view=DATA, chunk_size=CHUNK, stale_acks=0):
+        if isinstance(view, bytes):
+            view = memoryview(view)
+        stats = TransferStats(RttEstimator())
+        return WindowSender(view, window, selective, stats, hashlib.sha256(), chunk_size, stale_acks)
+    return make
@@ -0,0 +1,71 @@
+import asyncio
+import struct
+
+import pytest
+
+import async_client
+from async_client import Flow, FlowProtocol
+from client import DATA_HEADER
+
+
+def ack(seq):
+    return struct.pack("!cI", b"A", seq)
+
+
+class AckingTransport:
+    """Transport, za ktorym serwer natychmiast potwierdza kazdy pakiet DATA."""
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.sent = []
+
+    def sendto(self, packet):
+        _, seq, _ = DATA_HEADER.unpack(packet[:DATA_HEADER.size])
+        self.sent.append(seq)
+        self.protocol.datagram_received(ack(seq), None)
+
+
+@pytest.fixture
+def async_clock(clock, monkeypatch):
+    monkeypatch.setattr(async_client, "time", clock)
+    return clock
+
+
+def test_replies_keep_their_arrival_time(async_clock, make_sender):
+    sender = make_sender(selective=True, window=4)
+    for seq in sender.due(async_clock.now):
+        sender.transmit(seq)
+    protocol = FlowProtocol()
+    async_clock.now += 0.01
+    protocol.datagram_received(ack(0), None)
+    protocol.datagram_received(ack(1), None)
+    # Petla czekala na tokeny limitu przepustowosci.
+    async_clock.now += 1.0
+
+    assert Flow(None, protocol, sender.stats, None).handle_replies(sender) is None
+    assert sender.base == 2
+    assert sender.stats.rtt.samples == [pytest.approx(0.01)] * 2
+
+
+def test_send_window_skips_packets_acked_while_waiting(async_clock, make_sender):
+    sender = make_sender(selective=True, window=2, view=bytes(1024))
+    for seq in sender.due(async_clock.now):
+        sender.transmit(seq)
+    protocol = FlowProtocol()
+    transport = AckingTransport(protocol)
+    async_clock.now = sender.deadline()
+    # Oba pakiety czekaja na ponowienie, ale ACK 1 zdazyl przyjsc.
+    protocol.datagram_received(ack(1), None)
+
+    assert asyncio.run(Flow(transport, protocol, sender.stats, None).send_window(sender)) is None
+    assert transport.sent == [0]
+    assert sender.done
+
+
+def test_ack_for_packet_not_yet_sent_is_ignored(clock, make_sender):
+    sender = make_sender(selective=True, window=4, stale_acks=1)
+    assert sender.due(clock.now) == [0, 1, 2, 3]
+    # Spoznione ACK START przed wyslaniem DATA 0.
+    sender.on_ack(0, clock.now)
+    assert sender.base == 0 and not sender.acked
+    assert sender.outstanding(0)
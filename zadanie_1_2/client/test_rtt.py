@@ -0,0 +1,46 @@
+import pytest
+
+from client import RttEstimator
+
+
+def test_follows_rfc6298():
+    rtt = RttEstimator(rto_initial=1.0, rto_min=0.01, rto_max=4.0)
+    assert rtt.timeout(1) == 1.0
+    rtt.sample(0.1)
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.05)
+    assert rtt.rto == pytest.approx(0.3)
+    rtt.sample(0.2)
+    assert rtt.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert rtt.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+
+
+def test_backoff_doubles_up_to_rto_max():
+    rtt = RttEstimator(rto_initial=0.5, rto_min=0.01, rto_max=4.0)
+    assert [rtt.timeout(n) for n in (1, 2, 3, 4, 5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+
+def test_clamps_to_rto_min():
+    rtt = RttEstimator(rto_initial=1.0, rto_min=0.02, rto_max=4.0)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.02
+
+
+def test_karn_rule_skips_retransmitted_packets(clock, make_sender):
+    sender = make_sender(selective=True, window=2)
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    clock.now = sender.deadline()
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    assert sender.attempts == {0: 2, 1: 2}
+    sender.on_ack(0, clock.now + 0.05)
+    sender.on_ack(1, clock.now + 0.05)
+    assert sender.stats.rtt.count == 0
+    assert sender.stats.rtt.srtt is None
+
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    sender.on_ack(2, clock.now + 0.05)
+    sender.on_ack(2, clock.now + 0.5)
+    assert sender.stats.rtt.samples == [pytest.approx(0.05)]
@@ -0,0 +1,47 @@
+import struct
+
+from client import DATA_HEADER, SEQ_MOD, START_SIZE_EXTENDED, build_data_packet, build_start_packet
+
+
+class HugeView:
+    """Plik dluzszy niz 2^32 fragmentow bez alokowania pamieci."""
+
+    obj = None
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, s):
+        return b"\0" * len(range(*s.indices(self.size)))
+
+
+def test_data_packet_carries_seq_modulo_2_32():
+    header, chunk = build_data_packet(SEQ_MOD + 5, b"abc")
+    assert DATA_HEADER.unpack(header) == (b"D", 5, 3)
+    assert chunk == b"abc"
+
+
+def test_start_packet_extends_file_size_past_32_bits():
+    assert build_start_packet(1000, 100) == struct.pack("!cIH", b"S", 1000, 100)
+    size = 5 * 2 ** 32 + 7
+    assert build_start_packet(size, 1400) == struct.pack("!cIHQ", b"S", START_SIZE_EXTENDED, 1400, size)
+
+
+def test_acks_map_across_seq_wrap(clock, make_sender):
+    sender = make_sender(selective=True, window=4, view=HugeView(SEQ_MOD + 8), chunk_size=1)
+    sender.base = sender.next_seq = sender.released = SEQ_MOD - 2
+    seqs = sender.due(clock.now)
+    assert seqs == [SEQ_MOD - 2, SEQ_MOD - 1, SEQ_MOD, SEQ_MOD + 1]
+    wire = [DATA_HEADER.unpack(sender.transmit(seq)[0])[1] for seq in seqs]
+    assert wire == [SEQ_MOD - 2, SEQ_MOD - 1, 0, 1]
+
+    # ACK 0 po zawinieciu to fragment 2^32, a nie fragment 0 (ani START).
+    sender.on_ack(0, clock.now + 0.01)
+    assert sender.acked == {SEQ_MOD}
+    for wire_seq in (SEQ_MOD - 2, SEQ_MOD - 1, 1):
+        sender.on_ack(wire_seq, clock.now + 0.01)
+    assert sender.base == SEQ_MOD + 2
+    assert not sender.acked
@@ -0,0 +1,101 @@
+import hashlib
+
+import pytest
+
+from client import DATA_HEADER, parse_ack_packet
+
+
+def run_transfer(sender, clock, lost, duplicate_acks=False):
+    """Przesyla caly plik przez siec, ktora gubi pakiety DATA o numerach wyslan z `lost`."""
+    received = {}
+    sends = 0
+    while not sender.done:
+        acks = []
+        for seq in sender.due(clock.now):
+            header, chunk = sender.transmit(seq)
+            _, wire_seq, size = DATA_HEADER.unpack(header)
+            assert size == len(chunk)
+            sends += 1
+            if sends in lost:
+                continue
+            received[wire_seq] = bytes(chunk)
+            acks.append(wire_seq)
+            if duplicate_acks:
+                acks.append(wire_seq)
+        clock.now += 0.01
+        for wire_seq in acks:
+            sender.on_ack(wire_seq, clock.now)
+        if not acks:
+            clock.now = sender.deadline()
+    return received
+
+
+@pytest.mark.parametrize("selective", [False, True])
+@pytest.mark.parametrize("duplicate_acks", [False, True])
+def test_delivers_everything_under_loss(clock, make_sender, selective, duplicate_acks):
+    sender = make_sender(selective)
+    lost = {3, 4, 11, 12, 13, 25}
+    received = run_transfer(sender, clock, lost, duplicate_acks)
+
+    data = bytes(sender.view)
+    assert b"".join(received[i] for i in range(sender.count)) == data
+    assert sender.hasher.digest() == hashlib.sha256(data).digest()
+    assert not sender.sent_at and not sender.attempts
+    # ACK sa pojedyncze, wiec oba tryby ponawiaja tylko zgubione pakiety.
+    assert sender.stats.retransmissions == len(lost)
+
+
+def test_ignores_duplicate_and_out_of_window_acks(clock, make_sender):
+    sender = make_sender(selective=True, window=4)
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    clock.now += 0.05
+    sender.on_ack(1, clock.now)
+    sender.on_ack(1, clock.now)
+    sender.on_ack(7, clock.now)
+    assert sender.base == 0
+    assert sender.acked == {1}
+
+    sender.on_ack(0, clock.now)
+    assert sender.base == 2
+    assert sender.due(clock.now) == [4, 5]
+
+
+def test_go_back_n_has_one_timer(clock, make_sender):
+    sender = make_sender(selective=False, window=4)
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    sender.on_ack(2, clock.now + 0.01)
+    clock.now = sender.deadline()
+    assert sender.due(clock.now) == [0, 1, 3]
+
+
+def test_selective_repeat_resends_only_expired(clock, make_sender):
+    sender = make_sender(selective=True, window=4)
+    sender.transmit(0)
+    sender.next_seq = 1
+    clock.now += 0.3
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    clock.now = sender.sent_at[0] + sender.stats.rtt.timeout(1)
+    assert sender.due(clock.now) == [0]
+
+
+def test_late_start_ack_does_not_acknowledge_data_0(clock, make_sender):
+    sender = make_sender(selective=True, stale_acks=1)
+    for seq in sender.due(clock.now):
+        sender.transmit(seq)
+    # ACK powtorzonego START przychodzi zaraz po DATA 0, ktore zginelo.
+    sender.on_ack(0, clock.now + 0.001)
+    assert sender.base == 0 and 0 in sender.sent_at
+    clock.now = sender.deadline()
+    assert 0 in sender.due(clock.now)
+    sender.transmit(0)
+    sender.on_ack(0, clock.now + 1.0)
+    assert sender.base == 1
+
+
+def test_parse_ack_packet():
+    assert parse_ack_packet(b"A\x00\x00\x01\x00") == (b"A", 256)
+    with pytest.raises(ValueError):
+        parse_ack_packet(b"A\x00")
@@ -2,36 +2,148 @@
 #include <stdlib.h>
 #include <string.h>
 #include <stdint.h>
+#include <inttypes.h>
+#include <time.h>
 
 #include <unistd.h>
 #include <arpa/inet.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
 
+#include <openssl/evp.h>
 #include <openssl/sha.h>
 
 #define DEFAULT_PORT    9000
-#define FILE_SIZE       10000
-#define CHUNK_SIZE      100
-#define MAX_DGRAM_SIZE  2048
+/* Najwiekszy ladunek UDP po IPv4; rozmiar pakietu klient dobiera sondami (PROBE). */
+#define MAX_DGRAM_SIZE  65507
+#define DATA_HEADER     (1 + 4 + 2)
+#define MAX_CHUNK_SIZE  (MAX_DGRAM_SIZE - DATA_HEADER)
+#define RECV_BUFFER     (4 * 1024 * 1024)
+/* Ile fragmentow poza kolejnoscia przechowujemy (okno nadawcy nie moze byc
+   wieksze): MAX_WINDOW, ale nie wiecej niz MAX_WINDOW_BYTES danych. */
+#define MAX_WINDOW      1024
+#define MAX_WINDOW_BYTES (4 * 1024 * 1024)
+/* Rownolegle transfery - kazdy adres klienta (IP:port) ma wlasny kontekst. */
+#define MAX_FLOWS       64
+#define FLOW_IDLE_SECONDS 30
+/* Pole file_size w START ma 32 bity; ten znacznik oznacza, ze pelny
+   64-bitowy rozmiar jest dopisany za naglowkiem. */
+#define START_SIZE_EXTENDED 0xFFFFFFFFu
+#define PROGRESS_EVERY  1024
 
 #define MSG_START 'S'
 #define MSG_DATA  'D'
 #define MSG_ACK   'A'
 #define MSG_HASH  'H'
+#define MSG_PROBE 'P'
+
+#define DATA_DROPPED 0
+#define DATA_HELD    1
 
 typedef struct {
     int initialized;
-    uint8_t buffer[FILE_SIZE];
-    uint32_t file_size;
+    int complete;
+    uint64_t file_size;
     uint16_t chunk_size;
-    uint32_t expected_seq;
-    uint32_t received_bytes;
+    uint64_t chunk_count;
+    /* Numer pierwszego brakujacego fragmentu; wszystko przed nim jest juz
+       w skrocie. Pole seq na drucie to ten numer modulo 2^32. */
+    uint64_t expected_chunk;
+    uint64_t received_bytes;
+    EVP_MD_CTX *sha;
+    uint8_t hash[SHA256_DIGEST_LENGTH];
+    /* Okno nadawcy (Go-Back-N / selective repeat) moze dostarczyc pakiety
+       poza kolejnoscia - trzymamy je w buforze cyklicznym do czasu, az
+       luka przed nimi sie zapelni. Plik nie jest przechowywany w calosci,
+       wiec pamiec nie zalezy od jego rozmiaru. */
+    uint8_t held[MAX_WINDOW];
+    uint16_t held_len[MAX_WINDOW];
+    /* window_slots slotow po chunk_size bajtow, przydzielane przy START. */
+    uint8_t *window;
+    size_t window_size;
+    unsigned window_slots;
 } FileContext;
 
+typedef struct {
+    int in_use;
+    struct sockaddr_in peer;
+    time_t last_active;
+    FileContext ctx;
+} Flow;
+
 static void init_context(FileContext *ctx) {
+    EVP_MD_CTX *sha = ctx->sha;
+    uint8_t *window = ctx->window;
+    size_t window_size = ctx->window_size;
+
     memset(ctx, 0, sizeof(*ctx));
     ctx->initialized = 0;
+    ctx->sha = sha != NULL ? sha : EVP_MD_CTX_new();
+    ctx->window = window;
+    ctx->window_size = window_size;
+}
+
+static int same_peer(const struct sockaddr_in *a, const struct sockaddr_in *b) {
+    return a->sin_addr.s_addr == b->sin_addr.s_addr && a->sin_port == b->sin_port;
+}
+
+static Flow *find_flow(Flow *flows, const struct sockaddr_in *peer) {
+    int i;
+
+    for (i = 0; i < MAX_FLOWS; i++) {
+        if (flows[i].in_use && same_peer(&flows[i].peer, peer)) {
+            return &flows[i];
+        }
+    }
+    return NULL;
+}
+
+/* Kontekst dla nowego START: ten sam klient, wolne miejsce albo najdawniej
+   aktywny transfer zakonczony lub bezczynny dluzej niz FLOW_IDLE_SECONDS. */
+static Flow *claim_flow(Flow *flows, const struct sockaddr_in *peer, time_t now) {
+    Flow *victim = NULL;
+    Flow *flow;
+    int i;
+
+    flow = find_flow(flows, peer);
+    if (flow != NULL) {
+        return flow;
+    }
+    for (i = 0; i < MAX_FLOWS; i++) {
+        flow = &flows[i];
+        if (!flow->in_use) {
+            victim = flow;
+            break;
+        }
+        if ((flow->ctx.complete || now - flow->last_active > FLOW_IDLE_SECONDS) &&
+            (victim == NULL || flow->last_active < victim->last_active)) {
+            victim = flow;
+        }
+    }
+    if (victim != NULL) {
+        victim->in_use = 1;
+        victim->peer = *peer;
+        init_context(&victim->ctx);
+    }
+    return victim;
+}
+
+static void send_probe_reply(int sockfd,
+         struct sockaddr_in *cliaddr,
+         socklen_t cli_len,
+         uint32_t len) {
+    uint8_t buf[1 + 4];
+    uint32_t len_net;
+
+    /* Odpowiedz na sonde MTU: dlugosc datagramu, ktory doszedl. */
+    buf[0] = (uint8_t)MSG_PROBE;
+    len_net = htonl(len);
+    memcpy(buf + 1, &len_net, sizeof(len_net));
+
+    if (sendto(sockfd, buf, sizeof(buf), 0,
+               (struct sockaddr *)cliaddr, cli_len) < 0) {
+        perror("sendto (PROBE)");
+    }
 }
 
 static void send_ack(int sockfd,
@@ -39,7 +151,7 @@ static void send_ack(int sockfd,
          socklen_t cli_len,
          uint32_t seq) {
 
-    
+
     uint8_t buf[1 + 4];
     uint32_t seq_net;
 
@@ -56,13 +168,8 @@ static void send_ack(int sockfd,
 static void send_hash(int sockfd,
           struct sockaddr_in *cliaddr,
           socklen_t cli_len,
-          const uint8_t *data,
-          uint32_t len) {
-    uint8_t hash[SHA256_DIGEST_LENGTH];
+          const uint8_t *hash) {
     uint8_t buf[1 + SHA256_DIGEST_LENGTH];
-    int i;
-
-    SHA256(data, len, hash);
 
     buf[0] = (uint8_t)MSG_HASH;
     memcpy(buf + 1, hash, SHA256_DIGEST_LENGTH);
@@ -71,27 +178,38 @@ static void send_hash(int sockfd,
                (struct sockaddr *)cliaddr, cli_len) < 0) {
         perror("sendto (hash)");
     }
+}
+
+static void
+finish_file(FileContext *ctx)
+{
+    int i;
 
+    EVP_DigestFinal_ex(ctx->sha, ctx->hash, NULL);
+    ctx->complete = 1;
+
+    printf("Odebrano pełny plik %" PRIu64 " bajtow\n", ctx->file_size);
     printf("Server hash: ");
     for (i = 0; i < SHA256_DIGEST_LENGTH; i++) {
-        printf("%02x", hash[i]);
+        printf("%02x", ctx->hash[i]);
     }
     printf("\n");
 }
 
 
-static void
+/* 1, gdy START przyjety (kontekst gotowy na DATA), 0 gdy odrzucony. */
+static int
 handle_start(FileContext *ctx, const uint8_t *buf, ssize_t len)
 {
     uint32_t file_size_net;
     uint16_t chunk_size_net;
-    uint32_t file_size_host;
-    
+    uint64_t file_size_host;
+
     if (len < 1 + 4 + 2) {
         fprintf(stderr, "START: pakiet za krótki\n");
-        return;
+        return 0;
     }
-    
+
     uint16_t chunk_size_host;
 
     memcpy(&file_size_net, buf + 1, 4);
@@ -100,51 +218,81 @@ handle_start(FileContext *ctx, const uint8_t *buf, ssize_t len)
     file_size_host = ntohl(file_size_net);
     chunk_size_host = ntohs(chunk_size_net);
 
-    printf("Odebrano START: file_size=%u chunk_size=%u\n",
-           file_size_host, chunk_size_host);
+    if (file_size_host == START_SIZE_EXTENDED) {
+        uint32_t high_net, low_net;
 
-    if (file_size_host != FILE_SIZE) {
-        fprintf(stderr,
-                "START: oczekiwano file_size=%d, a dostano %u - ignoruję START\n",
-                FILE_SIZE, file_size_host);
-        return;
+        if (len < 1 + 4 + 2 + 8) {
+            fprintf(stderr, "START: brak 64-bitowego rozmiaru pliku\n");
+            return 0;
+        }
+        memcpy(&high_net, buf + 7, 4);
+        memcpy(&low_net, buf + 11, 4);
+        file_size_host = ((uint64_t)ntohl(high_net) << 32) | ntohl(low_net);
     }
-    if (chunk_size_host != CHUNK_SIZE) {
+
+    printf("Odebrano START: file_size=%" PRIu64 " chunk_size=%u\n",
+           file_size_host, chunk_size_host);
+
+    if (chunk_size_host == 0 || chunk_size_host > MAX_CHUNK_SIZE) {
         fprintf(stderr,
-                "START: oczekiwano chunk_size=%d, a dostano %u - ignoruję START\n",
-                CHUNK_SIZE, chunk_size_host);
-        return;
+                "START: chunk_size musi byc z zakresu 1..%d, a dostano %u - ignoruję START\n",
+                MAX_CHUNK_SIZE, chunk_size_host);
+        return 0;
     }
 
-    memset(ctx->buffer, 0, sizeof(ctx->buffer));
+    init_context(ctx);
+    ctx->window_slots = MAX_WINDOW_BYTES / chunk_size_host;
+    if (ctx->window_slots > MAX_WINDOW) {
+        ctx->window_slots = MAX_WINDOW;
+    }
+    if (ctx->window_size < (size_t)ctx->window_slots * chunk_size_host) {
+        free(ctx->window);
+        ctx->window_size = (size_t)ctx->window_slots * chunk_size_host;
+        ctx->window = malloc(ctx->window_size);
+        if (ctx->window == NULL) {
+            perror("malloc (okno)");
+            ctx->window_size = 0;
+            return 0;
+        }
+    }
+    EVP_DigestInit_ex(ctx->sha, EVP_sha256(), NULL);
     ctx->file_size = file_size_host;
     ctx->chunk_size = chunk_size_host;
+    ctx->chunk_count = (file_size_host + chunk_size_host - 1) / chunk_size_host;
 
-    ctx->expected_seq = 0;
+    ctx->expected_chunk = 0;
     ctx->received_bytes = 0;
     ctx->initialized = 1;
 
     printf("Kontekst zainicjalizowany, oczekuje na dane...\n");
+
+    if (ctx->chunk_count == 0) {
+        finish_file(ctx);
+    }
+    return 1;
 }
 
 
-static void
+static int
 handle_data(FileContext *ctx, const uint8_t *buf, ssize_t len)
 {
     uint32_t seq_net;
     uint16_t data_len_net;
     uint32_t seq;
     uint16_t data_len;
-    uint32_t offset;
+    int32_t ahead;
+    uint64_t chunk;
+    uint64_t expected_len;
+    unsigned slot;
 
     if (!ctx->initialized) {
         fprintf(stderr, "DATA: brak START\n");
-        return;
+        return DATA_DROPPED;
     }
 
     if (len < 1 + 4 + 2) {
         fprintf(stderr, "DATA: pakiet za krótki\n");
-        return;
+        return DATA_DROPPED;
     }
 
     memcpy(&seq_net, buf + 1, 4);
@@ -153,32 +301,69 @@ handle_data(FileContext *ctx, const uint8_t *buf, ssize_t len)
     seq = ntohl(seq_net);
     data_len = ntohs(data_len_net);
 
-    if ((size_t)(1 + 4 + 2 + data_len) > (size_t)len) {
+    if ((size_t)(DATA_HEADER + data_len) > (size_t)len) {
         fprintf(stderr, "DATA: niezgodnosc długosci data_len\n");
-        return;
+        return DATA_DROPPED;
     }
 
-    if (seq == ctx->expected_seq) {
-        offset = seq * ctx->chunk_size;
+    /* Numer fragmentu odtwarzamy wzgledem oczekiwanego (arytmetyka modulo 2^32). */
+    ahead = (int32_t)(seq - (uint32_t)ctx->expected_chunk);
+    if (ahead < 0 || ctx->complete) {
+        printf("DATA: dublikat seq=%u\n", seq);
+        return DATA_HELD;
+    }
+    if ((uint32_t)ahead >= ctx->window_slots) {
+        fprintf(stderr, "DATA: seq=%u poza oknem odbiorcy - odrzucony\n", seq);
+        return DATA_DROPPED;
+    }
 
-        if (offset + data_len > ctx->file_size) {
-            fprintf(stderr, "DATA: pakiet wykracza poza rozmiar pliku\n");
-            return;
-        }
+    chunk = ctx->expected_chunk + (uint64_t)ahead;
+    if (chunk >= ctx->chunk_count) {
+        fprintf(stderr, "DATA: pakiet wykracza poza rozmiar pliku\n");
+        return DATA_DROPPED;
+    }
+    expected_len = chunk + 1 < ctx->chunk_count
+        ? ctx->chunk_size
+        : ctx->file_size - chunk * ctx->chunk_size;
+    if (data_len != expected_len) {
+        fprintf(stderr, "DATA: seq=%u ma %u bajtow, oczekiwano %" PRIu64 "\n",
+                seq, data_len, expected_len);
+        return DATA_DROPPED;
+    }
 
-        memcpy(ctx->buffer + offset, buf + 7, data_len);
-        ctx->received_bytes += data_len;
-        ctx->expected_seq++;
+    slot = (unsigned)(chunk % ctx->window_slots);
+    if (ctx->held[slot]) {
+        printf("DATA: dublikat seq=%u\n", seq);
+        return DATA_HELD;
+    }
+    memcpy(ctx->window + (size_t)slot * ctx->chunk_size, buf + DATA_HEADER, data_len);
+    ctx->held[slot] = 1;
+    ctx->held_len[slot] = data_len;
 
-        printf("DATA: seq=%u, data_len=%u, received_bytes=%u\n",
-               seq, data_len, ctx->received_bytes);
-    } else if (seq < ctx->expected_seq) {
-        printf("DATA: dublikat seq=%u (expected=%u)\n",
-               seq, ctx->expected_seq);
-    } else {
-        fprintf(stderr, "DATA: nieoczekiwany seq=%u (expected=%u)\n",
-                seq, ctx->expected_seq);
+    if (ahead > 0) {
+        printf("DATA: seq=%u poza kolejnoscia (oczekiwano %u), zbuforowany\n",
+               seq, (uint32_t)ctx->expected_chunk);
+    }
+
+    /* Ciagly prefiks trafia do skrotu i zwalnia miejsce w oknie. */
+    slot = (unsigned)(ctx->expected_chunk % ctx->window_slots);
+    while (ctx->held[slot]) {
+        EVP_DigestUpdate(ctx->sha, ctx->window + (size_t)slot * ctx->chunk_size,
+                         ctx->held_len[slot]);
+        ctx->received_bytes += ctx->held_len[slot];
+        ctx->held[slot] = 0;
+        ctx->expected_chunk++;
+        if (ctx->expected_chunk % PROGRESS_EVERY == 0) {
+            printf("DATA: received_bytes=%" PRIu64 " / %" PRIu64 "\n",
+                   ctx->received_bytes, ctx->file_size);
+        }
+        slot = (unsigned)(ctx->expected_chunk % ctx->window_slots);
     }
+
+    if (ctx->expected_chunk == ctx->chunk_count) {
+        finish_file(ctx);
+    }
+    return DATA_HELD;
 }
 
 int
@@ -188,7 +373,8 @@ main(int argc, char **argv)
     int port;
     int sockfd;
     struct sockaddr_in servaddr;
-    FileContext ctx;
+    static Flow flows[MAX_FLOWS];
+    int rcvbuf = RECV_BUFFER;
 
     if (argc >= 2) {
         port = atoi(argv[1]);
@@ -202,6 +388,11 @@ main(int argc, char **argv)
         return 1;
     }
 
+    /* Przy duzych pakietach okno nadawcy nie miesci sie w domyslnym buforze. */
+    if (setsockopt(sockfd, SOL_SOCKET, SO_RCVBUF, &rcvbuf, sizeof(rcvbuf)) < 0) {
+        perror("setsockopt (SO_RCVBUF)");
+    }
+
     memset(&servaddr, 0, sizeof(servaddr));
     servaddr.sin_family = AF_INET;
     servaddr.sin_addr.s_addr = htonl(INADDR_ANY);
@@ -216,14 +407,14 @@ main(int argc, char **argv)
 
     printf("Serwer nasłuchuje na porcie UDP %d\n", port);
 
-    init_context(&ctx);
-
     for (;;) {
-        uint8_t buf[MAX_DGRAM_SIZE];
+        static uint8_t buf[MAX_DGRAM_SIZE];
         struct sockaddr_in cliaddr;
         socklen_t cli_len;
         ssize_t n;
         uint8_t type;
+        Flow *flow;
+        time_t now;
 
         cli_len = sizeof(cliaddr);
         n = recvfrom(sockfd, buf, sizeof(buf), 0,
@@ -237,10 +428,25 @@ main(int argc, char **argv)
         }
 
         type = buf[0];
+        now = time(NULL);
 
         if (type == (uint8_t)MSG_START) {
-            handle_start(&ctx, buf, n);
+            flow = claim_flow(flows, &cliaddr, now);
+            if (flow == NULL) {
+                /* Bez ACK klient ponowi START, gdy ktorys transfer sie skonczy. */
+                fprintf(stderr, "START: %d transferow w toku - ignoruję START\n", MAX_FLOWS);
+                continue;
+            }
+            printf("START od %s:%u\n", inet_ntoa(cliaddr.sin_addr), ntohs(cliaddr.sin_port));
+            flow->last_active = now;
+            /* Bez ACK klient nie zaczyna wysylac DATA, ktorych serwer nie przyjmie. */
+            if (!handle_start(&flow->ctx, buf, n)) {
+                continue;
+            }
             send_ack(sockfd, &cliaddr, cli_len, 0);
+            if (flow->ctx.complete) {
+                send_hash(sockfd, &cliaddr, cli_len, flow->ctx.hash);
+            }
         } else if (type == (uint8_t)MSG_DATA) {
             uint32_t seq_net, seq_host;
 
@@ -252,17 +458,26 @@ main(int argc, char **argv)
             memcpy(&seq_net, buf + 1, 4);
             seq_host = ntohl(seq_net);
 
-            handle_data(&ctx, buf, n);
+            flow = find_flow(flows, &cliaddr);
+            if (flow == NULL) {
+                fprintf(stderr, "DATA: brak START\n");
+                continue;
+            }
+            flow->last_active = now;
 
+            /* ACK potwierdza tylko fragment, ktory serwer ma (w skrocie lub w oknie). */
+            if (handle_data(&flow->ctx, buf, n) != DATA_HELD) {
+                continue;
+            }
             send_ack(sockfd, &cliaddr, cli_len, seq_host);
 
-            if (ctx.initialized && ctx.received_bytes == ctx.file_size) {
-                printf("Odebrano pełny plik %u bajtow\n", ctx.file_size);
-                send_hash(sockfd, &cliaddr, cli_len,
-                          ctx.buffer, ctx.file_size);
-
-                init_context(&ctx);
+            /* Po komplecie (i przy kazdym spoznionym dublikacie, gdyby hash
+               zaginal) klient dostaje hash. */
+            if (flow->ctx.complete) {
+                send_hash(sockfd, &cliaddr, cli_len, flow->ctx.hash);
             }
+        } else if (type == (uint8_t)MSG_PROBE) {
+            send_probe_reply(sockfd, &cliaddr, cli_len, (uint32_t)n);
         } else {
             fprintf(stderr, "Nieznany typ pakietu: %c\n", type);
         }